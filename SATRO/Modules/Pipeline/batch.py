@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import pandas as pd
+import Pipeline.planner as planner
+import Pipeline.retention as retention
+import Pipeline.fitsexport as fitsexport
+import Pipeline.rasterizer as rasterizer
+import Pipeline.util as util
+
+DEFAULT_PREFIX = "Parameterfiles/"
+# The options of a batch run, stored as attributes of the BatchModel under the same names:
+# processes: the number of iterations executed in parallel.
+# use_cache: serve iterations from the output cache if possible.
+# resume: skip iterations completed by an earlier, interrupted run into the output path.
+# scratch: the scratch directory for intermediate products, see workspace.get_scratch_dir.
+# retention: the retention policy of the output folders, see retention.POLICY_PATTERNS.
+# fits_compression: the compression mode of the FITS files, see fitsexport.COMPRESSION_MODES.
+# fits_quantize_level: the quantize level of lossy FITS compression.
+# fits_tile: the edge length of the FITS compression tiles in pixels, 0 to compress row by row.
+# sm_backend: the backend creating the sky-model image, see rasterizer.BACKENDS.
+# sources_catalog: a CSV or FITS source catalog added to the sources, see catalog.read_catalog.
+DEFAULT_OPTIONS = {"processes": 1,
+                   "use_cache": True,
+                   "resume": False,
+                   "scratch": "",
+                   "retention": retention.DEFAULT_POLICY,
+                   "fits_compression": fitsexport.DEFAULT_COMPRESSION,
+                   "fits_quantize_level": fitsexport.DEFAULT_QUANTIZE_LEVEL,
+                   "fits_tile": 0,
+                   "sm_backend": rasterizer.DEFAULT_BACKEND,
+                   "sources_catalog": ""}
+
+
+class BatchModel:
+    """
+    This class holds the same data as the input model of the GUI, read from a saved configuration and the parameter
+    files instead of Tk widgets, so the pipeline can run without a display.
+    """
+
+    def __init__(self, config, output_path, tasks, prefix=DEFAULT_PREFIX, options=None):
+        """
+        This method will be called when an object of this class is instantiated. It initializes variables from the
+        configuration. Fixed parameters missing in the configuration are taken from the parameter files.
+
+        :param config: The configuration as saved from the GUI.
+        :param output_path: The output path.
+        :param tasks: A dictionary with the CASA tasks simobserve, simanalyze, imhead and exportfits.
+        :param prefix: The directory of the parameter files.
+        :param options: A dictionary with options of DEFAULT_OPTIONS, the others keep their default.
+        """
+        self.simobserve = tasks.get("simobserve")
+        self.simanalyze = tasks.get("simanalyze")
+        self.imhead = tasks.get("imhead")
+        self.exportfits = tasks.get("exportfits")
+        self.mode = config["mode"]
+        self.sm = config["sm"]
+        self.telescope = config["telescope"]
+        self.telescope_diameters = dict(util.TELESCOPE_DIAMETERS)
+        self.antennalist = config["antennalist"]
+        self.var_param_set = config.get("var_param_set", "")
+        self.fixed_params_sim = merge_fixed_params(config.get("fixed_params_sim"),
+                                                   os.path.join(prefix, "fixed_sim_parameters.csv"))
+        self.fixed_params_sm = merge_fixed_params(config.get("fixed_params_sm"),
+                                                  os.path.join(prefix, "fixed_sm_parameters.csv"))
+        self.fixed_params_sp = config.get("fixed_params_sp")
+        if self.fixed_params_sp is None:
+            self.fixed_params_sp = read_default_sources(os.path.join(prefix, "fixed_sp_parameters.csv"))
+        self.number_of_sources = len(self.fixed_params_sp.columns) - 1
+
+        self.var_params_values_num = config.get("var_params_values_num",
+                                                pd.DataFrame(columns=["Name", "Min", "Max", "Steps", "Units"]))
+        self.sm_selected_shapes = get_selected_values(util.SHAPES, config.get("sm_shape_variables", []))
+        self.sp_selected_shapes = get_selected_values(util.SHAPES, config.get("sp_shape_variables", []))
+        self.selected_weightings = get_selected_values(util.WEIGHTINGS, config.get("weighting_variables", []))
+        self.var_param_values_lists = {}
+        if self.mode == "Multiple Runs":
+            self.var_param_values_lists = util.create_var_param_values_lists(self.var_params_values_num,
+                                                                             self.sm_selected_shapes,
+                                                                             self.sp_selected_shapes,
+                                                                             self.selected_weightings)
+        self.output_path = output_path
+        options = options or {}
+        unknown = sorted(set(options) - set(DEFAULT_OPTIONS))
+        if unknown:
+            raise ValueError("Unknown batch options: " + ", ".join(unknown))
+        for name, default in DEFAULT_OPTIONS.items():
+            setattr(self, name, options.get(name, default))
+
+
+def merge_fixed_params(df, csv_file):
+    """
+    Returns the fixed parameters of a configuration completed with the parameters from the csv-file that are missing
+    in it.
+
+    :param df: The fixed parameters of the configuration as pandas dataFrame or None.
+    :param csv_file: The csv-file with the default fixed parameters.
+    :return: df: The completed fixed parameters as pandas dataFrame.
+    """
+    defaults = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+    if df is None:
+        return defaults
+    missing = defaults[~defaults["Name"].isin(df["Name"])]
+    return pd.concat([df, missing], ignore_index=True)
+
+
+def read_default_sources(csv_file):
+    """
+    Returns the default sources from the csv-file in the layout of the source table of the GUI: one row per
+    parameter and one column per source.
+
+    :param csv_file: The csv-file with the default source parameters.
+    :return: df: The source parameters as pandas dataFrame.
+    """
+    defaults = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+    df = pd.DataFrame({"Parameter": list(defaults.columns)})
+    for i in range(len(defaults)):
+        df["Source" + str(i + 1)] = list(defaults.iloc[i])
+    return df
+
+
+def get_selected_values(options, variables):
+    """
+    Returns the options whose checkbox variable of a saved configuration is set.
+
+    :param options: The options in order of the checkboxes.
+    :param variables: The saved values of the checkbox variables.
+    :return: selected: The selected options.
+    """
+    return [option for option, variable in zip(options, variables) if variable == 1]
+
+
+def load_config(config_file):
+    """
+    Loads and returns a configuration saved from the GUI.
+
+    :param config_file: The pkl file of the configuration.
+    :return: config: The configuration as dictionary.
+    """
+    with open(config_file, 'rb') as input_file:
+        return pickle.load(input_file)
+
+
+def plan_batch(config_file, output_path, prefix=DEFAULT_PREFIX, options=None):
+    """
+    Returns the plan of the iterations a run of a saved configuration would execute. No CASA task is needed.
+
+    :param config_file: The pkl file of the configuration.
+    :param output_path: The output path. It is searched for cached outputs if it exists.
+    :param prefix: The directory of the parameter files.
+    :param options: A dictionary with options of DEFAULT_OPTIONS, see BatchModel.
+    :return: plan: The plan as JSON compatible dictionary, see planner.SweepPlan.to_dict.
+    """
+    model = BatchModel(load_config(config_file), output_path, {}, prefix, options)
+    return planner.create_plan(model).to_dict()
+
+
+def run_batch(config_file, output_path, tasks, prefix=DEFAULT_PREFIX, options=None):
+    """
+    Runs the pipeline for a saved configuration and returns a summary of the iterations.
+
+    :param config_file: The pkl file of the configuration.
+    :param output_path: The output path. It is created if it does not exist.
+    :param tasks: A dictionary with the CASA tasks simobserve, simanalyze, imhead and exportfits.
+    :param prefix: The directory of the parameter files.
+    :param options: A dictionary with options of DEFAULT_OPTIONS, see BatchModel.
+    :return: summary: The summary as JSON compatible dictionary.
+    """
+    from Pipeline import pipeline
+
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+    model = BatchModel(load_config(config_file), output_path, tasks, prefix, options)
+    results = pipeline.run(model, plan=planner.create_plan(model))
+    return {"config": config_file,
+            "mode": model.mode,
+            "output_path": os.path.abspath(output_path),
+            "iterations": results,
+            "resumed": len([result for result in results if result.get("resumed")]),
+            "pruned_bytes": sum(result.get("pruned_bytes") or 0 for result in results),
+            "failed": len([result for result in results if "error" in result])}
+
+
+def get_script_args(argv, script):
+    """
+    Returns the arguments following the given script in the command line. CASA passes its own arguments in front of
+    the script when started with casa -c.
+
+    :param argv: The command line arguments.
+    :param script: The file name of the script.
+    :return: args: The arguments of the script.
+    """
+    for i, arg in enumerate(argv):
+        if os.path.basename(arg) == script:
+            return argv[i + 1:]
+    return argv[1:]
+
+
+def main(args, tasks):
+    """
+    Command line entry point of the batch runner. Writes the summary as JSON to stdout or the given file. With
+    --plan, the plan of the iterations is written instead and nothing is run.
+
+    :param args: The command line arguments of the script.
+    :param tasks: A dictionary with the CASA tasks simobserve, simanalyze, imhead and exportfits.
+    :return: status: The exit status, 1 if an iteration failed or, with --plan, if output folders collide else 0.
+    """
+    parser = argparse.ArgumentParser(prog="batch_starter.py",
+                                     description="Runs SATRO simulations from a saved configuration without GUI.")
+    parser.add_argument("config", help="configuration file saved from the GUI, e.g. Configurations/default_config.pkl")
+    parser.add_argument("output_path", help="directory the output folders are written to")
+    parser.add_argument("--processes", type=int, default=1, help="number of iterations executed in parallel")
+    parser.add_argument("--no-cache", action="store_true", help="recompute iterations that were already run")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip iterations completed by an interrupted run into the output path and retry the rest")
+    parser.add_argument("--scratch", default="",
+                        help="directory on fast local storage for intermediate products, defaults to $SATRO_SCRATCH")
+    parser.add_argument("--retention", choices=[name for name, description in retention.POLICIES],
+                        default=retention.DEFAULT_POLICY,
+                        help="what to keep of each output folder: everything, the FITS files with sources and logs, "
+                             "or additionally the measurement set")
+    parser.add_argument("--fits-compression", choices=[name for name, description in fitsexport.COMPRESSION_MODES],
+                        default=fitsexport.DEFAULT_COMPRESSION, help="tile compression of the exported FITS files")
+    parser.add_argument("--fits-quantize-level", type=float, default=fitsexport.DEFAULT_QUANTIZE_LEVEL,
+                        help="quantize level of lossy FITS compression, higher values keep more precision")
+    parser.add_argument("--fits-tile", type=int, default=0,
+                        help="edge length of square FITS compression tiles in pixels, 0 compresses row by row")
+    parser.add_argument("--sm-backend", choices=[name for name, description in rasterizer.BACKENDS],
+                        default=rasterizer.DEFAULT_BACKEND,
+                        help="create the sky-model image with the CASA tools or the NumPy rasterizer")
+    parser.add_argument("--catalog", default="",
+                        help="CSV or FITS table of additional sources with columns ra, dec and flux; sources outside "
+                             "the observed field are dropped")
+    parser.add_argument("--parameterfiles", default=DEFAULT_PREFIX, help="directory of the parameter files")
+    parser.add_argument("--summary", help="write the summary to this file instead of stdout")
+    parser.add_argument("--plan", action="store_true",
+                        help="write the planned iterations with estimated cost instead of running them")
+    options = parser.parse_args(args)
+
+    batch_options = {"processes": options.processes,
+                     "use_cache": not options.no_cache,
+                     "resume": options.resume,
+                     "scratch": options.scratch,
+                     "retention": options.retention,
+                     "fits_compression": options.fits_compression,
+                     "fits_quantize_level": options.fits_quantize_level,
+                     "fits_tile": options.fits_tile,
+                     "sm_backend": options.sm_backend,
+                     "sources_catalog": options.catalog}
+    if options.plan:
+        summary = plan_batch(options.config, options.output_path, options.parameterfiles, batch_options)
+        status = 1 if summary["totals"]["collisions"] else 0
+    else:
+        summary = run_batch(options.config, options.output_path, tasks, options.parameterfiles, batch_options)
+        status = 1 if summary["failed"] else 0
+    if options.summary:
+        with open(options.summary, 'w') as output:
+            json.dump(summary, output, indent=2, sort_keys=True)
+    else:
+        json.dump(summary, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    return status
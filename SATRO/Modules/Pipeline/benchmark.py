@@ -0,0 +1,388 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+import Pipeline.casabackend as casabackend
+import Pipeline.catalog as catalog
+import Pipeline.fitsexport as fitsexport
+import Pipeline.rasterizer as rasterizer
+import Pipeline.util as util
+
+# Sky-model sizes the nearest pixel lookup of the haslam interpolation is timed for.
+NEAREST_SIZES = [100, 500, 1000, 2000]
+# Edge length of the haslam map window searched for each sky-model pixel, see haslam.get_haslam_flux.
+NEAREST_WINDOW = 200
+# Number of sky-model pixels the per-pixel search is timed for. Its time for the whole sky-model is extrapolated.
+NEAREST_LOOP_SAMPLES = 1000
+# Edge length of the synthetic image the FITS compression modes are measured on.
+FITS_SIZE = 2048
+# Number of point sources of the synthetic image, on top of Gaussian noise with a standard deviation of 1.
+FITS_SOURCES = 30
+# The compression modes and tile sizes the FITS files are measured for, see fitsexport.finalize_fits_file.
+FITS_MODES = [("none", 0), ("lossless", 0), ("lossless", 256), ("lossy", 0), ("lossy", 256)]
+# The sky-model parameters the rasterizer is compared with the CASA backend for, see parameters.get_params_skymodel.
+RASTERIZER_PARAMETERS = {"sm_flux": 1.0, "sm_fluxunit": "Jy", "sm_polarization": "Stokes", "sm_direction_ra": 10.0,
+                         "sm_direction_dec": -30.0, "sm_shape": "Gaussian", "sm_majoraxis": "0.5arcmin",
+                         "sm_minoraxis": "0.5arcmin", "sm_positionangle": "0deg", "sm_frequency": "1.4GHz",
+                         "sm_index": 0.0, "sm_spectrumtype": "constant", "sm_label": "",
+                         "component_frequency": "1.4GHz", "frequency_increment": "1MHz", "sm_cellsize": "1arcmin",
+                         "sm_size": 64}
+# The components compared with the CASA backend as (name, changed parameters, checked). The CASA image analysis tool
+# samples the profile at the pixel centres and paints limb-darkened disks as points, see
+# rasterizer.rasterize_component, so components near the cell size and limb-darkened disks are only reported.
+RASTERIZER_CASES = [("point", {"sm_shape": "point"}, True),
+                    ("Gaussian 0.5' on 0.05' cells", {"sm_cellsize": "0.05arcmin"}, True),
+                    ("Gaussian 20'x8' at 30deg", {"sm_majoraxis": "20arcmin", "sm_minoraxis": "8arcmin",
+                                                  "sm_positionangle": "30deg"}, True),
+                    ("disk 20'x8' at 30deg", {"sm_shape": "disk", "sm_majoraxis": "20arcmin",
+                                              "sm_minoraxis": "8arcmin", "sm_positionangle": "30deg"}, True),
+                    ("Gaussian 0.5' on 1' cells", {}, False),
+                    ("disk 0.5' on 1' cells", {"sm_shape": "disk"}, False),
+                    ("disk 0.5' on 0.05' cells", {"sm_shape": "disk", "sm_cellsize": "0.05arcmin"}, False),
+                    ("limbdarkeneddisk 20'x8'", {"sm_shape": "limbdarkeneddisk", "sm_majoraxis": "20arcmin",
+                                                 "sm_minoraxis": "8arcmin"}, False)]
+# Largest relative error of the checked components, relative to the peak, and of their total flux.
+RASTERIZER_TOLERANCE = 0.01
+# Numbers of sources of the random catalogs the catalog ingestion is timed for.
+CATALOG_SIZES = [10000, 100000]
+# Pointing the random catalogs are drawn around, within CATALOG_EXTENT degrees in both directions, and radius the
+# sources are culled to, both in degrees, see catalog.get_field_radius.
+CATALOG_CENTER = (10.0, -30.0)
+CATALOG_EXTENT = 10.0
+CATALOG_RADIUS = 1.64
+# Sky-model sizes and components the creation of the sky-model image is timed for, on cells of 0.5'.
+RASTERIZER_SIZES = [256, 1000, 2048, 4096]
+RASTERIZER_TIMED = [("Gaussian 2'", {"sm_majoraxis": "2arcmin", "sm_minoraxis": "2arcmin"}),
+                    ("disk 20'x8'", {"sm_shape": "disk", "sm_majoraxis": "20arcmin", "sm_minoraxis": "8arcmin"}),
+                    ("Gaussian 60'x40'", {"sm_majoraxis": "60arcmin", "sm_minoraxis": "40arcmin"})]
+
+
+def _time_best(function, repeat):
+    """Returns the result of a function and the shortest of repeat execution times in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def find_nearest_per_pixel(y_array, x_array, y_points, x_points):
+    """
+    Returns the indices of the nearest map pixel of every (y_points[i], x_points[j]) pair with one search per pair,
+    see util.find_index_of_nearest_xy. The reference of util.find_indices_of_nearest_grid.
+    """
+    idy = np.empty((len(y_points), len(x_points)), dtype=np.intp)
+    idx = np.empty((len(y_points), len(x_points)), dtype=np.intp)
+    for i, y_point in enumerate(y_points):
+        for j, x_point in enumerate(x_points):
+            idy[i, j], idx[i, j] = util.find_index_of_nearest_xy(y_array, x_array, y_point, x_point)[:2]
+    return idy, idx
+
+
+def create_nearest_cases(random):
+    """
+    Returns small maps and grids on which util.find_indices_of_nearest_grid must agree with the per-pixel search:
+    a curvilinear map like a window of the haslam map, a regular map with grid points halfway between the pixels, so
+    up to four pixels are equally near, and a map whose rows collapse onto the same coordinates, like the haslam map
+    at the poles, so many pixels are equally near.
+
+    :param random: The numpy.random.RandomState the maps are drawn from.
+    :return: cases: A list of (name, y_array, x_array, y_points, x_points) tuples.
+    """
+    rows, columns = np.meshgrid(np.arange(40, dtype=np.float64), np.arange(50, dtype=np.float64), indexing='ij')
+    curvilinear_y = 0.01 * (rows + 0.2 * columns + 0.05 * rows * columns / 40) + 1e-4 * random.randn(40, 50)
+    curvilinear_x = 0.01 * (columns - 0.3 * rows) + 1e-4 * random.randn(40, 50)
+    degenerate_y = rows.copy()
+    degenerate_x = columns.copy()
+    degenerate_x[:5] = 0.0
+    degenerate_y[:5] = 0.0
+    return [("curvilinear", curvilinear_y, curvilinear_x,
+             random.uniform(curvilinear_y.min(), curvilinear_y.max(), 60),
+             random.uniform(curvilinear_x.min(), curvilinear_x.max(), 60)),
+            ("ties", rows, columns, np.arange(-1, 41, 0.5), np.arange(-1, 51, 0.5)),
+            ("degenerate", degenerate_y, degenerate_x, np.arange(-2, 10, 0.25), np.arange(-2, 10, 0.25))]
+
+
+def check_nearest_grid(sizes=NEAREST_SIZES, seed=0):
+    """
+    Checks that util.find_indices_of_nearest_grid finds the same haslam pixels as one util.find_index_of_nearest_xy
+    search per sky-model pixel, with and without the k-d tree, and times both for sky-models of the given sizes on a
+    haslam map window of NEAREST_WINDOW pixels. The per-pixel search is timed for NEAREST_LOOP_SAMPLES pixels and
+    extrapolated to the whole sky-model.
+
+    :param sizes: The sky-model sizes in pixels.
+    :param seed: The seed of the random maps.
+    :return: report: A dictionary with the keys "passed", "parity" (one dictionary per case and search) and
+                     "timings" (one dictionary per size, in seconds).
+    """
+    random = np.random.RandomState(seed)
+    try:
+        import scipy.spatial
+    except ImportError:
+        scipy = None
+    # The k-d tree search is only checked if scipy is available, see util.find_indices_of_nearest_grid.
+    searches = [False, True] if scipy is not None else [False]
+    parity = []
+    for name, y_array, x_array, y_points, x_points in create_nearest_cases(random):
+        expected = find_nearest_per_pixel(y_array, x_array, y_points, x_points)
+        for use_kdtree in searches:
+            idy, idx = util.find_indices_of_nearest_grid(y_array, x_array, y_points, x_points, use_kdtree=use_kdtree)
+            parity.append({"case": name,
+                           "kdtree": use_kdtree,
+                           "pixels": int(idy.size),
+                           "identical": bool(np.array_equal(idy, expected[0]) and np.array_equal(idx, expected[1]))})
+
+    rows, columns = np.meshgrid(np.arange(NEAREST_WINDOW), np.arange(NEAREST_WINDOW), indexing='ij')
+    window_y = np.radians(-30 + 0.1 * rows + 0.01 * np.sin(columns / 20.0))
+    window_x = np.radians(10 + 0.1 * columns / np.cos(np.radians(-30 + 0.1 * rows)))
+    timings = []
+    for size in sizes:
+        y_points = np.linspace(window_y.min(), window_y.max(), size)
+        x_points = np.linspace(window_x.min(), window_x.max(), size)
+        batched = _time_best(lambda: util.find_indices_of_nearest_grid(window_y, window_x, y_points, x_points), 3)[1]
+        samples = random.randint(0, size, (NEAREST_LOOP_SAMPLES, 2))
+        start = timeit.default_timer()
+        for i, j in samples:
+            util.find_index_of_nearest_xy(window_y, window_x, y_points[i], x_points[j])
+        per_pixel = (timeit.default_timer() - start) / NEAREST_LOOP_SAMPLES
+        timings.append({"sm_size": size,
+                        "batched": batched,
+                        "per_pixel_extrapolated": per_pixel * size * size})
+    return {"passed": all(case["identical"] for case in parity), "parity": parity, "timings": timings}
+
+
+def create_fits_image(size, sources, random):
+    """
+    Returns a float32 image like an exported CASA image: Gaussian noise with a standard deviation of 1 and point
+    sources of 10 to 1000 times the noise, convolved with a Gaussian beam of 3 pixels.
+
+    :param size: The edge length of the image in pixels.
+    :param sources: The number of sources.
+    :param random: The numpy.random.RandomState the image is drawn from.
+    :return: image: The image with the shape (1, 1, size, size) of the exported images.
+    """
+    image = random.normal(0.0, 1.0, (size, size))
+    rows, columns = np.ogrid[-10:11, -10:11]
+    beam = np.exp(-(rows ** 2 + columns ** 2) / (2 * 3.0 ** 2))
+    for y, x, flux in zip(random.randint(10, size - 10, sources), random.randint(10, size - 10, sources),
+                          10 ** random.uniform(1, 3, sources)):
+        image[y - 10:y + 11, x - 10:x + 11] += flux * beam
+    return image.astype(np.float32).reshape(1, 1, size, size)
+
+
+def check_fits_export(size=FITS_SIZE, sources=FITS_SOURCES, seed=0):
+    """
+    Finalizes a synthetic image with every compression mode and tile size of FITS_MODES, like the fits_files stage
+    does with the exported images, and measures the file size relative to the uncompressed file, the time to load the
+    image like the analysis tools do and the largest error relative to the noise. Lossless files must be exact and
+    lossy files must deviate by no more than one quantization step, the noise divided by the quantize level.
+
+    :param size: The edge length of the image in pixels.
+    :param sources: The number of point sources.
+    :param seed: The seed of the random image.
+    :return: report: A dictionary with the keys "passed" and "modes" (one dictionary per mode and tile size, times
+                     in seconds).
+    """
+    # the image is loaded by the analysis tools, which are not part of the pipeline
+    from UserInterface.UITools.util import get_image_hdu
+
+    image = create_fits_image(size, sources, np.random.RandomState(seed))
+    directory = tempfile.mkdtemp(prefix="satro-benchmark-")
+    try:
+        exported = os.path.join(directory, "exported.fits")
+        fits.PrimaryHDU(image).writeto(exported)
+        modes = []
+        for compression, tile in FITS_MODES:
+            path = os.path.join(directory, compression + "-" + str(tile) + ".fits")
+            shutil.copy(exported, path)
+            start = timeit.default_timer()
+            fitsexport.finalize_fits_file(path, "radio_image", {"benchmark": "fits"}, compression, tile=tile)
+            finalize = timeit.default_timer() - start
+
+            def load():
+                with fits.open(path) as hdul:
+                    return np.array(get_image_hdu(hdul).data)
+            loaded, load_time = _time_best(load, 5)
+            max_error = float(np.abs(loaded.astype(np.float64) - image).max())
+            if compression == "lossy":
+                passed = max_error <= 1.0 / fitsexport.DEFAULT_QUANTIZE_LEVEL
+            else:
+                passed = max_error == 0.0
+            modes.append({"compression": compression,
+                          "tile": tile,
+                          "size_ratio": os.path.getsize(path) / float(os.path.getsize(exported)),
+                          "finalize": finalize,
+                          "load": load_time,
+                          "max_error_sigma": max_error,
+                          "passed": passed})
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"passed": all(mode["passed"] for mode in modes), "modes": modes}
+
+
+def check_rasterizer(exportfits, sizes=RASTERIZER_SIZES):
+    """
+    Compares the sky-model images of the NumPy rasterizer with those of the CASA backend for the components of
+    RASTERIZER_CASES, and times the creation of the sky-model image with both backends for sky-models of the given
+    sizes. Both backends run in a temporary working directory, as in the pipeline. The checked components must agree
+    within RASTERIZER_TOLERANCE and all headers must agree.
+
+    :param exportfits: The CASA task exportfits.
+    :param sizes: The sky-model sizes in pixels.
+    :return: report: A dictionary with the keys "passed", "parity" (one dictionary per component, see
+                     rasterizer.compare_with_fits) and "timings" (one dictionary per size and component, in seconds).
+    """
+    base_dir = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="satro-benchmark-")
+    os.chdir(directory)
+    try:
+        os.mkdir("Skymodel")
+        parity = []
+        for name, changes, checked in RASTERIZER_CASES:
+            parameters_skymodel = dict(RASTERIZER_PARAMETERS, **changes)
+            casabackend.create_skymodel_image(exportfits, parameters_skymodel)
+            comparison = rasterizer.compare_with_fits(parameters_skymodel, 'Skymodel/skymodel.fits')
+            comparison.update({"component": name, "checked": checked})
+            comparison["passed"] = not comparison["header_mismatches"] and \
+                (not checked or (comparison["max_rel_error"] <= RASTERIZER_TOLERANCE and
+                                 abs(comparison["flux_ratio"] - 1) <= RASTERIZER_TOLERANCE))
+            parity.append(comparison)
+
+        timings = []
+        for size in sizes:
+            for name, changes in RASTERIZER_TIMED:
+                parameters_skymodel = dict(RASTERIZER_PARAMETERS, sm_size=size, sm_cellsize="0.5arcmin", **changes)
+                start = timeit.default_timer()
+                casabackend.create_skymodel_image(exportfits, parameters_skymodel)
+                casa_time = timeit.default_timer() - start
+                numpy_time = _time_best(lambda: rasterizer.write_skymodel(parameters_skymodel,
+                                                                          'Skymodel/skymodel.fits'), 3)[1]
+                timings.append({"sm_size": size, "component": name, "casa": casa_time, "numpy": numpy_time})
+    finally:
+        os.chdir(base_dir)
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"passed": all(comparison["passed"] for comparison in parity), "parity": parity, "timings": timings}
+
+
+def create_catalog(size, random):
+    """
+    Returns a random point source catalog around CATALOG_CENTER with the required columns and names.
+
+    :param size: The number of sources.
+    :param random: The numpy.random.RandomState the catalog is drawn from.
+    :return: catalog: A pandas.DataFrame with the columns "name", "ra", "dec" and "flux".
+    """
+    return pd.DataFrame({"name": ["source_" + str(i) for i in range(size)],
+                         "ra": CATALOG_CENTER[0] + random.uniform(-CATALOG_EXTENT, CATALOG_EXTENT, size),
+                         "dec": CATALOG_CENTER[1] + random.uniform(-CATALOG_EXTENT, CATALOG_EXTENT, size),
+                         "flux": 10 ** random.uniform(-3, 0, size)},
+                        columns=["name", "ra", "dec", "flux"])
+
+
+def check_catalog(sizes=CATALOG_SIZES, seed=0):
+    """
+    Writes random catalogs of the given sizes as CSV and FITS table and times reading and culling them to
+    CATALOG_RADIUS around CATALOG_CENTER, as catalog.load_catalog_sources does, and formatting the directions of all
+    sources with catalog.get_directions and with the per-source helpers of util. The same sources of both formats must
+    be culled and the directions must equal those of the per-source helpers, also for declinations between -1 and
+    0 degrees. Inside a CASA session the creation of the component list of the culled sources is timed as well.
+
+    :param sizes: The numbers of sources.
+    :param seed: The seed of the random catalogs.
+    :return: report: A dictionary with the keys "passed" and "catalogs" (one dictionary per size, in seconds).
+    """
+    random = np.random.RandomState(seed)
+    try:
+        casabackend.get_tool("cltool")
+        casa = True
+    except ImportError:
+        casa = False
+    directory = tempfile.mkdtemp(prefix="satro-benchmark-")
+    try:
+        catalogs = []
+        for size in sizes:
+            sources = create_catalog(size, random)
+            sources.loc[:size // 100, "dec"] = random.uniform(-1, 0, size // 100 + 1)
+            csv_file = os.path.join(directory, "catalog.csv")
+            fits_file = os.path.join(directory, "catalog.fits")
+            sources.to_csv(csv_file, index=False)
+            fits.BinTableHDU.from_columns([fits.Column(name="name", format="20A", array=sources["name"].values),
+                                           fits.Column(name="ra", format="D", array=sources["ra"].values),
+                                           fits.Column(name="dec", format="D", array=sources["dec"].values),
+                                           fits.Column(name="flux", format="D", array=sources["flux"].values)]
+                                          ).writeto(fits_file, overwrite=True)
+            report = {"sources": size}
+            culled = {}
+            for name, catalog_file in [("csv", csv_file), ("fits", fits_file)]:
+                culled[name], report["load_cull_" + name] = _time_best(
+                    lambda: catalog.cull_sources(catalog.read_catalog(catalog_file, "1.4GHz"), CATALOG_CENTER[0],
+                                                 CATALOG_CENTER[1], CATALOG_RADIUS), 3)
+            report["culled"] = len(culled["csv"])
+            # the CSV parser of pandas may round the last digit differently, so the sources are compared by name
+            report["culled_equal"] = culled["csv"]["name"].tolist() == culled["fits"]["name"].tolist()
+
+            directions, report["directions"] = _time_best(
+                lambda: catalog.get_directions(sources["ra"].values, sources["dec"].values), 3)
+            start = timeit.default_timer()
+            expected = [util.concat_ra_dec(util.convert_deg_to_hour(ra), util.convert_deg_to_dms(dec))
+                        for ra, dec in zip(sources["ra"].values.tolist(), sources["dec"].values.tolist())]
+            report["directions_per_source"] = timeit.default_timer() - start
+            report["directions_equal"] = directions.tolist() == expected
+
+            if casa:
+                start = timeit.default_timer()
+                casabackend.create_component_list(culled["csv"], catalog.get_directions(
+                    culled["csv"]["ra"].values, culled["csv"]["dec"].values), os.path.join(directory, "catalog.cl"))
+                report["component_list"] = timeit.default_timer() - start
+            catalogs.append(report)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"passed": all(report["culled_equal"] and report["directions_equal"] for report in catalogs),
+            "catalogs": catalogs}
+
+
+# The checks of the command line, with the CASA tasks they need.
+CHECKS = [("nearest", check_nearest_grid, []),
+          ("fits", check_fits_export, []),
+          ("rasterizer", check_rasterizer, ["exportfits"]),
+          ("catalog", check_catalog, [])]
+
+
+def main(args, tasks):
+    """
+    Command line entry point of the benchmarks. Runs a check and writes its report as JSON to stdout or the given
+    file.
+
+    :param args: The command line arguments of the script.
+    :param tasks: A dictionary with the CASA tasks, only needed by checks against CASA.
+    :return: status: The exit status, 1 if the check failed else 0.
+    """
+    parser = argparse.ArgumentParser(prog="benchmark_starter.py",
+                                     description="Checks the optimized pipeline steps against their reference "
+                                                 "implementation and times both.")
+    parser.add_argument("check", choices=[name for name, function, needed_tasks in CHECKS], help="the check to run")
+    parser.add_argument("--output", help="write the report to this file instead of stdout")
+    options = parser.parse_args(args)
+
+    name, function, needed_tasks = next(check for check in CHECKS if check[0] == options.check)
+    missing = [task for task in needed_tasks if tasks.get(task) is None]
+    if missing:
+        sys.stderr.write("The check " + name + " needs the CASA tasks " + ", ".join(missing) +
+                         ", run it with casa -c benchmark_starter.py.\n")
+        return 1
+    report = function(*[tasks[task] for task in needed_tasks])
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    return 0 if report["passed"] else 1
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import shutil
+import Pipeline.fitsexport as fitsexport
+import Pipeline.publish as publish
+
+CACHE_VERSION = 1
+MANIFEST_FILE = "parameters.json"
+# Statistics of the FITS files of an output folder stored by the analysis tools. Written after the output has been
+# published, so it is not part of the verified output.
+METRICS_FILE = "analysis_metrics.json"
+# Suffix of the directories next to FITS files in which the analysis tools cache the image pyramids.
+PYRAMID_SUFFIX = ".pyramid"
+# Settings that only influence where, how fast or under which name an output is produced, not its content.
+# The source catalog is fingerprinted by its contents instead of its path.
+IGNORED_SETTINGS = ["mode", "var_param_set", "output_path", "processes", "cache", "resume", "scratch",
+                    "sources_catalog"]
+
+
+def find_antenna_file(antennalist, search_dirs=None):
+    """
+    Returns the path of the antenna configuration file or None if it can not be found. The file is searched in the
+    current directory, the Antennalists directory and the antenna configurations of the CASA data repository.
+
+    :param antennalist: The name of the selected antenna configuration.
+    :param search_dirs: Directories to search, defaults to the directories mentioned above.
+    :return: path: The path of the antenna configuration file or None.
+    """
+    if search_dirs is None:
+        search_dirs = [os.getcwd(), "Antennalists"]
+        if "CASAPATH" in os.environ:
+            search_dirs.append(os.path.join(os.environ["CASAPATH"].split()[0], "data", "alma", "simmos"))
+    for directory in search_dirs:
+        path = os.path.join(directory, antennalist)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _to_json(value):
+    """Converts numpy scalars and arrays for canonical JSON encoding."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(repr(value) + " is not JSON serializable")
+
+
+def hash_parameters(parameters):
+    """
+    Returns a hash of the given parameters. The parameters are encoded as canonical JSON, so equal parameters result
+    in equal hashes independent of dictionary ordering.
+
+    :param parameters: The parameters, nested dictionaries and lists of JSON compatible values.
+    :return: hash: The hash as hexadecimal string.
+    """
+    encoded = json.dumps(parameters, sort_keys=True, separators=(",", ":"), default=_to_json)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def hash_antenna_file(antennalist):
+    """
+    Returns the SHA-1 of the contents of the antenna configuration file or None if it can not be found.
+
+    :param antennalist: The name of the selected antenna configuration.
+    :return: sha1: The hash as hexadecimal string or None.
+    """
+    antenna_file = find_antenna_file(antennalist)
+    if antenna_file is None:
+        return None
+    return hash_file(antenna_file)
+
+
+def hash_file(path):
+    """
+    Returns the SHA-1 of the contents of a file or None if no path is given.
+
+    :param path: The file.
+    :return: sha1: The hash as hexadecimal string or None.
+    """
+    if not path:
+        return None
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def create_fingerprint(parameters_settings, parameters_skymodel, parameters_sources, parameters_simobserve,
+                       parameters_simanalyze, hash_files=True):
+    """
+    Creates and returns the fingerprint of an iteration out of the complete effective parameter set and the contents
+    of the antenna configuration file and the source catalog. Iterations with equal fingerprints produce equal
+    outputs.
+
+    :param parameters_settings: Parameter set containing settings parameters.
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :param parameters_sources: Parameter set containing source parameters.
+    :param parameters_simobserve: Parameter set containing simobserve parameters.
+    :param parameters_simanalyze: Parameter set containing simanalyze parameters.
+    :param hash_files: Include the contents of the antenna configuration file and the source catalog. Without them,
+                       the fingerprint only tells apart the iterations of the same run, which share these files.
+    :return: fingerprint: The fingerprint as hexadecimal string.
+    """
+    settings = dict((key, value) for key, value in parameters_settings.items() if key not in IGNORED_SETTINGS)
+    antenna_sha1 = hash_antenna_file(parameters_settings["antennalist"]) if hash_files else None
+    if antenna_sha1 is not None:
+        settings["antennalist_sha1"] = antenna_sha1
+    if hash_files and parameters_settings.get("sources_catalog"):
+        settings["sources_catalog_sha1"] = hash_file(parameters_settings["sources_catalog"])
+    return hash_parameters({"version": CACHE_VERSION,
+                            "settings": settings,
+                            "skymodel": parameters_skymodel,
+                            "sources": parameters_sources,
+                            "simobserve": parameters_simobserve,
+                            "simanalyze": parameters_simanalyze})
+
+
+def read_manifest(directory):
+    """
+    Returns the manifest of a completed output folder or None if the folder has no readable manifest.
+
+    :param directory: The output folder.
+    :return: manifest: The manifest as dictionary or None.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as input_file:
+            return json.load(input_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_manifest(directory, fingerprint, folder, parameters):
+    """
+    Writes the manifest of a completed output folder. The manifest marks the folder as complete, so it must be
+    written after everything else has been published.
+
+    :param directory: The output folder.
+    :param fingerprint: The fingerprint of the iteration.
+    :param folder: The output folder name.
+    :param parameters: The parameter sets of the iteration as dictionary.
+    """
+    manifest = {"version": CACHE_VERSION,
+                "fingerprint": fingerprint,
+                "folder": folder,
+                "parameters": parameters}
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as output:
+        json.dump(manifest, output, indent=2, sort_keys=True, default=_to_json)
+
+
+def find_cached_output(output_path, fingerprint, candidates):
+    """
+    Returns the first of the candidate folders in the output path that is a completed output folder of an iteration
+    with the given fingerprint. Only the manifests of the candidates are read, the candidates are taken from the
+    index of the output path built once by the planner, see planner.create_plan.
+
+    :param output_path: The output path.
+    :param fingerprint: The fingerprint of the iteration.
+    :param candidates: The names of the output folders that may hold the output of the iteration.
+    :return: folder: The name of the matching output folder or None.
+    """
+    for candidate in candidates:
+        manifest = read_manifest(os.path.join(output_path, candidate))
+        if manifest is not None and manifest.get("fingerprint") == fingerprint and \
+                manifest.get("folder") == candidate:
+            return candidate
+    return None
+
+
+def _rename(name, cached_folder, folder):
+    """Replaces the cached folder name at the start of a file name."""
+    if name.startswith(cached_folder):
+        return folder + name[len(cached_folder):]
+    return name
+
+
+def _link_or_copy(source, destination):
+    """Hard-links a file, or copies it if linking is not possible."""
+    try:
+        os.link(source, destination)
+    except (OSError, AttributeError):
+        shutil.copy2(source, destination)
+
+
+def copy_output_tree(source_root, target_root, cached_folder, folder, link=True):
+    """
+    Copies a directory tree and renames all files and directories whose names start with the cached folder name. The
+    metrics sidecar and the image pyramids of the analysis tools are not copied, they are recomputed for the new folder
+    on demand.
+
+    :param source_root: The directory to copy.
+    :param target_root: The directory to copy to. Missing directories are created, existing files are replaced.
+    :param cached_folder: The output folder name used in the names of the copied files.
+    :param folder: The output folder name to use instead.
+    :param link: Hard-link the files where possible instead of copying them.
+    """
+    for directory, subdirectories, files in os.walk(source_root):
+        subdirectories[:] = [name for name in subdirectories if PYRAMID_SUFFIX not in name]
+        relative = os.path.relpath(directory, source_root)
+        parts = [] if relative == "." else relative.split(os.sep)
+        target_directory = os.path.join(target_root, *[_rename(part, cached_folder, folder) for part in parts])
+        if not os.path.isdir(target_directory):
+            os.makedirs(target_directory)
+        for name in files:
+            if name.startswith(METRICS_FILE):
+                continue
+            source = os.path.join(directory, name)
+            target = os.path.join(target_directory, _rename(name, cached_folder, folder))
+            if os.path.lexists(target):
+                os.remove(target)
+            if link:
+                _link_or_copy(source, target)
+            else:
+                shutil.copy2(source, target)
+
+
+def serve_cached_output(output_path, cached_folder, folder, parameter="", index=""):
+    """
+    Creates the output folder of an iteration from the cached output folder of an equal iteration. Files are
+    hard-linked where possible and file names starting with the cached folder name are renamed. The FITS files are
+    copied instead, and their provenance keywords of the iteration, "SATRO PARAMETER" and "SATRO INDEX", are set to
+    those of the served iteration, see fitsexport.set_iteration_provenance. The other provenance keywords describe
+    the products and are kept. The manifest names the new folder and its parameter and index. The folder is
+    published atomically, replacing an existing folder of the same name.
+
+    :param output_path: The output path.
+    :param cached_folder: The name of the cached output folder.
+    :param folder: The output folder name of the iteration.
+    :param parameter: The name of the varying parameter of the iteration or "" for single runs.
+    :param index: The index of the iteration of the parameter values.
+    """
+    if cached_folder == folder:
+        return
+    source_root = os.path.join(output_path, cached_folder)
+    with publish.staged_output(output_path, folder) as target_root:
+        copy_output_tree(source_root, target_root, cached_folder, folder)
+        for name, object_name in fitsexport.IMAGE_OBJECTS:
+            fits_file = os.path.join(target_root, "FITS_Files", folder + "." + name + ".fits")
+            if os.path.isfile(fits_file):
+                fitsexport.set_iteration_provenance(fits_file, parameter, index)
+        os.remove(os.path.join(target_root, MANIFEST_FILE))
+        manifest = read_manifest(source_root)
+        write_manifest(target_root, manifest["fingerprint"], folder,
+                       dict(manifest["parameters"], parameter=parameter, index=index))
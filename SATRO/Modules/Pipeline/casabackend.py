@@ -0,0 +1,115 @@
+import shutil
+import Pipeline.util as util
+
+# The CASA tool classes imported from the init_tools module of the CASA session, see get_tool.
+_tools = {}
+
+
+def get_tool(name):
+    """
+    Returns a CASA tool class, e.g. "cltool", "iatool" or "qatool". The tools are imported when a stage first needs
+    one, so the other modules of the pipeline can be imported in a plain Python interpreter without starting CASA.
+
+    :param name: The name of the tool class.
+    :return: tool: The tool class.
+    :raises ImportError: If the pipeline is not running inside a CASA session.
+    """
+    if name not in _tools:
+        try:
+            import init_tools
+        except ImportError:
+            raise ImportError("The CASA tool " + name + " is only available inside a CASA session.")
+        _tools[name] = getattr(init_tools, name)
+    return _tools[name]
+
+
+def create_skymodel_image(exportfits, parameters_skymodel):
+    """
+    Creates a sky-model CASA image out from given parameters and exports it as FITS file using the CASA task exportfits.
+    To create the CASA image, the CASA tools componentlist, coordinate system, image analysis and quanta. See
+    CASA documentation for further information: https://casa.nrao.edu/casadocs
+
+    :param exportfits: The CASA task exportfits
+    :param parameters_skymodel: Parameter set extracted from the model containing sky-model parameters.
+                                See parameters.get_params_skymodel for detailed content.
+    """
+    cl = get_tool("cltool")()
+    ia = get_tool("iatool")()
+    qa = get_tool("qatool")()
+
+    ra = util.convert_deg_to_hour(parameters_skymodel["sm_direction_ra"])
+    dec = util.convert_deg_to_dms(parameters_skymodel["sm_direction_dec"])
+    direction = util.concat_ra_dec(ra, dec)
+    sm_image = 'Skymodel/skymodel.im'
+    sm_size = [parameters_skymodel["sm_size"], parameters_skymodel["sm_size"], 1, 1]
+    sm_cellsize = parameters_skymodel["sm_cellsize"]
+    sm_frq = parameters_skymodel["sm_frequency"]
+    sm_frq_inc = parameters_skymodel["frequency_increment"]
+    sm_fits = 'Skymodel/skymodel.fits'
+
+    # closes any open component lists, if any.
+    cl.done()
+    cl.addcomponent(flux=parameters_skymodel["sm_flux"],
+                    fluxunit=parameters_skymodel["sm_fluxunit"],
+                    polarization=parameters_skymodel["sm_polarization"],
+                    dir=direction,
+                    shape=parameters_skymodel["sm_shape"],
+                    majoraxis=parameters_skymodel["sm_majoraxis"],
+                    minoraxis=parameters_skymodel["sm_minoraxis"],
+                    positionangle=parameters_skymodel["sm_positionangle"],
+                    freq=parameters_skymodel["component_frequency"],
+                    spectrumtype=parameters_skymodel["sm_spectrumtype"],
+                    index=parameters_skymodel["sm_index"],
+                    label=parameters_skymodel["sm_label"])
+
+    # creates a new, empty CASA image with the name and dimensions given.
+    ia.fromshape(sm_image, sm_size, overwrite=True)
+    # gets the coordinate system of the image.
+    cs = ia.coordsys()
+    # defines the units of the four axes of the new CASA image.
+    cs.setunits(["rad", "rad", "", "Hz"])
+    # will be the cell size and units in this CASA image.
+    cell_rad = qa.convert(qa.quantity(sm_cellsize), "rad")["value"]
+    # tells CASA that RA increases to the right, Dec increases going up, and, a few lines later,
+    cs.setincrement([-cell_rad, cell_rad], "direction")
+    # sets the center of the image in RA, Dec, and frequency.
+    cs.setreferencevalue([qa.convert(ra, "rad")["value"], qa.convert(dec, "rad")["value"]], type="direction")
+    cs.setreferencevalue(sm_frq, "spectral")
+    # tells CASA with of the one channel.
+    cs.setincrement(sm_frq_inc, "spectral")
+    # puts the coordinates and frequencies into the image header.
+    ia.setcoordsys(cs.torecord())
+    # defines the brightness unit (Jy per pixel) of the CASA image.
+    ia.setbrightnessunit("Jy/pixel")
+    # puts the component into the image.
+    ia.modify(cl.torecord(), subtract=False)
+    exportfits(imagename=sm_image,
+               fitsimage=sm_fits,
+               overwrite=True)
+
+
+def create_component_list(sources, directions, component_list):
+    """
+    Creates a new component list and adds sources using the componentlist CASA tool. The sources are added one by one,
+    as loading all of them at once from a record with componentlist.fromrecord takes about twice as long.
+
+    :param sources: The sources as pandas.DataFrame with the columns of catalog.CATALOG_COLUMNS.
+    :param directions: The CASA direction strings of the sources, see catalog.get_directions.
+    :param component_list: The component list to write.
+    """
+    cl = get_tool("cltool")()
+
+    shutil.rmtree(component_list, ignore_errors=True)
+    cl.done()
+    for source, direction in zip(sources.itertuples(index=False), directions):
+        cl.addcomponent(flux=source.flux,
+                        fluxunit=source.fluxunit,
+                        dir=str(direction),
+                        shape=source.shape,
+                        majoraxis=source.majoraxis,
+                        minoraxis=source.minoraxis,
+                        positionangle=source.positionangle,
+                        freq=source.frequency,
+                        label=str(source.name))
+    cl.rename(component_list)
+    cl.done()
@@ -0,0 +1,160 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+import Pipeline.rasterizer as rasterizer
+import Pipeline.util as util
+
+# Columns of a source catalog with their default values. Columns without default are required. Column names are
+# case-insensitive, directions are J2000 degrees and the axes and angles are CASA quantity strings.
+CATALOG_COLUMNS = [("name", None), ("ra", None), ("dec", None), ("flux", None), ("fluxunit", "Jy"),
+                   ("shape", "point"), ("majoraxis", "1arcmin"), ("minoraxis", "1arcmin"),
+                   ("positionangle", "0deg"), ("frequency", None)]
+REQUIRED_COLUMNS = ["ra", "dec", "flux"]
+FITS_EXTENSIONS = (".fits", ".fit", ".fts", ".fits.gz")
+# Sources further from the pointing centre than this many primary beam widths are culled. At two full widths at half
+# maximum the response of a Gaussian primary beam is below 1e-4.
+CULL_BEAM_FACTOR = 2.0
+# Keys of the source parameters, see parameters.get_params_sources, for the catalog columns.
+SOURCE_KEYS = {"name": "Name", "ra": "sp_direction_ra", "dec": "sp_direction_dec", "flux": "sp_flux",
+               "fluxunit": "sp_fluxunit", "shape": "sp_shape", "majoraxis": "sp_majoraxis",
+               "minoraxis": "sp_minoraxis", "positionangle": "sp_positionangle", "frequency": "sp_frequency"}
+
+
+def read_catalog(catalog_file, frequency):
+    """
+    Reads a source catalog from a CSV file or the first table of a FITS file. Missing optional columns are filled
+    with their defaults, see CATALOG_COLUMNS, and sources without name are named after their row.
+
+    :param catalog_file: The catalog file.
+    :param frequency: The frequency of sources without frequency column as quantity string, e.g. "1.4GHz".
+    :return: catalog: A pandas.DataFrame with the columns of CATALOG_COLUMNS.
+    :raises ValueError: If a required column is missing.
+    """
+    if catalog_file.lower().endswith(FITS_EXTENSIONS):
+        with fits.open(catalog_file, memmap=False) as hdul:
+            table = next(hdu for hdu in hdul if isinstance(hdu, (fits.BinTableHDU, fits.TableHDU)))
+            catalog = pd.DataFrame(dict((name, np.asarray(table.data[name]).astype(
+                np.asarray(table.data[name]).dtype.newbyteorder("="))) for name in table.columns.names))
+    else:
+        catalog = pd.read_csv(catalog_file, skipinitialspace=True)
+    catalog.columns = [str(column).strip().lower() for column in catalog.columns]
+    missing = [column for column in REQUIRED_COLUMNS if column not in catalog.columns]
+    if missing:
+        raise ValueError(catalog_file + " has no column " + ", ".join(missing) + ".")
+    defaults = dict(CATALOG_COLUMNS)
+    defaults["frequency"] = frequency
+    for column, default in CATALOG_COLUMNS:
+        if column == "name":
+            if column not in catalog.columns:
+                catalog[column] = ["catalog_" + str(i) for i in range(len(catalog))]
+        elif column not in catalog.columns:
+            catalog[column] = defaults[column]
+        elif defaults[column] is not None:
+            catalog[column] = catalog[column].fillna(defaults[column])
+    for column in ["ra", "dec", "flux"]:
+        catalog[column] = catalog[column].astype(float)
+    return catalog[[column for column, default in CATALOG_COLUMNS]]
+
+
+def get_sources_frame(parameters_sources):
+    """
+    Returns the sources of the sources table as catalog.
+
+    :param parameters_sources: Parameter set containing source parameters, see parameters.get_params_sources.
+    :return: sources: A pandas.DataFrame with the columns of CATALOG_COLUMNS.
+    """
+    return pd.DataFrame([[source[SOURCE_KEYS[column]] for column, default in CATALOG_COLUMNS]
+                         for source in parameters_sources], columns=[column for column, default in CATALOG_COLUMNS])
+
+
+def get_angular_distance(ra, dec, center_ra, center_dec):
+    """
+    Returns the angular distances of directions from a centre with the haversine formula.
+
+    :param ra: The right ascensions in degrees as array.
+    :param dec: The declinations in degrees as array.
+    :param center_ra: The right ascension of the centre in degrees.
+    :param center_dec: The declination of the centre in degrees.
+    :return: distance: The distances in degrees as array.
+    """
+    ra, dec = np.radians(ra), np.radians(dec)
+    center_ra, center_dec = math.radians(center_ra), math.radians(center_dec)
+    haversine = np.sin((dec - center_dec) / 2) ** 2 + \
+        np.cos(dec) * math.cos(center_dec) * np.sin((ra - center_ra) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(haversine, 0, 1))))
+
+
+def get_field_radius(parameters_settings, parameters_skymodel, parameters_simobserve):
+    """
+    Returns the radius around the pointing centre in which sources can contribute to the observation: the larger of
+    half the diagonal of the mapped area and CULL_BEAM_FACTOR primary beam widths. The mapped area is the sky-model
+    image if no map size is set.
+
+    :param parameters_settings: Parameter set containing settings parameters.
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :param parameters_simobserve: Parameter set containing simobserve parameters.
+    :return: radius: The radius in degrees.
+    """
+    frequency, frequency_unit = util.get_decimal_from_string(parameters_skymodel["sm_frequency"])
+    beam_size = math.degrees(util.calculate_beam_size(util.transform_frequency(frequency, frequency_unit),
+                                                      parameters_settings["telescope"]))
+    mapsize = _get_degrees(parameters_simobserve["mapsize"])
+    if not mapsize:
+        mapsize = _get_degrees(parameters_skymodel["sm_cellsize"]) * parameters_skymodel["sm_size"]
+    return max(mapsize * math.sqrt(2) / 2, CULL_BEAM_FACTOR * beam_size)
+
+
+def _get_degrees(quantity):
+    """Returns an angle quantity string such as "5arcmin" in degrees, 0 for an empty string."""
+    if not str(quantity).strip():
+        return 0.0
+    return rasterizer.convert_quantity(quantity, rasterizer.ANGLE_UNITS)
+
+
+def cull_sources(catalog, center_ra, center_dec, radius):
+    """
+    Returns the sources of a catalog within a radius around a centre.
+
+    :param catalog: The catalog as pandas.DataFrame.
+    :param center_ra: The right ascension of the centre in degrees.
+    :param center_dec: The declination of the centre in degrees.
+    :param radius: The radius in degrees.
+    :return: catalog: The sources within the radius.
+    """
+    distance = get_angular_distance(catalog["ra"].values, catalog["dec"].values, center_ra, center_dec)
+    return catalog[distance <= radius].reset_index(drop=True)
+
+
+def get_directions(ra, dec):
+    """
+    Returns the CASA direction strings of arrays of directions, e.g. "J2000 12h0m0.00s -30d0m0.00s", formatted like
+    util.convert_deg_to_hour, util.convert_deg_to_dms and util.concat_ra_dec do for single directions.
+
+    :param ra: The right ascensions in degrees as array.
+    :param dec: The declinations in degrees as array.
+    :return: directions: The direction strings as array.
+    """
+    return np.array([util.concat_ra_dec(ra_string, dec_string) for ra_string, dec_string in
+                     zip(util.convert_deg_to_hour_array(ra).tolist(), util.convert_deg_to_dms_array(dec).tolist())])
+
+
+def load_catalog_sources(parameters_settings, parameters_skymodel, parameters_simobserve):
+    """
+    Returns the sources of the configured source catalog that lie within the observed field, see get_field_radius.
+    The pointing centre is the sky-model direction.
+
+    :param parameters_settings: Parameter set containing settings parameters.
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :param parameters_simobserve: Parameter set containing simobserve parameters.
+    :return: catalog: A pandas.DataFrame with the columns of CATALOG_COLUMNS, None if no catalog is configured.
+    """
+    catalog_file = parameters_settings["sources_catalog"]
+    if not catalog_file:
+        return None
+    if not os.path.isfile(catalog_file):
+        raise IOError("Source catalog not found: " + catalog_file)
+    catalog = read_catalog(catalog_file, parameters_skymodel["sm_frequency"])
+    return cull_sources(catalog, parameters_skymodel["sm_direction_ra"], parameters_skymodel["sm_direction_dec"],
+                        get_field_radius(parameters_settings, parameters_skymodel, parameters_simobserve))
@@ -0,0 +1,338 @@
+import json
+import math
+import os
+import numpy as np
+import Pipeline.cache as cache
+import Pipeline.util as util
+
+# The history is kept per user, so runs from any working directory share it and never write into the application
+# directory.
+HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".satro", "timing_history.jsonl")
+HISTORY_VERSION = 1
+# Only the most recent iterations are used, so the estimator follows changes of the hardware.
+MAX_HISTORY = 2000
+# Minimum number of recorded iterations before a stage or the disk footprint is predicted from them instead of the
+# fixed formulas.
+MIN_SAMPLES = 5
+# Half width of the uncertainty band in standard deviations of the residuals (95 %).
+BAND_SIGMAS = 1.96
+TIME_UNITS = {"": 1.0, "s": 1.0, "sec": 1.0, "min": 60.0, "h": 3600.0, "d": 86400.0}
+# Rough sizes for the disk footprint formula: bytes per visibility row summed over the noiseless and the noisy
+# measurement set, number of float images of the image and the sky-model size, and fixed overhead.
+VISIBILITY_BYTES = 400
+IMAGE_COUNT = 13
+SKYMODEL_IMAGE_COUNT = 3
+OVERHEAD_BYTES = 10 ** 6
+
+
+def _visibilities(features):
+    """Returns the number of visibilities: integrations times baselines."""
+    return features["integrations"] * features["antennas"] * (features["antennas"] - 1) / 2.0
+
+
+# Regressors of the cost model of each recorded stage, see instrumentation.StageRecorder.
+STAGE_FEATURES = {
+    "create_skymodel": lambda f: [1.0, f["sm_size"] ** 2],
+    "create_haslam_map": lambda f: [1.0, f["sm_size"] ** 2 if f["beam_size"] > 1 else 0.0],
+    "create_sources": lambda f: [1.0, f["nsp"]],
+    "run_simobserve": lambda f: [1.0, _visibilities(f), f["sm_size"] ** 2],
+    "run_simanalyze": lambda f: [1.0, _visibilities(f), f["imsize"] ** 2, f["imsize"] ** 2 * f["niter"]],
+    "rename_casa_images": lambda f: [1.0],
+    "create_fits_files": lambda f: [1.0, f["imsize"] ** 2],
+    "publish": lambda f: [1.0, _visibilities(f), f["imsize"] ** 2],
+}
+
+
+def _disk_features(features):
+    """Returns the regressors of the model of the disk footprint of an output folder."""
+    return [1.0, _visibilities(features), features["imsize"] ** 2, features["sm_size"] ** 2]
+
+
+def calulate_estimated_time(integrations, imsize, sm_size, haslam, beam_size):
+    """
+    Calculates and returns estimated computation time for one iteration.
+
+    :param integrations: The number of integrations.
+    :param imsize: The size of the image.
+    :param sm_size: The size of the sky-model image.
+    :param haslam: Boolean if Haslam-Map is selected.
+    :param beam_size: The beam size.
+    :return: estimation: The estimated time in seconds.
+    """
+    haslam_time = 0
+    interpolation_time = 0
+
+    if haslam:
+        haslam_time = 20
+        if beam_size > 1:
+            interpolation_time = 0.0004 * sm_size**2 - 0.02 * sm_size + 4
+
+    integration_time = integrations / 30
+    imsize_time = imsize * 0.04
+    sm_size_time = sm_size * 0.03
+    estimation = 20 + integration_time + imsize_time + sm_size_time + haslam_time + interpolation_time
+    return estimation
+
+
+def calculate_estimated_disk(features):
+    """
+    Calculates and returns the estimated disk footprint of the output folder of one iteration.
+
+    :param features: The features of the iteration, see extract_features.
+    :return: estimation: The estimated size in bytes.
+    """
+    return (OVERHEAD_BYTES + VISIBILITY_BYTES * _visibilities(features) +
+            4 * IMAGE_COUNT * features["imsize"] ** 2 + 4 * SKYMODEL_IMAGE_COUNT * features["sm_size"] ** 2)
+
+
+def convert_time_to_seconds(string):
+    """
+    Converts a time quantity as string, e.g. "10s" or "1h", to seconds and returns it.
+
+    :param string: The time quantity.
+    :return: seconds: The time in seconds as float.
+    """
+    value, units = util.get_decimal_from_string(string)
+    units = units.strip()
+    if units not in TIME_UNITS:
+        raise ValueError(units + " is invalid as units for time. Use s, min, h or d.")
+    return value * TIME_UNITS[units]
+
+
+def count_antennas(antennalist):
+    """
+    Returns the number of antennas of an antenna configuration file or None if it can not be found.
+
+    :param antennalist: The name of the selected antenna configuration.
+    :return: antennas: The number of antennas.
+    """
+    antenna_file = cache.find_antenna_file(antennalist)
+    if antenna_file is None:
+        return None
+    with open(antenna_file, 'r') as input_file:
+        return len([line for line in input_file if line.strip() and not line.lstrip().startswith("#")])
+
+
+def extract_features(parameters_settings, parameters_skymodel, parameters_sources, parameters_simobserve,
+                     parameters_simanalyze, antennas=None):
+    """
+    Returns the features of an iteration the runtime depends on.
+
+    :param parameters_settings: Parameter set containing settings parameters.
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :param parameters_sources: Parameter set containing source parameters.
+    :param parameters_simobserve: Parameter set containing simobserve parameters.
+    :param parameters_simanalyze: Parameter set containing simanalyze parameters.
+    :param antennas: The number of antennas, counted in the antenna configuration file if not given. If it can not
+                     be found, one antenna is assumed, so the visibilities scale with the integrations only.
+    :return: features: A dictionary with the keys "integrations", "imsize", "sm_size", "haslam", "beam_size",
+                       "antennas", "nsp" and "niter".
+    """
+    if antennas is None:
+        antennas = count_antennas(parameters_settings["antennalist"]) or 1
+    frequency, frequency_unit = util.get_decimal_from_string(parameters_skymodel["sm_frequency"])
+    beam_size = util.calculate_beam_size(util.transform_frequency(frequency, frequency_unit),
+                                         parameters_settings["telescope"])
+    return {"integrations": convert_time_to_seconds(parameters_simobserve["totaltime"]) /
+                            convert_time_to_seconds(parameters_simobserve["integration"]),
+            "imsize": float(parameters_simanalyze["analyze_imsize"][0]),
+            "sm_size": float(parameters_skymodel["sm_size"]),
+            "haslam": parameters_settings["sm"] == "Haslam-Map",
+            "beam_size": float(beam_size),
+            "antennas": float(antennas),
+            "nsp": float(len(parameters_sources)),
+            "niter": float(parameters_simanalyze["analyze_niter"])}
+
+
+def get_expected_stages(features):
+    """Returns the names of the recorded stages an iteration with the given features executes."""
+    names = ["create_skymodel", "create_sources", "run_simobserve", "run_simanalyze", "rename_casa_images",
+             "create_fits_files", "publish"]
+    if features["haslam"]:
+        names[0] = "create_haslam_map"
+    return names
+
+
+def append_history(history_file, results):
+    """
+    Appends the features, stage wall times and output folder sizes of the computed iterations of a run to the
+    history file. Iterations that failed or were served from the cache are skipped. The size is taken before pruning
+    by the retention policy, which is the footprint an iteration needs while it runs.
+
+    :param history_file: The history file.
+    :param results: The results of the iterations as returned by pipeline.run_iteration.
+    """
+    directory = os.path.dirname(history_file)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(history_file, 'a') as output:
+        for result in results:
+            if "error" in result or result.get("cached") or "features" not in result:
+                continue
+            output_bytes = result.get("output_bytes")
+            if output_bytes is not None:
+                output_bytes += result.get("pruned_bytes") or 0
+            timings = {}
+            for record in result.get("timings", []):
+                if record["stage"] in STAGE_FEATURES:
+                    timings[record["stage"]] = timings.get(record["stage"], 0.0) + record["wall"]
+            output.write(json.dumps({"version": HISTORY_VERSION,
+                                     "features": result["features"],
+                                     "timings": timings,
+                                     "output_bytes": output_bytes}, sort_keys=True) + "\n")
+
+
+def read_history(history_file):
+    """
+    Returns the most recent entries of the history file or an empty list if there is none.
+
+    :param history_file: The history file.
+    :return: history: A list of dictionaries with the keys "features", "timings" and "output_bytes".
+    """
+    history = []
+    try:
+        with open(history_file, 'r') as input_file:
+            for line in input_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("version") == HISTORY_VERSION:
+                    history.append(entry)
+    except (IOError, OSError):
+        return []
+    return history[-MAX_HISTORY:]
+
+
+class StageModel:
+    """
+    Least squares cost model of one stage, fitted to at least MIN_SAMPLES samples. If there are too few samples for
+    the regressors of the stage, the mean value is used instead.
+    """
+
+    def __init__(self, name, samples, design):
+        """
+        This method will be called when an object of this class is instantiated. It fits the model.
+
+        :param name: The name of the stage.
+        :param samples: A list of tuples of the features and the measured value, e.g. the wall time of the stage.
+        :param design: A function returning the regressors of the given features.
+        """
+        self.name = name
+        self.samples = len(samples)
+        x = np.array([design(features) for features, wall in samples], dtype=float)
+        y = np.array([wall for features, wall in samples], dtype=float)
+        if len(y) >= x.shape[1] + 2:
+            self.regressors = design
+            self.coefficients = np.linalg.lstsq(x, y, rcond=-1)[0]
+            residuals = y - x.dot(self.coefficients)
+            self.sigma = math.sqrt(residuals.dot(residuals) / (len(y) - x.shape[1]))
+        else:
+            self.regressors = lambda features: [1.0]
+            self.coefficients = np.array([y.mean()])
+            self.sigma = float(y.std(ddof=1))
+
+    def predict(self, features):
+        """
+        Returns the predicted value, e.g. the wall time of the stage, and the standard deviation of the residuals.
+
+        :param features: The features of the iteration.
+        """
+        prediction = float(np.dot(self.regressors(features), self.coefficients))
+        return max(prediction, 0.0), self.sigma
+
+
+class RuntimeEstimator:
+    """
+    Predicts the runtime of iterations from per-stage cost models fitted to the recorded timings of past runs. Falls
+    back to the fixed formula of calulate_estimated_time if a stage of an iteration has fewer than MIN_SAMPLES
+    recorded timings. The disk footprint is predicted the same way from the recorded output folder sizes.
+    """
+
+    def __init__(self, history):
+        """
+        This method will be called when an object of this class is instantiated. It fits the stage models.
+
+        :param history: The history entries, see read_history.
+        """
+        samples = {}
+        disk_samples = []
+        for entry in history:
+            for name, wall in entry["timings"].items():
+                if name in STAGE_FEATURES:
+                    samples.setdefault(name, []).append((entry["features"], wall))
+            if entry.get("output_bytes") is not None:
+                disk_samples.append((entry["features"], entry["output_bytes"]))
+        self.models = dict((name, StageModel(name, stage_samples, STAGE_FEATURES[name]))
+                           for name, stage_samples in samples.items() if len(stage_samples) >= MIN_SAMPLES)
+        self.disk_model = StageModel("disk", disk_samples, _disk_features) \
+            if len(disk_samples) >= MIN_SAMPLES else None
+
+    def predict_iteration(self, features):
+        """
+        Returns the predicted runtime of an iteration and the half width of its uncertainty band. The uncertainties
+        of the stages are added in quadrature.
+
+        :param features: The features of the iteration, see extract_features.
+        :returns:
+            - estimation: The estimated time in seconds.
+            - band: The half width of the uncertainty band in seconds or None if the formula was used.
+        """
+        names = get_expected_stages(features)
+        if any(name not in self.models for name in names):
+            return calulate_estimated_time(features["integrations"], features["imsize"], features["sm_size"],
+                                           features["haslam"], features["beam_size"]), None
+        estimation = 0.0
+        variance = 0.0
+        for name in names:
+            prediction, sigma = self.models[name].predict(features)
+            estimation += prediction
+            variance += sigma ** 2
+        return estimation, BAND_SIGMAS * math.sqrt(variance)
+
+    def predict_disk(self, features):
+        """
+        Returns the predicted disk footprint of the output folder of an iteration and the half width of its
+        uncertainty band.
+
+        :param features: The features of the iteration, see extract_features.
+        :returns:
+            - estimation: The estimated size in bytes.
+            - band: The half width of the uncertainty band in bytes or None if the formula was used.
+        """
+        if self.disk_model is None:
+            return calculate_estimated_disk(features), None
+        prediction, sigma = self.disk_model.predict(features)
+        return prediction, BAND_SIGMAS * sigma
+
+    def predict_sweep(self, features_list, processes=1):
+        """
+        Returns the predicted runtime of a sweep and the half width of its uncertainty band. The bands of the
+        iterations are added linearly, since their errors are dominated by the same hardware. Parallel iterations
+        divide both by the number of processes.
+
+        :param features_list: The features of each iteration.
+        :param processes: The number of iterations executed in parallel.
+        :returns:
+            - estimation: The estimated time in seconds.
+            - band: The half width of the uncertainty band in seconds or None if the formula was used for any
+                    iteration.
+        """
+        estimation = 0.0
+        band = 0.0
+        for features in features_list:
+            iteration_estimation, iteration_band = self.predict_iteration(features)
+            estimation += iteration_estimation
+            band = None if band is None or iteration_band is None else band + iteration_band
+        parallel = float(max(1, min(processes, len(features_list))))
+        return estimation / parallel, band / parallel if band is not None else None
+
+
+def load_estimator(history_file=HISTORY_FILE):
+    """
+    Returns an estimator fitted to the history file.
+
+    :param history_file: The history file.
+    :return: estimator: The RuntimeEstimator.
+    """
+    return RuntimeEstimator(read_history(history_file))
@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import shutil
+from astropy.io import fits
+import Pipeline.util as util
+
+DEFAULT_COMPRESSION = "none"
+DEFAULT_QUANTIZE_LEVEL = 16.0
+# Descriptions of the compression modes of the exported FITS files in the order they are offered.
+COMPRESSION_MODES = [("none", "Uncompressed"),
+                     ("lossless", "Tile-compressed, lossless"),
+                     ("lossy", "Tile-compressed, quantized")]
+# The exported CASA images with the OBJECT header value of their FITS files.
+IMAGE_OBJECTS = [("image", "radio_image"), ("residual", "residual_image"), ("fidelity", "fidelity_image")]
+# Prefix of the provenance header keywords.
+PROVENANCE_PREFIX = "HIERARCH SATRO "
+# Provenance keywords describing the iteration instead of its products, see set_iteration_provenance.
+ITERATION_PROVENANCE = ["parameter", "index"]
+# Seed of the subtractive dithering computed from a checksum of the image, so equal images compress to equal files.
+DITHER_SEED_CHECKSUM = -1
+
+
+def create_compressed_hdu(data, header, compression, quantize_level=DEFAULT_QUANTIZE_LEVEL, tile=0):
+    """
+    Returns a tile-compressed image HDU. Lossless compression stores the float values unchanged with GZIP. Lossy
+    compression quantizes the values with a step of the noise of each tile divided by the quantize level, with
+    subtractive dithering, and compresses them with Rice.
+
+    :param data: The image data.
+    :param header: The image header.
+    :param compression: "lossless" or "lossy".
+    :param quantize_level: The quantize level of lossy compression, higher values preserve more precision.
+    :param tile: The edge length of the square tiles in pixels, 0 to compress row by row.
+    :return: hdu: The astropy.io.fits.CompImageHDU.
+    """
+    if compression == "lossless":
+        kwargs = {"compression_type": "GZIP_2", "quantize_level": 0.0}
+    elif compression == "lossy":
+        kwargs = {"compression_type": "RICE_1", "quantize_level": float(quantize_level),
+                  "quantize_method": 1, "dither_seed": DITHER_SEED_CHECKSUM}
+    else:
+        raise ValueError("Unknown FITS compression: " + str(compression))
+    if tile:
+        shape = tuple([min(int(tile), length) for length in data.shape[-2:]])
+        shape = (1,) * (data.ndim - 2) + shape
+        try:
+            return fits.CompImageHDU(data, header, tile_shape=shape, **kwargs)
+        except TypeError:
+            # astropy before 5.3 takes the tile size in FITS axis order
+            return fits.CompImageHDU(data, header, tile_size=shape[::-1], **kwargs)
+    return fits.CompImageHDU(data, header, **kwargs)
+
+
+def _export_image(exportfits, imagename, fitsimage):
+    """Exports one CASA image with exportfits. Runs in a child process of export_images."""
+    exportfits(imagename=imagename, fitsimage=fitsimage, overwrite=True, dropdeg=True)
+
+
+def export_images(exportfits, jobs, parallel=True):
+    """
+    Exports CASA images to FITS files with the CASA task exportfits. The images are exported concurrently, each in a
+    forked child process, see util.get_fork_context, so the task overhead and the image reads overlap. CASA tasks are
+    not thread-safe, so threads are not used. Inside daemonic processes such as the workers of pipeline.run_parallel,
+    which can not have child processes, and if parallel is false, the images are exported one after another.
+
+    :param exportfits: The CASA task exportfits.
+    :param jobs: A list of tuples with the CASA image and the FITS file to write.
+    :param parallel: Export concurrently if possible.
+    :raises IOError: If a FITS file has not been written.
+    """
+    if parallel and len(jobs) > 1 and not multiprocessing.current_process().daemon:
+        processes = [util.get_fork_context().Process(target=_export_image, args=(exportfits, imagename, fitsimage))
+                     for imagename, fitsimage in jobs]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    else:
+        for imagename, fitsimage in jobs:
+            _export_image(exportfits, imagename, fitsimage)
+    for imagename, fitsimage in jobs:
+        if not os.path.isfile(fitsimage):
+            raise IOError("exportfits did not write " + fitsimage + " from " + imagename)
+
+
+def get_provenance_cards(provenance):
+    """
+    Returns the provenance of an iteration as header cards with HIERARCH keywords, e.g. "SATRO FINGERPRINT".
+
+    :param provenance: A dictionary with keyword suffixes as keys and strings or numbers as values.
+    :return: cards: A list of (keyword, value) tuples.
+    """
+    return [(PROVENANCE_PREFIX + name.upper(), value) for name, value in sorted(provenance.items())]
+
+
+def finalize_fits_file(path, object_name, provenance, compression=DEFAULT_COMPRESSION,
+                       quantize_level=DEFAULT_QUANTIZE_LEVEL, tile=0):
+    """
+    Sets the OBJECT and the provenance keywords of a FITS file written by exportfits and compresses it, in a single
+    pass over the file. Uncompressed files are updated in place, compressed files are replaced atomically.
+
+    :param path: The FITS file.
+    :param object_name: The value of the OBJECT keyword.
+    :param provenance: The provenance keywords, see get_provenance_cards.
+    :param compression: The compression mode, see COMPRESSION_MODES.
+    :param quantize_level: The quantize level of lossy compression.
+    :param tile: The edge length of the square compression tiles in pixels, 0 to compress row by row.
+    :return: size: The size of the finalized file in bytes.
+    """
+    if compression == "none":
+        with fits.open(path, mode="update", memmap=False) as hdul:
+            _set_header(hdul[0].header, object_name, provenance)
+        return os.path.getsize(path)
+    with fits.open(path, memmap=False) as hdul:
+        _set_header(hdul[0].header, object_name, provenance)
+        hdu = create_compressed_hdu(hdul[0].data, hdul[0].header, compression, quantize_level, tile)
+        temporary = path + ".compressing"
+        fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(temporary, overwrite=True)
+    os.rename(temporary, path)
+    return os.path.getsize(path)
+
+
+def set_iteration_provenance(path, parameter, index):
+    """
+    Replaces the provenance keywords of ITERATION_PROVENANCE in a finalized FITS file with those of another iteration
+    with the same output, e.g. an iteration served from the output cache. Only the header is changed, compressed data
+    is not compressed again. The header is changed in a copy that replaces the file, so other hard links to the file
+    keep their header.
+
+    :param path: The FITS file.
+    :param parameter: The name of the varying parameter of the iteration or "" for single runs.
+    :param index: The index of the iteration of the parameter values.
+    """
+    temporary = path + ".provenance"
+    shutil.copy2(path, temporary)
+    # the compressed image is opened as binary table, whose header holds the image keywords, so the data is not
+    # decompressed and compressed again, which would change lossy compressed data
+    with fits.open(temporary, mode="update", memmap=False, disable_image_compression=True) as hdul:
+        compressed = len(hdul) > 1 and hdul[1].header.get("ZIMAGE", False)
+        header = hdul[1].header if compressed else hdul[0].header
+        for name in ITERATION_PROVENANCE:
+            header.remove(PROVENANCE_PREFIX + name.upper(), ignore_missing=True)
+        if parameter:
+            header.extend(get_provenance_cards({"parameter": parameter, "index": index}))
+    os.rename(temporary, path)
+
+
+def _set_header(header, object_name, provenance):
+    """Sets the OBJECT and the provenance keywords of a header."""
+    header["OBJECT"] = object_name
+    for keyword, value in get_provenance_cards(provenance):
+        header[keyword] = value
@@ -0,0 +1,191 @@
+import json
+import math
+import os
+import pickle
+import sys
+import numpy as np
+import Pipeline.util as util
+
+HASLAM_PICKLE = 'Skymaps/haslam_spec_gal_guzman.p'
+HASLAM_STORE = 'Skymaps/haslam_spec_gal_guzman'
+HASLAM_ARRAYS = ["haslam_gal", "spec_index", "gal_lat", "gal_lon", "haslam_ra", "haslam_dec"]
+STORE_VERSION = 1
+METADATA_FILE = "metadata.json"
+# Step of the coarse grid searched for the pixel nearest to the sky-model direction, see find_center_index.
+CENTER_STEP = 16
+
+# Memory-mapped stores already opened by this process, keyed by their absolute path.
+_open_stores = {}
+
+
+def convert_haslam_map(pickle_path=HASLAM_PICKLE, store_path=HASLAM_STORE):
+    """
+    Converts the pickled haslam all-sky map into a memory-mappable store. Each of the six arrays is written as raw .npy
+    file and a small metadata header describing them is written last, so an interrupted conversion leaves no valid
+    store behind.
+
+    :param pickle_path: The pickle file containing the haslam map.
+    :param store_path: The directory the store is written to.
+    :return: metadata: The metadata header of the store as dictionary.
+    """
+    with open(pickle_path, 'rb') as input_file:
+        arrays = pickle.load(input_file)
+    if not os.path.isdir(store_path):
+        os.makedirs(store_path)
+    metadata_file = os.path.join(store_path, METADATA_FILE)
+    if os.path.exists(metadata_file):
+        os.remove(metadata_file)
+
+    metadata = {"version": STORE_VERSION,
+                "source": os.path.basename(pickle_path),
+                "source_size": os.path.getsize(pickle_path),
+                "arrays": {}}
+    for name, array in zip(HASLAM_ARRAYS, arrays):
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(store_path, name + ".npy"), array)
+        metadata["arrays"][name] = {"shape": list(array.shape), "dtype": array.dtype.str}
+
+    with open(metadata_file, 'w') as output:
+        json.dump(metadata, output, indent=2, sort_keys=True)
+    _open_stores.pop(os.path.abspath(store_path), None)
+    return metadata
+
+
+def read_store_metadata(store_path=HASLAM_STORE):
+    """
+    Returns the metadata header of a haslam map store or None if there is no complete store of a supported version.
+
+    :param store_path: The directory of the store.
+    :return: metadata: The metadata header as dictionary or None.
+    """
+    metadata_file = os.path.join(store_path, METADATA_FILE)
+    if not os.path.isfile(metadata_file):
+        return None
+    with open(metadata_file, 'r') as input_file:
+        metadata = json.load(input_file)
+    if metadata.get("version") != STORE_VERSION:
+        return None
+    return metadata
+
+
+def load_haslam_map(store_path=HASLAM_STORE, pickle_path=HASLAM_PICKLE):
+    """
+    Returns the six arrays of the haslam all-sky map: temperature, spectral index, galactic latitude and longitude,
+    right ascension and declination. If a store created by convert_haslam_map exists, the arrays are memory-mapped
+    read-only, so only the pages that are accessed get read from disk, and they are kept open for later calls. Else the
+    arrays are loaded from the pickle file.
+
+    :param store_path: The directory of the memory-mapped store.
+    :param pickle_path: The pickle file used as fallback.
+    :return: arrays: A tuple with the six arrays in the order of HASLAM_ARRAYS.
+    """
+    key = os.path.abspath(store_path)
+    if key in _open_stores:
+        return _open_stores[key]
+    metadata = read_store_metadata(store_path)
+    if metadata is None:
+        with open(pickle_path, 'rb') as input_file:
+            return tuple(pickle.load(input_file))
+
+    arrays = []
+    for name in HASLAM_ARRAYS:
+        array = np.load(os.path.join(store_path, name + ".npy"), mmap_mode='r')
+        if list(array.shape) != metadata["arrays"][name]["shape"]:
+            raise ValueError("The haslam map store " + store_path + " is corrupt: unexpected shape of " + name + ".")
+        arrays.append(array)
+    arrays = tuple(arrays)
+    _open_stores[key] = arrays
+    return arrays
+
+
+def find_center_index(haslam_ra, haslam_dec, ra_rad, dec_rad, step=CENTER_STEP):
+    """
+    Finds the pixel of the haslam map nearest to a direction without computing the distance of every pixel. The
+    nearest pixel of every step-th row and column is refined in the window of step pixels around it, and the window is
+    moved until it holds no nearer pixel. Only the rows of the coarse grid and the windows are read from a
+    memory-mapped map.
+
+    :param haslam_ra: The right ascension of the pixels in radians.
+    :param haslam_dec: The declination of the pixels in radians.
+    :param ra_rad: The right ascension of the direction in radians.
+    :param dec_rad: The declination of the direction in radians.
+    :param step: The step of the coarse grid in pixels.
+    :returns:
+        - row: The row of the nearest pixel.
+        - column: The column of the nearest pixel.
+    """
+    row, column = util.find_index_of_nearest_xy(np.asarray(haslam_ra[::step, ::step]),
+                                                np.asarray(haslam_dec[::step, ::step]), ra_rad, dec_rad)[:2]
+    row, column = row * step, column * step
+    while True:
+        lower = (max(0, row - step), max(0, column - step))
+        upper = (min(haslam_ra.shape[0], row + step + 1), min(haslam_ra.shape[1], column + step + 1))
+        window_row, window_column, distance = util.find_index_of_nearest_xy(
+            np.asarray(haslam_ra[lower[0]:upper[0], lower[1]:upper[1]]),
+            np.asarray(haslam_dec[lower[0]:upper[0], lower[1]:upper[1]]), ra_rad, dec_rad)
+        if distance[window_row, window_column] >= distance[row - lower[0], column - lower[1]]:
+            return row, column
+        row, column = lower[0] + window_row, lower[1] + window_column
+
+
+def get_haslam_flux(parameters_settings, parameters_skymodel):
+    """
+    Extracts data from given slice from the haslam all-sky map. If the beam size is bigger than 1 degree,
+    interpolation with the haslam map of all pixels of the sky-model will be done, else only for the element in the
+    phase center.
+
+    :param parameters_settings: Parameter set extracted from the model containing settings parameters.
+                                See get_params_settings for detailed content.
+    :param parameters_skymodel: Parameter set extracted from the model containing sky-model parameters.
+                                See get_params_skymodel for detailed content.
+    :return: flux_sky: The flux in Jy/pixel as array of shape (1, 1, sm_size, sm_size).
+    """
+    ra_rad = parameters_skymodel["sm_direction_ra"] * math.pi / 180
+    dec_rad = parameters_skymodel["sm_direction_dec"] * math.pi / 180
+    size = [parameters_skymodel["sm_size"], parameters_skymodel["sm_size"]]
+    cellsize = parameters_skymodel["sm_cellsize"]
+    sm_freq = parameters_skymodel["sm_frequency"]
+    del_, cellsize_unit = util.get_decimal_from_string(cellsize)
+    if cellsize_unit == "arcmin":
+        del_ = del_ * 60
+    elif cellsize_unit == "arcsec":
+        pass
+    else:
+        raise ValueError(cellsize_unit + " is invalid as units for cellsize. Use arcmin or arcsec.")
+
+    freq, freq_unit = util.get_decimal_from_string(sm_freq)
+    freq = util.transform_frequency(freq, freq_unit)
+
+    dish_diam = parameters_settings["telescope"]
+    beam_size = util.calculate_beam_size(freq, dish_diam)
+    ra_array = np.linspace(-1, 1, size[0]) * del_ * (1 / 3600 * np.pi / 180) + ra_rad
+    dec_array = np.linspace(-1, 1, size[1]) * del_ * (1 / 3600 * np.pi / 180) + dec_rad
+    # n must not be smaller than beam_size
+    n = 100
+    # haslam_gal is temperature, ra_dec is ra dec grid
+    haslam_gal, spec_index, gal_lat, gal_lon, haslam_ra, haslam_dec = load_haslam_map()
+    # index of the array that is provided for the given direction
+    idx_c = find_center_index(haslam_ra, haslam_dec, ra_rad, dec_rad)
+    tb_sky = np.zeros((size[0], size[1]))
+    spec = np.zeros((size[0], size[1]))
+    if beam_size > 1:
+        idy, idx = util.find_indices_of_nearest_grid(haslam_ra[idx_c[0] - n:idx_c[0] + n, idx_c[1] - n:idx_c[1] + n],
+                                                     haslam_dec[idx_c[0] - n:idx_c[0] + n, idx_c[1] - n:idx_c[1] + n],
+                                                     ra_array, dec_array)
+        tb_sky = haslam_gal[idx_c[0] - n + idy, idx_c[1] - n + idx]
+        spec = spec_index[idx_c[0] - n + idy, idx_c[1] - n + idx]
+        tb_sky = np.array(tb_sky)
+    else:
+        # interpolation of only one element (phase center direction)
+        # instead of a snippet of the haslam map?
+        tb_sky = tb_sky + haslam_gal[idx_c[0], idx_c[1]]
+        spec = spec + spec_index[idx_c[0], idx_c[1]]
+    tb_sky = tb_sky * (freq / 0.408) ** (-spec)
+    tb_sky = tb_sky.reshape(1, 1, size[0], size[1])
+    # Convert Temperature in Kelvin to Flux (Jy/pixel)
+    flux_sky = (tb_sky / (1.222 * 10 ** 3) * freq ** 2 * (del_ * del_)) / 1000
+    return flux_sky
+
+
+if __name__ == '__main__':
+    convert_haslam_map(*sys.argv[1:])
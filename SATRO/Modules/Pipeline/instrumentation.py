@@ -0,0 +1,186 @@
+import contextlib
+import json
+import os
+import sys
+import timeit
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TIMINGS_FILE = "timings.jsonl"
+# The aggregated timings of a sweep are written to SWEEP_TIMINGS_PREFIX + sweep identifier + ".json", so every sweep
+# into an output path keeps its own file, see journal.Journal.
+SWEEP_TIMINGS_PREFIX = "sweep_timings-"
+
+
+def _read_proc_value(path, key):
+    """Returns the integer value of a "key: value" line of a file in /proc or None if it can not be read."""
+    try:
+        with open(path, 'r') as input_file:
+            for line in input_file:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size of the process, so the peak of the next stage can be measured. Only possible
+    on Linux; elsewhere the peak of the process lifetime is measured.
+    """
+    try:
+        with open("/proc/self/clear_refs", 'w') as output:
+            output.write("5")
+    except (IOError, OSError):
+        pass
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident set size of the process in bytes since the last reset_peak_rss or None if it can not
+    be determined.
+    """
+    peak = _read_proc_value("/proc/self/status", "VmHWM")
+    if peak is not None:
+        return peak * 1024
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_bytes_written():
+    """Returns the number of bytes the process has written to storage or None if it can not be determined."""
+    return _read_proc_value("/proc/self/io", "write_bytes")
+
+
+def get_cpu_time():
+    """Returns the user and system CPU time of the process and its terminated child processes in seconds."""
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+class StageRecorder:
+    """
+    Collects structured timing and resource records of the stages of an iteration. Each record holds the stage
+    name, the wall time and CPU time in seconds, the peak resident set size and the bytes written in bytes. Values
+    that can not be determined on the platform are None.
+    """
+
+    def __init__(self, folder):
+        """
+        This method will be called when an object of this class is instantiated.
+
+        :param folder: The output folder name of the iteration.
+        """
+        self.folder = folder
+        self.records = []
+
+    @contextlib.contextmanager
+    def measure(self, stage, **fields):
+        """
+        Context manager recording the enclosed code as stage. The record is also added if the code raises.
+
+        :param stage: The name of the stage.
+        :param fields: Additional JSON compatible fields of the record.
+        """
+        reset_peak_rss()
+        written = get_bytes_written()
+        cpu = get_cpu_time()
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            record = {"folder": self.folder,
+                      "stage": stage,
+                      "wall": timeit.default_timer() - start,
+                      "cpu": get_cpu_time() - cpu,
+                      "peak_rss": get_peak_rss(),
+                      "bytes_written": None}
+            if written is not None:
+                record["bytes_written"] = get_bytes_written() - written
+            record.update(fields)
+            self.records.append(record)
+
+    def write(self, directory):
+        """
+        Writes the records as JSON lines to the timings file in the given directory.
+
+        :param directory: The output folder.
+        """
+        with open(os.path.join(directory, TIMINGS_FILE), 'w') as output:
+            for record in self.records:
+                output.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def read_records(directory):
+    """
+    Returns the records of the timings file in the given directory or an empty list if there is none.
+
+    :param directory: The output folder.
+    :return: records: The records as list of dictionaries.
+    """
+    try:
+        with open(os.path.join(directory, TIMINGS_FILE), 'r') as input_file:
+            return [json.loads(line) for line in input_file if line.strip()]
+    except (IOError, OSError, ValueError):
+        return []
+
+
+def aggregate_records(records):
+    """
+    Aggregates stage records per stage.
+
+    :param records: The records of one or more iterations.
+    :return: stages: A dictionary with the stage names as keys and dictionaries with the keys "count", "wall_total",
+                     "wall_mean", "wall_max", "cpu_total", "peak_rss_max" and "bytes_written_total" as values.
+    """
+    stages = {}
+    for record in records:
+        stage = stages.setdefault(record["stage"], {"count": 0, "wall_total": 0.0, "wall_max": 0.0,
+                                                    "cpu_total": 0.0, "peak_rss_max": None,
+                                                    "bytes_written_total": None})
+        stage["count"] += 1
+        stage["wall_total"] += record["wall"]
+        stage["wall_max"] = max(stage["wall_max"], record["wall"])
+        stage["cpu_total"] += record["cpu"]
+        if record.get("peak_rss") is not None:
+            stage["peak_rss_max"] = max(stage["peak_rss_max"] or 0, record["peak_rss"])
+        if record.get("bytes_written") is not None:
+            stage["bytes_written_total"] = (stage["bytes_written_total"] or 0) + record["bytes_written"]
+    for stage in stages.values():
+        stage["wall_mean"] = stage["wall_total"] / stage["count"]
+    return stages
+
+
+def write_sweep_timings(output_path, sweep, results):
+    """
+    Writes the aggregate of the stage records of all iterations of a sweep to its sweep timings file in the output
+    path.
+
+    :param output_path: The output path.
+    :param sweep: The identifier of the sweep in the journal.
+    :param results: The results of the iterations as returned by pipeline.run_iteration.
+    :return: timings_file: The written file.
+    """
+    records = []
+    iterations = []
+    for result in results:
+        records.extend(result.get("timings", []))
+        iterations.append({"folder": result.get("folder"),
+                           "parameter": result.get("parameter"),
+                           "index": result.get("index"),
+                           "elapsed": result.get("elapsed"),
+                           "cached": result.get("cached", False),
+                           "pruned_bytes": result.get("pruned_bytes"),
+                           "failed": "error" in result})
+    timings_file = os.path.join(output_path, SWEEP_TIMINGS_PREFIX + sweep + ".json")
+    with open(timings_file, 'w') as output:
+        json.dump({"sweep": sweep, "stages": aggregate_records(records), "iterations": iterations}, output, indent=2,
+                  sort_keys=True)
+    return timings_file
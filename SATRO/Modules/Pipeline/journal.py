@@ -0,0 +1,211 @@
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+import Pipeline.cache as cache
+import Pipeline.util as util
+
+JOURNAL_FILE = "sweep_journal.jsonl"
+
+
+class Journal:
+    """
+    Append-only journal of the sweeps run into an output path. Every planned iteration, its start and its end with
+    status and published output are recorded as JSON lines. Each line is written with a single append and synced to
+    disk, so the journal survives crashes and can be written by parallel worker processes.
+    """
+
+    def __init__(self, output_path, sweep=None):
+        """
+        This method will be called when an object of this class is instantiated.
+
+        :param output_path: The output path the journal is located in.
+        :param sweep: The identifier of the sweep, a new one if not given.
+        """
+        self.output_path = os.path.abspath(output_path)
+        self.path = os.path.join(self.output_path, JOURNAL_FILE)
+        self.sweep = sweep if sweep is not None else uuid.uuid4().hex[:12]
+
+    def record(self, event, **fields):
+        """
+        Appends an event to the journal.
+
+        :param event: The name of the event.
+        :param fields: Additional JSON compatible fields of the event.
+        """
+        entry = {"event": event, "sweep": self.sweep, "time": time.time()}
+        entry.update(fields)
+        line = (json.dumps(entry, sort_keys=True) + "\n").encode("utf-8")
+        descriptor = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(descriptor, line)
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def start_sweep(self, plan, resume):
+        """
+        Records the start of a sweep and its planned iterations.
+
+        :param plan: The planner.SweepPlan of the sweep.
+        :param resume: True if completed iterations of earlier sweeps are skipped.
+        """
+        self.record("sweep_started", mode=plan.settings["mode"], iterations=len(plan.iterations), resume=resume)
+        for iteration in plan.iterations:
+            self.record("planned", number=iteration["number"], folder=iteration["folder"],
+                        fingerprint=iteration["fingerprint"], parameter=iteration["parameter"],
+                        index=iteration["index"])
+
+    def finish_sweep(self, status):
+        """
+        Records the end of a sweep.
+
+        :param status: "completed", "failed" or "cancelled".
+        """
+        self.record("sweep_finished", status=status)
+
+    def start_iteration(self, iteration):
+        """
+        Records the start of a planned iteration.
+
+        :param iteration: The planned iteration, see planner.create_plan.
+        """
+        self.record("started", number=iteration["number"], folder=iteration["folder"],
+                    fingerprint=iteration["fingerprint"])
+
+    def finish_iteration(self, iteration, status, error=None):
+        """
+        Records the end of a planned iteration. For completed iterations the size of the published output folder is
+        recorded without the caches of the analysis tools, so it can be verified before the iteration is skipped on
+        resume, see verify_output.
+
+        :param iteration: The planned iteration, see planner.create_plan.
+        :param status: "completed", "failed" or "cancelled".
+        :param error: The error of a failed iteration.
+        """
+        fields = {"number": iteration["number"],
+                  "folder": iteration["folder"],
+                  "fingerprint": iteration["fingerprint"],
+                  "status": status}
+        if status == "completed":
+            directory = os.path.join(self.output_path, iteration["folder"])
+            fields["output_bytes"] = util.get_directory_size(directory) - get_analysis_cache_size(directory)
+        if error is not None:
+            fields["error"] = error
+        self.record("finished", **fields)
+
+
+def read_journal(output_path):
+    """
+    Returns the events of the journal in the output path or an empty list if there is none. A line left incomplete
+    by a crash is skipped.
+
+    :param output_path: The output path.
+    :return: events: The events as list of dictionaries.
+    """
+    events = []
+    try:
+        with open(os.path.join(output_path, JOURNAL_FILE), 'r') as input_file:
+            for line in input_file:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    except (IOError, OSError):
+        pass
+    return events
+
+
+def get_last_events(events):
+    """
+    Returns the last start or end event of each output folder. An iteration that was started again after it had
+    completed replaced the published output, so only its last event counts.
+
+    :param events: The events of the journal.
+    :return: last_events: A dictionary with the output folder names as keys and the events as values.
+    """
+    last_events = {}
+    for event in events:
+        if event.get("event") in ["started", "finished"]:
+            last_events[event["folder"]] = event
+    return last_events
+
+
+def verify_output(output_path, event):
+    """
+    Returns true if the published output of a completed iteration is complete and unchanged: the manifest of the
+    output folder matches the fingerprint and the folder has the recorded size. The caches of the analysis tools are
+    not counted, see get_analysis_cache_size.
+
+    :param output_path: The output path.
+    :param event: The "finished" event of the iteration.
+    :return: verified: True if the output is verified.
+    """
+    directory = os.path.join(output_path, event["folder"])
+    manifest = cache.read_manifest(directory)
+    if manifest is None or manifest.get("fingerprint") != event["fingerprint"] or \
+            manifest.get("folder") != event["folder"]:
+        return False
+    size = util.get_directory_size(directory) - get_analysis_cache_size(directory)
+    return size == event.get("output_bytes")
+
+
+def get_analysis_cache_size(directory):
+    """
+    Returns the size of the files the analysis tools add to a published output folder: the metrics sidecar and the
+    image pyramids next to the FITS files.
+
+    :param directory: The output folder.
+    :return: size: The size in bytes.
+    """
+    size = 0
+    metrics_file = os.path.join(directory, cache.METRICS_FILE)
+    if os.path.isfile(metrics_file):
+        size += os.path.getsize(metrics_file)
+    fits_directory = os.path.join(directory, "FITS_Files")
+    if os.path.isdir(fits_directory):
+        for name in os.listdir(fits_directory):
+            path = os.path.join(fits_directory, name)
+            if cache.PYRAMID_SUFFIX in name and os.path.isdir(path):
+                size += util.get_directory_size(path)
+    return size
+
+
+def prepare_resume(output_path, iterations):
+    """
+    Determines the iterations of a plan that were completed by earlier sweeps and whose output is verified. Output
+    folders of the other iterations that have no valid manifest and were started by a sweep recorded in the journal
+    are partial outputs of crashed iterations and are removed, so these iterations are retried from a clean state.
+    Folders without manifest that the journal does not know, e.g. outputs of older versions or other tools with the
+    same name, are reported and kept.
+
+    :param output_path: The output path.
+    :param iterations: The planned iterations, see planner.create_plan.
+    :return: completed: A dictionary with the numbers of the completed iterations as keys and their results as
+                        values, see pipeline.run_iteration.
+    """
+    last_events = get_last_events(read_journal(output_path))
+    completed = {}
+    for iteration in iterations:
+        event = last_events.get(iteration["folder"])
+        if event is not None and event["event"] == "finished" and event.get("status") == "completed" and \
+                event["fingerprint"] == iteration["fingerprint"] and verify_output(output_path, event):
+            completed[iteration["number"]] = {"folder": iteration["folder"],
+                                              "parameter": iteration["parameter"],
+                                              "index": iteration["index"],
+                                              "fingerprint": iteration["fingerprint"],
+                                              "cached": True,
+                                              "resumed": True,
+                                              "elapsed": 0.0}
+            continue
+        directory = os.path.join(output_path, iteration["folder"])
+        if not os.path.isdir(directory) or cache.read_manifest(directory) is not None:
+            continue
+        if event is None:
+            sys.stderr.write("Keeping output folder that is not recorded in the journal: " + directory + "\n")
+        else:
+            sys.stderr.write("Removing partial output of an interrupted iteration: " + directory + "\n")
+            shutil.rmtree(directory, ignore_errors=True)
+    return completed
@@ -0,0 +1,166 @@
+import os
+import Pipeline.workspace as workspace
+
+
+def get_params_settings(model):
+    """
+    Returns extracted general setting parameters as a dictionary from the model.
+    Parameter keys: "mode", "sm", "output-path", "antennalist", "var_param_set", "processes", "cache", "resume",
+    "scratch", "retention", "fits_compression", "fits_quantize_level", "fits_tile", "sm_backend",
+    "sources_catalog".
+
+    :param model: The input model from the GUI.
+    :return: parameter_settings: A set of parameters for general settings extracted from the model as dictionary.
+    """
+    parameters_settings = {"mode": model.mode,
+                           "sm": model.sm,
+                           "telescope": float(model.telescope_diameters[model.telescope]),
+                           "output_path": model.output_path,
+                           "antennalist": model.antennalist,
+                           "var_param_set": model.var_param_set,
+                           "processes": int(model.processes),
+                           "cache": model.use_cache,
+                           "resume": model.resume,
+                           "scratch": workspace.get_scratch_dir(model.scratch),
+                           "retention": model.retention,
+                           "fits_compression": model.fits_compression,
+                           "fits_quantize_level": float(model.fits_quantize_level),
+                           "fits_tile": int(model.fits_tile),
+                           "sm_backend": model.sm_backend,
+                           "sources_catalog": os.path.abspath(model.sources_catalog) if model.sources_catalog else ""
+                           }
+    return parameters_settings
+
+
+def get_params_skymodel(model):
+    """
+    Returns extracted sky-model parameters as a dictionary from the model.
+    Parameter keys: "sm_flux", "sm_fluxunit", "sm_polarization", "sm_direction_ra", "sm_direction_dec", "sm_shape",
+    "sm_majoraxis", "sm_minoraxis", "sm_positionangle", "sm_frequency", "sm_index", "sm_spectrumtype", "sm_label",
+    "component_frequency", "frequency_increment", "sm_cellsize", "sm_size".
+
+    :param model: The input model from the GUI.
+    :return: parameter_skymodel: A set of sky-model parameters from the model as dictionary.
+    """
+    df = model.fixed_params_sm
+    parameters_skymodel = {"sm_flux": float(df[df["Name"] == 'sm_flux']["Value"].squeeze()),
+                           "sm_fluxunit": df[df["Name"] == 'sm_fluxunit']["Value"].squeeze(),
+                           "sm_polarization": df[df["Name"] == 'sm_polarization']["Value"].squeeze(),
+                           "sm_direction_ra": float(df[df["Name"] == 'sm_direction_ra']["Value"].squeeze()),
+                           "sm_direction_dec": float(df[df["Name"] == 'sm_direction_dec']["Value"].squeeze()),
+                           "sm_shape": df[df["Name"] == 'sm_shape']["Value"].squeeze(),
+                           "sm_majoraxis": df[df["Name"] == 'sm_majoraxis']["Value"].squeeze() +
+                                           df[df["Name"] == 'sm_majoraxis'][
+                                               "Units"].squeeze(),
+                           "sm_minoraxis": df[df["Name"] == 'sm_minoraxis']["Value"].squeeze() +
+                                           df[df["Name"] == 'sm_minoraxis'][
+                                               "Units"].squeeze(),
+                           "sm_positionangle": df[df["Name"] == 'sm_positionangle']["Value"].squeeze() +
+                                               df[df["Name"] == 'sm_positionangle'][
+                                                   "Units"].squeeze(),
+                           "sm_frequency": df[df["Name"] == 'sm_frequency']["Value"].squeeze() +
+                                           df[df["Name"] == 'sm_frequency'][
+                                               "Units"].squeeze(),
+                           "sm_index": float(df[df["Name"] == 'sm_index']["Value"].squeeze()),
+                           "sm_spectrumtype": df[df["Name"] == 'sm_spectrumtype']["Value"].squeeze(),
+                           "sm_label": df[df["Name"] == 'sm_label']["Value"].squeeze(),
+                           "component_frequency": df[df["Name"] == 'component_frequency']["Value"].squeeze() +
+                                                  df[df["Name"] == 'component_frequency'][
+                                                      "Units"].squeeze(),
+                           "frequency_increment": df[df["Name"] == 'frequency_increment']["Value"].squeeze() +
+                                                  df[df["Name"] == 'frequency_increment'][
+                                                      "Units"].squeeze(),
+                           "sm_cellsize": df[df["Name"] == 'sm_cellsize']["Value"].squeeze() +
+                                          df[df["Name"] == 'sm_cellsize'][
+                                              "Units"].squeeze(),
+                           "sm_size": int(df[df["Name"] == "sm_size"]["Value"].squeeze())
+                           }
+
+    return parameters_skymodel
+
+
+def get_params_sources(model):
+    """
+    Returns extracted source parameters for each source as a list of dictionaries from the model.
+    Parameter keys: "sp_flux", "sp_fluxunit", "sp_direction_ra", "sp_direction_dec", "sp_shape", "sp_frequency".
+
+    :param model: The input model from the GUI.
+    :return: parameter_sources: A set of source parameters from the model as dictionary.
+    """
+    df = model.fixed_params_sp
+    parameters_sources = []
+    for i in range(1, len(df.columns)):
+        source = {"Name": df.columns[i],
+                  "sp_flux": float(df[df["Parameter"] == "sp_flux"][df.columns[i]].squeeze()),
+                  "sp_fluxunit": df[df["Parameter"] == "sp_fluxunit"][df.columns[i]].squeeze(),
+                  "sp_direction_ra": float(df[df["Parameter"] == "sp_direction_ra"][df.columns[i]].squeeze()),
+                  "sp_direction_dec": float(df[df["Parameter"] == "sp_direction_dec"][df.columns[i]].squeeze()),
+                  "sp_shape": df[df["Parameter"] == "sp_shape"][df.columns[i]].squeeze(),
+                  "sp_majoraxis": df[df["Parameter"] == "sp_majoraxis"][df.columns[i]].squeeze(),
+                  "sp_minoraxis": df[df["Parameter"] == "sp_minoraxis"][df.columns[i]].squeeze(),
+                  "sp_positionangle": df[df["Parameter"] == "sp_positionangle"][df.columns[i]].squeeze(),
+                  "sp_frequency": df[df["Parameter"] == "sp_frequency"][df.columns[i]].squeeze() +
+                                  df[df["Parameter"] == 'sp_frequency_unit'][df.columns[i]].squeeze(),
+                  }
+        parameters_sources.append(source)
+    return parameters_sources
+
+
+def get_params_simobserve(model):
+    """
+    Returns extracted simobserve parameters from the model.
+    Parameter keys: "incenter", "compwidth", "incell", "inwidth", "integration", "totaltime", "mapsize", "thermalnoise",
+    "t_ground", "t_sky", "leakage", "t_seed", "t_user_pwv", "tau0", "frequency_increment", "sm_cellsize", "sm_size".
+
+    :param model: The input model from the GUI.
+    :return: parameter_simobserve: A set of simobserve parameters from the model as dictionary.
+    """
+    df = model.fixed_params_sim
+    parameters_simobserve = {"incenter": df[df["Name"] == 'incenter']["Value"].squeeze() + df[df["Name"] == 'incenter'][
+        "Units"].squeeze(),
+                             "compwidth": df[df["Name"] == 'compwidth']["Value"].squeeze() +
+                                          df[df["Name"] == 'compwidth'][
+                                              "Units"].squeeze(),
+                             "incell": df[df["Name"] == 'incell']["Value"].squeeze() + df[df["Name"] == 'incell'][
+                                 "Units"].squeeze(),
+                             "inwidth": df[df["Name"] == 'inwidth']["Value"].squeeze() + df[df["Name"] == 'inwidth'][
+                                 "Units"].squeeze(),
+                             "integration": df[df["Name"] == 'integration']["Value"].squeeze() +
+                                            df[df["Name"] == 'integration'][
+                                                "Units"].squeeze(),
+                             "totaltime": df[df["Name"] == 'totaltime']["Value"].squeeze() +
+                                          df[df["Name"] == 'totaltime'][
+                                              "Units"].squeeze(),
+                             "mapsize": df[df["Name"] == 'mapsize']["Value"].squeeze() +
+                                        df[df["Name"] == 'mapsize'][
+                                            "Units"].squeeze(),
+                             "thermalnoise": df[df["Name"] == 'thermalnoise']["Value"].squeeze(),
+                             "t_ground": float(df[df["Name"] == 't_ground']["Value"].squeeze()),
+                             "t_sky": float(df[df["Name"] == 't_sky']["Value"].squeeze()),
+                             "leakage": float(df[df["Name"] == 'leakage']["Value"].squeeze()),
+                             "t_seed": int(df[df["Name"] == 't_seed']["Value"].squeeze()),
+                             "t_user_pwv": float(df[df["Name"] == 't_user_pwv']["Value"].squeeze()),
+                             "tau0": float(df[df["Name"] == 'tau0']["Value"].squeeze())
+                             }
+    return parameters_simobserve
+
+
+def get_params_simanalyze(model):
+    """
+    Returns extracted simanalyze parameters from the model.
+    Parameter keys: "niter", "imsize", "weighting", "cell", "stokes", "threshold".
+
+    :param model: The input model from the GUI.
+    :return: parameter_simanalyze: A set of simanalyze parameters from the model as dictionary.
+    """
+    df = model.fixed_params_sim
+    imsize = int(df[df["Name"] == 'analyze_imsize']["Value"].squeeze())
+    parameters_simanalyze = {"analyze_niter": int(df[df["Name"] == 'analyze_niter']["Value"].squeeze()),
+                             "analyze_imsize": [imsize, imsize],
+                             "analyze_weighting": df[df["Name"] == 'analyze_weighting']["Value"].squeeze(),
+                             "analyze_cell": df[df["Name"] == 'analyze_cell']["Value"].squeeze() +
+                                             df[df["Name"] == 'analyze_cell']["Units"].squeeze(),
+                             "analyze_stokes": df[df["Name"] == 'analyze_stokes']["Value"].squeeze(),
+                             "analyze_threshold": df[df["Name"] == 'analyze_threshold']["Value"].squeeze() +
+                                                  df[df["Name"] == 'analyze_threshold']["Units"].squeeze()}
+    return parameters_simanalyze
@@ -1,94 +1,290 @@
-from init_tools import cltool, iatool, qatool
+import glob
 import os
-import math
-import numpy as np
-import copy
+import pandas as pd
 import timeit
-import pickle
+import traceback
 import Pipeline.util as util
+import Pipeline.haslam as haslam
+import Pipeline.casabackend as casabackend
+import Pipeline.workspace as workspace
+import Pipeline.cache as cache
+import Pipeline.stages as stages
+import Pipeline.progress as progress
+import Pipeline.instrumentation as instrumentation
+import Pipeline.estimator as estimator
+import Pipeline.planner as planner
+import Pipeline.journal as journal
+import Pipeline.publish as publish
+import Pipeline.retention as retention
+import Pipeline.fitsexport as fitsexport
+import Pipeline.rasterizer as rasterizer
+import Pipeline.catalog as catalog
+from Pipeline.parameters import get_params_settings, get_params_skymodel, get_params_sources, \
+    get_params_simobserve, get_params_simanalyze
 import shutil
 import sys
-from astropy.io import fits
 
 
-def run(model):
+def run(model, channel=None, plan=None):
     """
     Starts the AppPipeline with the given model as input to either simulate a single observation or multiple iterations
     with varying parameters. If there are multiple iterations, for each value of the varying parameters an iteration
-    will be executed.
+    will be executed. The iterations are taken from the plan of the model, see planner.create_plan. The sweep and
+    each iteration are recorded in the journal of the output path. In resume mode, iterations completed by earlier
+    sweeps with verified output are skipped and partial outputs of interrupted iterations are removed, see
+    journal.prepare_resume. If a scratch directory is configured, the iterations run in workspaces inside it and
+    only their outputs are published to the output path, atomically, see publish.staged_output. These iterations
+    always run in worker processes, see run_parallel, so the working directory of the calling process, e.g. of the
+    GUI, is never changed. Directories left by crashed runs are removed and the free space is checked against the
+    estimated footprint before the first iteration. The aggregated stage timings of all iterations are written to the
+    output path and added to the timing history of the runtime estimator.
 
     :param model: The input model from GUI.
+    :param channel: A progress.ProgressChannel the progress is reported to. If the run is cancelled through it,
+                    progress.RunCancelled is raised after the current stage.
+    :param plan: The planner.SweepPlan of the model, created if not given.
+    :return: results: A list with the result of each iteration. See run_iteration for detailed content.
     """
-    parameters_settings = get_params_settings(model)
-    parameters_skymodel = get_params_skymodel(model)
-    parameters_simobserve = get_params_simobserve(model)
-    parameters_simanalyze = get_params_simanalyze(model)
-    parameters_sources = get_params_sources(model)
+    if plan is None:
+        plan = planner.create_plan(model)
+    plan.settings["output_path"] = os.path.abspath(plan.settings["output_path"])
+    for name in publish.remove_stale_staging(plan.settings["output_path"]):
+        sys.stderr.write("Removed staging directory of an interrupted publication: " + name + "\n")
+    if plan.settings["scratch"] and not os.path.isdir(plan.settings["scratch"]):
+        os.makedirs(plan.settings["scratch"])
+    for directory in set([os.getcwd(), plan.settings["scratch"]]):
+        for name in workspace.remove_stale_directories(directory):
+            sys.stderr.write("Removed directory left by a crashed run: " + os.path.join(directory, name) + "\n")
+    completed = {}
+    if plan.settings["resume"]:
+        completed = journal.prepare_resume(plan.settings["output_path"], plan.iterations)
+    check_free_space(plan, completed)
+    sweep_journal = journal.Journal(plan.settings["output_path"])
+    sweep_journal.start_sweep(plan, plan.settings["resume"])
+
+    results = []
+    try:
+        if model.mode == "Multiple Runs":
+            results = multi_run(model, plan, channel, sweep_journal, completed)
+
+        elif model.mode == "Single Run":
+            iteration = plan.iterations[0]
+            if channel is not None:
+                channel.start(1)
+            if plan.settings["scratch"] and 0 not in completed:
+                results = run_parallel(model, plan.settings, [iteration], None, channel, sweep_journal)
+                if "error" in results[0]:
+                    raise RuntimeError("The iteration failed:\n" + results[0]["error"])
+            else:
+                results = [completed[0] if 0 in completed else
+                           execute_iteration(model, plan.settings, iteration, None, channel, sweep_journal)]
+                if channel is not None:
+                    channel.finish_iteration(results[0])
+    except progress.RunCancelled:
+        sweep_journal.finish_sweep("cancelled")
+        raise
+    except Exception:
+        sweep_journal.finish_sweep("failed")
+        raise
+    sweep_journal.finish_sweep("failed" if any("error" in result for result in results) else "completed")
+    instrumentation.write_sweep_timings(plan.settings["output_path"], sweep_journal.sweep, results)
+    estimator.append_history(estimator.HISTORY_FILE, results)
+    return results
+
+
+def check_free_space(plan, completed=None):
+    """
+    Checks the free space of the scratch directory and the output path against the estimated disk footprint of the
+    iterations of a plan that will be computed. The iterations running at the same time need their footprint in the
+    scratch directory, all outputs are published to the output path.
 
-    if model.mode == "Multiple Runs":
-        multi_run(model, parameters_settings, parameters_skymodel, parameters_sources, parameters_simobserve,
-                  parameters_simanalyze)
+    :param plan: The planner.SweepPlan of the run.
+    :param completed: The results of the iterations that are skipped, by iteration number.
+    :raises workspace.InsufficientSpaceError: If there is not enough free space.
+    """
+    completed = completed or {}
+    footprints = sorted([iteration["estimated_disk"] for iteration in plan.iterations
+                         if iteration["computed"] and iteration["number"] not in completed], reverse=True)
+    workspace.check_free_space(plan.settings["scratch"], plan.settings["output_path"],
+                               sum(footprints[:max(1, plan.settings["processes"])]), sum(footprints))
 
-    elif model.mode == "Single Run":
-        run_iteration(model, parameters_settings, parameters_skymodel, parameters_sources,
-                      parameters_simobserve, parameters_simanalyze)
 
+def multi_run(model, plan, channel=None, sweep_journal=None, completed=None):
+    """
+    Executes the iterations of a plan. First, a sky-model will be created and sources added, then the observation will
+    be simulated and analyzed. Output data will be moved to the provided output path from the model. The plan holds an
+    iteration for each value for each varying parameter. If more than one process or a scratch directory is
+    configured, the iterations are executed in worker processes, each in its own workspace. Stage artifacts are
+    shared between the iterations of the sweep, so for example an imaging-only sweep simulates the observation once.
 
-def multi_run(model, parameters_settings, parameters_skymodel, parameters_sources, parameters_simobserve,
-              parameters_simanalyze):
+    :param model: The input model from the GUI.
+    :param plan: The planner.SweepPlan of the model.
+    :param channel: A progress.ProgressChannel the progress is reported to.
+    :param sweep_journal: The journal.Journal the iterations are recorded in.
+    :param completed: The results of the iterations that are skipped, by iteration number. See
+                      journal.prepare_resume.
+    :return: results: A list with the result of each iteration. See run_iteration for detailed content.
     """
-    Executes multiple iterations with given parameter sets. First, a sky-model will be created and sources added, then
-    the observation will be simulated and analyzed. Output data will be moved to the provided output path from the
-    model. This process will be done for each value for each varying parameter. If source parameters occur in the
-    varying parameters, sources will be adjusted separately.
+    parameters_settings = plan.settings
+    completed = completed or {}
+    iterations = [iteration for iteration in plan.iterations if iteration["number"] not in completed]
+    if channel is not None:
+        channel.start(len(plan.iterations), parameters_settings["processes"])
+        for number in sorted(completed):
+            channel.finish_iteration(completed[number])
+    results = dict(completed)
+    artifacts = stages.ArtifactStore(workspace.create_directory(parameters_settings["scratch"] or os.getcwd(),
+                                                                "artifacts_"))
+    try:
+        if iterations and (parameters_settings["scratch"] or
+                           (parameters_settings["processes"] > 1 and len(iterations) > 1)):
+            # duplicates are served from the output of their first iteration, so they run after all others instead
+            # of computing the same output concurrently
+            duplicates = [iteration for iteration in iterations
+                          if iteration["duplicate_of"] is not None and not iteration["computed"]]
+            for group in [[iteration for iteration in iterations if iteration not in duplicates], duplicates]:
+                if group:
+                    computed = run_parallel(model, parameters_settings, group, artifacts, channel, sweep_journal)
+                    results.update(zip([iteration["number"] for iteration in group], computed))
+        else:
+            for iteration in iterations:
+                results[iteration["number"]] = execute_iteration(model, parameters_settings, iteration, artifacts,
+                                                                 channel, sweep_journal)
+                if channel is not None:
+                    channel.finish_iteration(results[iteration["number"]])
+        return [results[iteration["number"]] for iteration in plan.iterations]
+    finally:
+        artifacts.remove()
+
+
+# Arguments of the iterations executed by run_parallel. Set before the worker processes are forked, so that the
+# model with its CASA tasks is inherited instead of pickled, see util.get_fork_context.
+_parallel_context = {}
+
+
+def run_parallel(model, parameters_settings, iterations, artifacts=None, channel=None, sweep_journal=None):
+    """
+    Executes the given iterations in a pool of worker processes. The number of processes is taken from the settings.
+    Each iteration runs in a private workspace inside the scratch directory or the current directory, so the
+    iterations do not share the Skymodel and Taskfiles directories or the *.last files. Only the worker processes
+    change into the workspaces, the working directory of the calling process is kept. Outputs are moved to the
+    output path as in a serial run. A failing iteration does not stop the others; its traceback is written to stderr
+    and returned in its result. Finished iterations are reported to the progress channel as they complete. The stages
+    of the workers are not reported, but cancelling the run stops every worker after its current stage.
 
     :param model: The input model from the GUI.
     :param parameters_settings: Parameter set extracted from the model containing settings parameters.
                                 See get_params_settings for detailed content.
-    :param parameters_skymodel: Parameter set extracted from the model containing sky-model parameters.
-                                See get_params_skymodel for detailed content.
-    :param parameters_sources: Parameter set extracted from the model containing source parameters.
-                               See get_params_sources for detailed content.
-    :param parameters_simobserve: Parameter set extracted from the model containing simobserve parameters.
-                                  See get_params_simobserve for detailed content.
-    :param parameters_simanalyze: Parameter set extracted from the model containing simanalyze parameters.
-                                  See get_params_simanalyze for detailed content.
+    :param iterations: The planned iterations to execute. See planner.create_plan for detailed content.
+    :param artifacts: The artifact store shared by the iterations.
+    :param channel: A progress.ProgressChannel the progress is reported to.
+    :param sweep_journal: The journal.Journal the iterations are recorded in.
+    :return: results: A list with the result of each iteration in order of the given iterations. See run_iteration
+                      for detailed content.
+    """
+    parameters_settings = dict(parameters_settings)
+    parameters_settings["output_path"] = os.path.abspath(parameters_settings["output_path"])
+    _parallel_context.update({"model": model,
+                              "settings": parameters_settings,
+                              "iterations": iterations,
+                              "artifacts": artifacts,
+                              "channel": channel.create_worker_channel() if channel is not None else None,
+                              "journal": sweep_journal,
+                              "base_dir": os.getcwd()})
+    pool = util.get_fork_context().Pool(min(parameters_settings["processes"], len(iterations)),
+                                          maxtasksperchild=1)
+    results = [None] * len(iterations)
+    try:
+        for number, result in pool.imap_unordered(run_iteration_isolated, range(len(iterations)), chunksize=1):
+            results[number] = result
+            if channel is not None and "cancelled" not in result:
+                channel.finish_iteration(result)
+    finally:
+        pool.close()
+        pool.join()
+        _parallel_context.clear()
+    if channel is not None:
+        channel.check_cancelled()
+    for result in results:
+        if "error" in result:
+            sys.stderr.write("Iteration " + str(result["parameter"]) + str(result["index"]) + " failed:\n" +
+                             result["error"])
+    return results
+
+
+def run_iteration_isolated(number):
+    """
+    Executes one iteration of run_parallel inside a new workspace and removes the workspace afterwards. Runs in a
+    worker process.
+
+    :param number: The position of the iteration in the list of iterations.
+    :return: number, result: The given position and the result of the iteration, see run_iteration. If the
+                             iteration failed, the result only holds the parameter, the index and the formatted
+                             traceback as "error". If the run was cancelled, it holds the parameter, the index and
+                             "cancelled".
+    """
+    model = _parallel_context["model"]
+    parameters_settings = _parallel_context["settings"]
+    iteration = _parallel_context["iterations"][number]
+    base_dir = _parallel_context["base_dir"]
+    work_dir = workspace.create_workspace(base_dir, parameters_settings["antennalist"],
+                                          scratch_dir=parameters_settings["scratch"])
+    os.chdir(work_dir)
+    try:
+        return number, execute_iteration(model, parameters_settings, iteration, _parallel_context["artifacts"],
+                                         _parallel_context["channel"], _parallel_context["journal"])
+    except progress.RunCancelled:
+        return number, {"parameter": iteration["parameter"],
+                        "index": iteration["index"],
+                        "cancelled": True}
+    except Exception:
+        return number, {"parameter": iteration["parameter"],
+                        "index": iteration["index"],
+                        "error": traceback.format_exc()}
+    finally:
+        os.chdir(base_dir)
+        workspace.remove_workspace(work_dir)
+
+
+def execute_iteration(model, parameters_settings, iteration, artifacts=None, channel=None, sweep_journal=None):
+    """
+    Executes a planned iteration with run_iteration and records its start and end in the journal.
+
+    :param model: The input model from the GUI.
+    :param parameters_settings: Parameter set extracted from the model containing settings parameters.
+                                See get_params_settings for detailed content.
+    :param iteration: The planned iteration. See planner.create_plan for detailed content.
+    :param artifacts: The artifact store of the sweep.
+    :param channel: A progress.ProgressChannel the stages are reported to.
+    :param sweep_journal: The journal.Journal the iteration is recorded in.
+    :return: result: The result of the iteration, see run_iteration.
     """
-    parameter_sets_original = [parameters_skymodel, parameters_simobserve, parameters_simanalyze]
-    parameter_sets = copy.deepcopy(parameter_sets_original)
-    parameters_sources_original = copy.deepcopy(parameters_sources)
-
-    var_param_values = model.var_param_values_lists
-    for parameter in var_param_values.keys():
-        if "Sources" in model.var_param_set:
-            index = 0
-            for value in var_param_values[parameter]:
-                new_value = {parameter: value}
-                for source in parameters_sources:
-                    source.update(new_value)
-                run_iteration(model, parameters_settings, parameter_sets[0], parameters_sources,
-                              parameter_sets[1], parameter_sets[2], parameter, index)
-                index = index + 1
-            parameters_sources = copy.deepcopy(parameters_sources_original)
-
-        for parameter_set in parameter_sets:
-            if parameter in parameter_set.keys():
-                index = 0
-                for value in var_param_values[parameter]:
-                    new_value = {parameter: value}
-                    parameter_set.update(new_value)
-                    run_iteration(model, parameters_settings, parameter_sets[0], parameters_sources,
-                                  parameter_sets[1], parameter_sets[2], parameter, index)
-                    index = index + 1
-        parameter_sets = copy.deepcopy(parameter_sets_original)
+    if sweep_journal is not None:
+        sweep_journal.start_iteration(iteration)
+    try:
+        result = run_iteration(model, parameters_settings, iteration["skymodel"], iteration["sources"],
+                               iteration["simobserve"], iteration["simanalyze"], iteration["parameter"],
+                               iteration["index"], artifacts, channel, iteration["cache_candidates"])
+    except progress.RunCancelled:
+        if sweep_journal is not None:
+            sweep_journal.finish_iteration(iteration, "cancelled")
+        raise
+    except Exception:
+        if sweep_journal is not None:
+            sweep_journal.finish_iteration(iteration, "failed", traceback.format_exc())
+        raise
+    if sweep_journal is not None:
+        sweep_journal.finish_iteration(iteration, "completed")
+    return result
 
 
 def run_iteration(model, parameters_settings, parameters_skymodel, parameters_sources, parameters_simobserve,
-                  parameters_simanalyze, parameter="", index=""):
+                  parameters_simanalyze, parameter="", index="", artifacts=None, channel=None, cache_candidates=()):
     """
     Executes a single simulation with given parameter sets. First, a sky-model will be created and sources added, then
     the observation will be simulated and analyzed. Output data will be moved to the provided output path from the
-    model.
+    model. If an artifact store is given, stages whose inputs are unchanged since an earlier iteration of the sweep
+    reuse their artifacts.
 
     :param model: The input model from the GUI.
     :param parameters_settings: Parameter set extracted from the model containing settings parameters.
@@ -103,6 +299,17 @@ def run_iteration(model, parameters_settings, parameters_skymodel, parameters_so
                                   See get_params_simanalyze for detailed content.
     :param parameter: The parameter name of the varying parameter. Only used in multiple runs mode.
     :param index: Index of the iteration of the parameter values. Only used in multiple runs mode.
+    :param artifacts: The artifact store of the sweep. Only used in multiple runs mode.
+    :param channel: A progress.ProgressChannel the stages are reported to. If the run has been cancelled, the
+                    partial output is removed and progress.RunCancelled is raised before the next stage.
+    :param cache_candidates: The output folders that may hold the output of the iteration, see
+                             planner.create_plan. The first one with the fingerprint of the iteration is served,
+                             see cache.serve_cached_output.
+    :return: result: A dictionary with the keys "folder", "parameter", "index", "fingerprint", "cached",
+                     "elapsed" (seconds), "timings" (the stage records, see instrumentation.StageRecorder),
+                     "features" (see estimator.extract_features), "output_bytes" (size of the output folder) and
+                     "pruned_bytes" (size of the products removed by the retention policy before publishing). The
+                     stage records are also written to the output folder.
     """
     start_time = timeit.default_timer()
     if not os.path.exists('Skymodel'):
@@ -114,373 +321,240 @@ def run_iteration(model, parameters_settings, parameters_skymodel, parameters_so
                                      parameters_simobserve["inwidth"], parameters_simobserve["integration"],
                                      parameters_settings["sm"], parameter, index)
     logger, logfile = util.configure_logger(folder + "-logger")
+    recorder = instrumentation.StageRecorder(folder)
+    if channel is not None:
+        channel.start_iteration(folder)
+    fingerprint = cache.create_fingerprint(parameters_settings, parameters_skymodel, parameters_sources,
+                                           parameters_simobserve, parameters_simanalyze)
+    if parameters_settings["cache"]:
+        cached_folder = cache.find_cached_output(parameters_settings["output_path"], fingerprint, cache_candidates)
+        if cached_folder is not None:
+            logger.info("Cache hit for " + folder + " (" + fingerprint + "): serving output of " + cached_folder)
+            with recorder.measure("serve_cache", cached_folder=cached_folder):
+                cache.serve_cached_output(parameters_settings["output_path"], cached_folder, folder, parameter,
+                                          index)
+            shutil.copy2(logfile, os.path.join(parameters_settings["output_path"], folder))
+            os.remove(logfile)
+            return {"folder": folder,
+                    "parameter": parameter,
+                    "index": index,
+                    "fingerprint": fingerprint,
+                    "cached": True,
+                    "elapsed": timeit.default_timer() - start_time,
+                    "timings": recorder.records}
+        logger.info("Cache miss for " + folder + " (" + fingerprint + ")")
     if os.path.exists(folder) and os.path.isdir(folder):
         try:
             shutil.rmtree(folder)
         except:
-            os.system("mv " + folder + " junk_" + logfile[-4])
+            os.rename(folder, workspace.JUNK_PREFIX + logfile[:-4])
     for directory in os.listdir(os.getcwd()):
-        if "junk" in directory:
-            logger.warn("There is still junk left, probably from a previously crashed simulation. Please remove it "
-                        "manually from the following directory: \n" + os.getcwd())
+        if directory.startswith(workspace.JUNK_PREFIX):
+            logger.warn("There is still junk left, probably from a previously crashed simulation. It is removed at "
+                        "the start of the next run from the following directory: \n" + os.getcwd())
             break
 
     logger.info("Starting iteration for " + folder)
     logger.info("Logfile: " + logfile)
-    logger.info("Creating sky-model image")
-    create_skymodel(model.exportfits, parameters_skymodel)
-    if parameters_settings["sm"] == "Haslam-Map":
-        logger.info("Interpolating with haslam all-sky map")
-        create_haslam_map(parameters_settings, parameters_skymodel)
-    logger.info("Adding sources")
-    create_sources(parameters_sources)
-    logger.info("Starting observation")
-    run_simobserve(model.simobserve, parameters_settings, parameters_simobserve, folder)
-    logger.info("Starting analysis")
-    measurement_set = util.get_vis_string(folder, parameters_settings["antennalist"])
-    file_ext = folder + '.' + parameters_settings["antennalist"].replace("cfg", "noisy")
-    if not os.path.exists(folder + "/" + measurement_set):
-        measurement_set = measurement_set.replace(".noisy", "")
-        file_ext = file_ext.replace(".noisy", "")
-    run_simanalyze(model.simanalyze, parameters_simanalyze, parameters_skymodel, measurement_set, folder)
-
-    util.rename_casa_images(folder, file_ext)
-    create_fits_files(model.exportfits, model.imhead, folder)
-
-    logger.info("Moving output folder to " + parameters_settings["output_path"])
-    os.system('mv Skymodel/ ' + folder)
-    os.system('mv *.last Taskfiles')
-    os.system('mv Taskfiles ' + folder)
-    util.export_sources(parameters_sources, folder)
-    if os.path.exists(parameters_settings["output_path"] + "/" + folder):
+    try:
+        stages.run_stages(create_stages(model, parameters_settings, parameters_skymodel, parameters_sources,
+                                        parameters_simobserve, parameters_simanalyze, folder, logger, recorder),
+                          artifacts, folder, logger, channel, recorder)
+    except progress.RunCancelled:
+        logger.warn("Iteration cancelled: removing the partial output of " + folder)
+        for directory in [folder, "Skymodel", "Taskfiles"]:
+            shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    if channel is not None:
+        channel.report_stage("publish")
+    with recorder.measure("finalize_fits_files"):
+        provenance = {"fingerprint": fingerprint}
+        if parameter:
+            provenance.update({"parameter": parameter, "index": index})
+        for record in recorder.records:
+            provenance["wall " + record["stage"]] = round(provenance.get("wall " + record["stage"], 0.0) +
+                                                          record["wall"], 3)
+        finalize_fits_files(folder, provenance, parameters_settings)
+    output_folder = os.path.join(parameters_settings["output_path"], folder)
+    if os.path.exists(output_folder):
         logger.info("Output folder already exists. Overwriting output folder")
-        shutil.rmtree(parameters_settings["output_path"] + "/" + folder)
-    os.system('cp -RLf ' + folder + ' ' + parameters_settings["output_path"])
-    shutil.rmtree(folder)
-    elapsed = timeit.default_timer() - start_time
-    logger.info("Iteration finished: See the task files and the CASA logfile for detailed information. \n" +
-                "******************************* \n" +
-                "Time elapsed: " + str(elapsed) + "s\n" +
-                "*******************************")
-    os.system('cp -RLf ' + logfile + ' ' + parameters_settings["output_path"] + '/' + folder)
+    logger.info("Moving output folder to " + parameters_settings["output_path"])
+    with publish.staged_output(parameters_settings["output_path"], folder) as staged:
+        with recorder.measure("publish"):
+            publish.move_into(glob.glob("*.last"), "Taskfiles")
+            publish.move_into(["Skymodel", "Taskfiles"], folder)
+            util.export_sources(parameters_sources, folder)
+            pruned_bytes = retention.prune_output(folder, parameters_settings["retention"])
+            if pruned_bytes:
+                logger.info("Retention policy " + parameters_settings["retention"] + ": pruned " +
+                            str(int(pruned_bytes / 1e6)) + " MB of intermediate products")
+            publish.move_path(folder, staged)
+        recorder.write(staged)
+        elapsed = timeit.default_timer() - start_time
+        logger.info("Iteration finished: See the task files and the CASA logfile for detailed information. \n" +
+                    "******************************* \n" +
+                    "Time elapsed: " + str(elapsed) + "s\n" +
+                    "*******************************")
+        shutil.copy2(logfile, staged)
+        cache.write_manifest(staged, fingerprint, folder,
+                             {"settings": parameters_settings,
+                              "skymodel": parameters_skymodel,
+                              "sources": parameters_sources,
+                              "simobserve": parameters_simobserve,
+                              "simanalyze": parameters_simanalyze,
+                              "parameter": parameter,
+                              "index": index})
     os.remove(logfile)
-
-
-def get_params_settings(model):
-    """
-    Returns extracted general setting parameters as a dictionary from the model.
-    Parameter keys: "mode", "sm", "output-path", "antennalist", "var_param_set".
-
-    :param model: The input model from the GUI.
-    :return: parameter_settings: A set of parameters for general settings extracted from the model as dictionary.
-    """
-    parameters_settings = {"mode": model.mode,
-                           "sm": model.sm,
-                           "telescope": float(model.telescope_diameters[model.telescope]),
-                           "output_path": model.output_path,
-                           "antennalist": model.antennalist,
-                           "var_param_set": model.var_param_set
-                           }
-    return parameters_settings
-
-
-def get_params_skymodel(model):
-    """
-    Returns extracted sky-model parameters as a dictionary from the model.
-    Parameter keys: "sm_flux", "sm_fluxunit", "sm_polarization", "sm_direction_ra", "sm_direction_dec", "sm_shape",
-    "sm_majoraxis", "sm_minoraxis", "sm_positionangle", "sm_frequency", "sm_index", "sm_spectrumtype", "sm_label",
-    "component_frequency", "frequency_increment", "sm_cellsize", "sm_size".
-
-    :param model: The input model from the GUI.
-    :return: parameter_skymodel: A set of sky-model parameters from the model as dictionary.
-    """
-    df = model.fixed_params_sm
-    parameters_skymodel = {"sm_flux": float(df[df["Name"] == 'sm_flux']["Value"].squeeze()),
-                           "sm_fluxunit": df[df["Name"] == 'sm_fluxunit']["Value"].squeeze(),
-                           "sm_polarization": df[df["Name"] == 'sm_polarization']["Value"].squeeze(),
-                           "sm_direction_ra": float(df[df["Name"] == 'sm_direction_ra']["Value"].squeeze()),
-                           "sm_direction_dec": float(df[df["Name"] == 'sm_direction_dec']["Value"].squeeze()),
-                           "sm_shape": df[df["Name"] == 'sm_shape']["Value"].squeeze(),
-                           "sm_majoraxis": df[df["Name"] == 'sm_majoraxis']["Value"].squeeze() +
-                                           df[df["Name"] == 'sm_majoraxis'][
-                                               "Units"].squeeze(),
-                           "sm_minoraxis": df[df["Name"] == 'sm_minoraxis']["Value"].squeeze() +
-                                           df[df["Name"] == 'sm_minoraxis'][
-                                               "Units"].squeeze(),
-                           "sm_positionangle": df[df["Name"] == 'sm_positionangle']["Value"].squeeze() +
-                                               df[df["Name"] == 'sm_positionangle'][
-                                                   "Units"].squeeze(),
-                           "sm_frequency": df[df["Name"] == 'sm_frequency']["Value"].squeeze() +
-                                           df[df["Name"] == 'sm_frequency'][
-                                               "Units"].squeeze(),
-                           "sm_index": float(df[df["Name"] == 'sm_index']["Value"].squeeze()),
-                           "sm_spectrumtype": df[df["Name"] == 'sm_spectrumtype']["Value"].squeeze(),
-                           "sm_label": df[df["Name"] == 'sm_label']["Value"].squeeze(),
-                           "component_frequency": df[df["Name"] == 'component_frequency']["Value"].squeeze() +
-                                                  df[df["Name"] == 'component_frequency'][
-                                                      "Units"].squeeze(),
-                           "frequency_increment": df[df["Name"] == 'frequency_increment']["Value"].squeeze() +
-                                                  df[df["Name"] == 'frequency_increment'][
-                                                      "Units"].squeeze(),
-                           "sm_cellsize": df[df["Name"] == 'sm_cellsize']["Value"].squeeze() +
-                                          df[df["Name"] == 'sm_cellsize'][
-                                              "Units"].squeeze(),
-                           "sm_size": int(df[df["Name"] == "sm_size"]["Value"].squeeze())
-                           }
-
-    return parameters_skymodel
-
-
-def get_params_sources(model):
-    """
-    Returns extracted source parameters for each source as a list of dictionaries from the model.
-    Parameter keys: "sp_flux", "sp_fluxunit", "sp_direction_ra", "sp_direction_dec", "sp_shape", "sp_frequency".
-
-    :param model: The input model from the GUI.
-    :return: parameter_sources: A set of source parameters from the model as dictionary.
-    """
-    df = model.fixed_params_sp
-    parameters_sources = []
-    for i in range(1, len(df.columns)):
-        source = {"Name": df.columns[i],
-                  "sp_flux": float(df[df["Parameter"] == "sp_flux"][df.columns[i]].squeeze()),
-                  "sp_fluxunit": df[df["Parameter"] == "sp_fluxunit"][df.columns[i]].squeeze(),
-                  "sp_direction_ra": float(df[df["Parameter"] == "sp_direction_ra"][df.columns[i]].squeeze()),
-                  "sp_direction_dec": float(df[df["Parameter"] == "sp_direction_dec"][df.columns[i]].squeeze()),
-                  "sp_shape": df[df["Parameter"] == "sp_shape"][df.columns[i]].squeeze(),
-                  "sp_majoraxis": df[df["Parameter"] == "sp_majoraxis"][df.columns[i]].squeeze(),
-                  "sp_minoraxis": df[df["Parameter"] == "sp_minoraxis"][df.columns[i]].squeeze(),
-                  "sp_positionangle": df[df["Parameter"] == "sp_positionangle"][df.columns[i]].squeeze(),
-                  "sp_frequency": df[df["Parameter"] == "sp_frequency"][df.columns[i]].squeeze() +
-                                  df[df["Parameter"] == 'sm_frequency_unit'][df.columns[i]].squeeze(),
-                  }
-        parameters_sources.append(source)
-    return parameters_sources
-
-
-def get_params_simobserve(model):
-    """
-    Returns extracted simobserve parameters from the model.
-    Parameter keys: "incenter", "compwidth", "incell", "inwidth", "integration", "totaltime", "mapsize", "thermalnoise",
-    "t_ground", "t_sky", "leakage", "t_seed", "t_user_pwv", "tau0", "frequency_increment", "sm_cellsize", "sm_size".
-
-    :param model: The input model from the GUI.
-    :return: parameter_simobserve: A set of simobserve parameters from the model as dictionary.
+    return {"folder": folder,
+            "parameter": parameter,
+            "index": index,
+            "fingerprint": fingerprint,
+            "cached": False,
+            "elapsed": elapsed,
+            "timings": recorder.records,
+            "features": estimator.extract_features(parameters_settings, parameters_skymodel, parameters_sources,
+                                                   parameters_simobserve, parameters_simanalyze),
+            "output_bytes": util.get_directory_size(output_folder),
+            "pruned_bytes": pruned_bytes}
+
+
+def create_stages(model, parameters_settings, parameters_skymodel, parameters_sources, parameters_simobserve,
+                  parameters_simanalyze, folder, logger, recorder):
     """
-    df = model.fixed_params_sim
-    parameters_simobserve = {"incenter": df[df["Name"] == 'incenter']["Value"].squeeze() + df[df["Name"] == 'incenter'][
-        "Units"].squeeze(),
-                             "compwidth": df[df["Name"] == 'compwidth']["Value"].squeeze() +
-                                          df[df["Name"] == 'compwidth'][
-                                              "Units"].squeeze(),
-                             "incell": df[df["Name"] == 'incell']["Value"].squeeze() + df[df["Name"] == 'incell'][
-                                 "Units"].squeeze(),
-                             "inwidth": df[df["Name"] == 'inwidth']["Value"].squeeze() + df[df["Name"] == 'inwidth'][
-                                 "Units"].squeeze(),
-                             "integration": df[df["Name"] == 'integration']["Value"].squeeze() +
-                                            df[df["Name"] == 'integration'][
-                                                "Units"].squeeze(),
-                             "totaltime": df[df["Name"] == 'totaltime']["Value"].squeeze() +
-                                          df[df["Name"] == 'totaltime'][
-                                              "Units"].squeeze(),
-                             "mapsize": df[df["Name"] == 'mapsize']["Value"].squeeze() +
-                                        df[df["Name"] == 'mapsize'][
-                                            "Units"].squeeze(),
-                             "thermalnoise": df[df["Name"] == 'thermalnoise']["Value"].squeeze(),
-                             "t_ground": float(df[df["Name"] == 't_ground']["Value"].squeeze()),
-                             "t_sky": float(df[df["Name"] == 't_sky']["Value"].squeeze()),
-                             "leakage": float(df[df["Name"] == 'leakage']["Value"].squeeze()),
-                             "t_seed": int(df[df["Name"] == 't_seed']["Value"].squeeze()),
-                             "t_user_pwv": float(df[df["Name"] == 't_user_pwv']["Value"].squeeze()),
-                             "tau0": float(df[df["Name"] == 'tau0']["Value"].squeeze())
-                             }
-    return parameters_simobserve
-
-
-def get_params_simanalyze(model):
-    """
-    Returns extracted simanalyze parameters from the model.
-    Parameter keys: "niter", "imsize", "weighting", "cell", "stokes", "threshold".
+    Returns the stages of an iteration in order of execution: sky-model, sources, simobserve, simanalyze and FITS
+    export. The inputs of each stage are the parameters its output depends on. The steps of the stages are recorded
+    by the given recorder.
 
     :param model: The input model from the GUI.
-    :return: parameter_simanalyze: A set of simanalyze parameters from the model as dictionary.
+    :param parameters_settings: Parameter set extracted from the model containing settings parameters.
+                                See get_params_settings for detailed content.
+    :param parameters_skymodel: Parameter set extracted from the model containing sky-model parameters.
+                                See get_params_skymodel for detailed content.
+    :param parameters_sources: Parameter set extracted from the model containing source parameters.
+                               See get_params_sources for detailed content.
+    :param parameters_simobserve: Parameter set extracted from the model containing simobserve parameters.
+                                  See get_params_simobserve for detailed content.
+    :param parameters_simanalyze: Parameter set extracted from the model containing simanalyze parameters.
+                                  See get_params_simanalyze for detailed content.
+    :param folder: The output folder name.
+    :param logger: The logger of the iteration.
+    :param recorder: The instrumentation.StageRecorder of the iteration.
+    :return: stage_list: A list of stages.
     """
-    df = model.fixed_params_sim
-    imsize = int(df[df["Name"] == 'analyze_imsize']["Value"].squeeze())
-    parameters_simanalyze = {"analyze_niter": int(df[df["Name"] == 'analyze_niter']["Value"].squeeze()),
-                             "analyze_imsize": [imsize, imsize],
-                             "analyze_weighting": df[df["Name"] == 'analyze_weighting']["Value"].squeeze(),
-                             "analyze_cell": df[df["Name"] == 'analyze_cell']["Value"].squeeze() +
-                                             df[df["Name"] == 'analyze_cell']["Units"].squeeze(),
-                             "analyze_stokes": df[df["Name"] == 'analyze_stokes']["Value"].squeeze(),
-                             "analyze_threshold": df[df["Name"] == 'analyze_threshold']["Value"].squeeze() +
-                                                  df[df["Name"] == 'analyze_threshold']["Units"].squeeze()}
-    return parameters_simanalyze
-
-
-def create_skymodel(exportfits, parameters_skymodel):
+    def skymodel():
+        if parameters_settings["sm"] == "Haslam-Map":
+            # the haslam interpolation replaces the whole image, so no component is painted
+            logger.info("Creating sky-model image from haslam all-sky map")
+            with recorder.measure("create_haslam_map"):
+                create_haslam_map(parameters_settings, parameters_skymodel)
+        else:
+            logger.info("Creating sky-model image")
+            with recorder.measure("create_skymodel"):
+                create_skymodel(model.exportfits, parameters_skymodel, parameters_settings["sm_backend"])
+
+    def sources():
+        logger.info("Adding sources")
+        with recorder.measure("create_sources"):
+            catalog_sources = catalog.load_catalog_sources(parameters_settings, parameters_skymodel,
+                                                           parameters_simobserve)
+            if catalog_sources is not None:
+                logger.info("Adding " + str(len(catalog_sources)) + " catalog sources within the field")
+            create_sources(parameters_sources, catalog_sources)
+
+    def simobserve():
+        logger.info("Starting observation")
+        with recorder.measure("run_simobserve"):
+            run_simobserve(model.simobserve, parameters_settings, parameters_simobserve, folder)
+
+    def simanalyze():
+        logger.info("Starting analysis")
+        measurement_set = util.get_vis_string(folder, parameters_settings["antennalist"])
+        file_ext = folder + '.' + parameters_settings["antennalist"].replace("cfg", "noisy")
+        if not os.path.exists(folder + "/" + measurement_set):
+            measurement_set = measurement_set.replace(".noisy", "")
+            file_ext = file_ext.replace(".noisy", "")
+        with recorder.measure("run_simanalyze"):
+            run_simanalyze(model.simanalyze, parameters_simanalyze, parameters_skymodel, measurement_set, folder)
+        with recorder.measure("rename_casa_images"):
+            util.rename_casa_images(folder, file_ext)
+
+    def fits_files():
+        with recorder.measure("create_fits_files"):
+            create_fits_files(model.exportfits, folder)
+
+    sources_inputs = {"sources": parameters_sources}
+    if parameters_settings["sources_catalog"]:
+        # the catalog sources within the field depend on the pointing, the beam and the map size
+        sources_inputs.update({"sources_catalog_sha1": cache.hash_file(parameters_settings["sources_catalog"]),
+                               "telescope": parameters_settings["telescope"],
+                               "skymodel": parameters_skymodel,
+                               "mapsize": parameters_simobserve["mapsize"]})
+    stage_list = [stages.Stage("skymodel", {"sm": parameters_settings["sm"],
+                                            "sm_backend": parameters_settings["sm_backend"],
+                                            "telescope": parameters_settings["telescope"],
+                                            "skymodel": parameters_skymodel}, skymodel),
+                  stages.Stage("sources", sources_inputs, sources),
+                  stages.Stage("simobserve", {"antennalist": parameters_settings["antennalist"],
+                                              "antennalist_sha1": cache.hash_antenna_file(
+                                                  parameters_settings["antennalist"]),
+                                              "simobserve": parameters_simobserve}, simobserve,
+                               depends=("skymodel", "sources")),
+                  stages.Stage("simanalyze", {"simanalyze": parameters_simanalyze,
+                                              "direction": [parameters_skymodel["sm_direction_ra"],
+                                                            parameters_skymodel["sm_direction_dec"]]}, simanalyze,
+                               depends=("simobserve",)),
+                  stages.Stage("fits_files", {}, fits_files, depends=("simanalyze",))]
+    return stage_list
+
+
+def create_skymodel(exportfits, parameters_skymodel, backend=rasterizer.DEFAULT_BACKEND):
     """
     Creates a sky-model CASA image out from given parameters and exports it as FITS file using the CASA task exportfits.
     To create the CASA image, the CASA tools componentlist, coordinate system, image analysis and quanta. See
     CASA documentation for further information: https://casa.nrao.edu/casadocs
+    With the numpy backend the component is rasterized and written as FITS file without CASA, see rasterizer.
 
     :param exportfits: The CASA task exportfits
     :param parameters_skymodel: Parameter set extracted from the model containing sky-model parameters.
                                 See get_params_skymodel for detailed content.
+    :param backend: The sky-model backend, see rasterizer.BACKENDS.
     """
-    cl = cltool()
-    ia = iatool()
-    qa = qatool()
-
-    ra = util.convert_deg_to_hour(parameters_skymodel["sm_direction_ra"])
-    dec = util.convert_deg_to_dms(parameters_skymodel["sm_direction_dec"])
-    direction = util.concat_ra_dec(ra, dec)
-    sm_image = 'Skymodel/skymodel.im'
-    sm_size = [parameters_skymodel["sm_size"], parameters_skymodel["sm_size"], 1, 1]
-    sm_cellsize = parameters_skymodel["sm_cellsize"]
-    sm_frq = parameters_skymodel["sm_frequency"]
-    sm_frq_inc = parameters_skymodel["frequency_increment"]
-    sm_fits = 'Skymodel/skymodel.fits'
-
-    # closes any open component lists, if any.
-    cl.done()
-    cl.addcomponent(flux=parameters_skymodel["sm_flux"],
-                    fluxunit=parameters_skymodel["sm_fluxunit"],
-                    polarization=parameters_skymodel["sm_polarization"],
-                    dir=direction,
-                    shape=parameters_skymodel["sm_shape"],
-                    majoraxis=parameters_skymodel["sm_majoraxis"],
-                    minoraxis=parameters_skymodel["sm_minoraxis"],
-                    positionangle=parameters_skymodel["sm_positionangle"],
-                    freq=parameters_skymodel["component_frequency"],
-                    spectrumtype=parameters_skymodel["sm_spectrumtype"],
-                    index=parameters_skymodel["sm_index"],
-                    label=parameters_skymodel["sm_label"])
-
-    # creates a new, empty CASA image with the name and dimensions given.
-    ia.fromshape(sm_image, sm_size, overwrite=True)
-    # gets the coordinate system of the image.
-    cs = ia.coordsys()
-    # defines the units of the four axes of the new CASA image.
-    cs.setunits(["rad", "rad", "", "Hz"])
-    # will be the cell size and units in this CASA image.
-    cell_rad = qa.convert(qa.quantity(sm_cellsize), "rad")["value"]
-    # tells CASA that RA increases to the right, Dec increases going up, and, a few lines later,
-    cs.setincrement([-cell_rad, cell_rad], "direction")
-    # sets the center of the image in RA, Dec, and frequency.
-    cs.setreferencevalue([qa.convert(ra, "rad")["value"], qa.convert(dec, "rad")["value"]], type="direction")
-    cs.setreferencevalue(sm_frq, "spectral")
-    # tells CASA with of the one channel.
-    cs.setincrement(sm_frq_inc, "spectral")
-    # puts the coordinates and frequencies into the image header.
-    ia.setcoordsys(cs.torecord())
-    # defines the brightness unit (Jy per pixel) of the CASA image.
-    ia.setbrightnessunit("Jy/pixel")
-    # puts the component into the image.
-    ia.modify(cl.torecord(), subtract=False)
-    exportfits(imagename=sm_image,
-               fitsimage=sm_fits,
-               overwrite=True)
+    if backend == "numpy":
+        rasterizer.write_skymodel(parameters_skymodel, 'Skymodel/skymodel.fits')
+        return
+    casabackend.create_skymodel_image(exportfits, parameters_skymodel)
 
 
 def create_haslam_map(parameters_settings, parameters_skymodel):
     """
-    Extracts data from given slice from the haslam all-sky map and replaces the data column of the sky-model FITS with
-    it. If the beam size is bigger than 1 degree, interpolation with the haslam map of all pixels of the sky-model will
-    be done, else only for the element in the phase center.
+    Creates the sky-model FITS file of the Haslam-Map mode with data interpolated from the haslam all-sky map. The
+    header is the one of the CASA sky-model image, see rasterizer.create_header, and the file is written once, without
+    creating a CASA image first.
 
     :param parameters_settings: Parameter set extracted from the model containing settings parameters.
                                 See get_params_settings for detailed content.
     :param parameters_skymodel: Parameter set extracted from the model containing sky-model parameters.
                                 See get_params_skymodel for detailed content.
     """
-    ra_rad = parameters_skymodel["sm_direction_ra"] * math.pi / 180
-    dec_rad = parameters_skymodel["sm_direction_dec"] * math.pi / 180
-    size = [parameters_skymodel["sm_size"], parameters_skymodel["sm_size"]]
-    cellsize = parameters_skymodel["sm_cellsize"]
-    sm_freq = parameters_skymodel["sm_frequency"]
-    del_, cellsize_unit = util.get_decimal_from_string(cellsize)
-    if cellsize_unit == "arcmin":
-        del_ = del_ * 60
-    elif cellsize_unit == "arcsec":
-        pass
-    else:
-        raise ValueError(cellsize_unit + " is invalid as units for cellsize. Use arcmin or arcsec.")
-
-    freq, freq_unit = util.get_decimal_from_string(sm_freq)
-    freq = util.transform_frequency(freq, freq_unit)
-
-    dish_diam = parameters_settings["telescope"]
-    beam_size = util.calculate_beam_size(freq, dish_diam)
-    ra_array = np.linspace(-1, 1, size[0]) * del_ * (1 / 3600 * np.pi / 180) + ra_rad
-    dec_array = np.linspace(-1, 1, size[1]) * del_ * (1 / 3600 * np.pi / 180) + dec_rad
-    # n must not be smaller than beam_size
-    n = 100
-    # haslam_gal is temperature, ra_dec is ra dec grid
-    haslam_gal, spec_index, gal_lat, gal_lon, haslam_ra, haslam_dec = pickle.load(
-        open('Skymaps/haslam_spec_gal_guzman.p', 'r'))
-    # index of the array that is provided for the given direction
-    idx_c = util.find_index_of_nearest_xy(haslam_ra, haslam_dec, ra_rad, dec_rad)
-    tb_sky = np.zeros((size[0], size[1]))
-    spec = np.zeros((size[0], size[1]))
-    if beam_size > 1:
-        start_time = timeit.default_timer()
-        for i in range(size[0]):
-            perc = float(i) / size[0] * 100
-            for j in range(size[1]):
-                idx = util.find_index_of_nearest_xy(haslam_ra[idx_c[0] - n:idx_c[0] + n, idx_c[1] - n:idx_c[1] + n],
-                                                    haslam_dec[idx_c[0] - n:idx_c[0] + n, idx_c[1] - n:idx_c[1] + n],
-                                                    ra_array[i], dec_array[j])
-                tb_sky[i, j] = haslam_gal[idx_c[0] - n + idx[0], idx_c[1] - n + idx[1]]
-                spec[i, j] = spec_index[idx_c[0] - n + idx[0], idx_c[1] - n + idx[1]]
-
-            sys.stdout.write('Interpolation progress: [%d%%]\r' % perc)
-            sys.stdout.flush()
-        elapsed = timeit.default_timer() - start_time
-        sys.stdout.write("elapsed: " + str(elapsed))
-        tb_sky = np.array(tb_sky)
-    else:
-        # interpolation of only one element (phase center direction)
-        # instead of a snippet of the haslam map?
-        tb_sky = tb_sky + haslam_gal[idx_c[0], idx_c[1]]
-        spec = spec + spec_index[idx_c[0], idx_c[1]]
-    tb_sky = tb_sky * (freq / 0.408) ** (-spec)
-    tb_sky = tb_sky.reshape(1, 1, size[0], size[1])
-    # Convert Temperature in Kelvin to Flux (Jy/pixel)
-    flux_sky = (tb_sky / (1.222 * 10 ** 3) * freq ** 2 * (del_ * del_)) / 1000
-
-    # Replace data column of the sky-model fits with the haslam interpolation.
-    with fits.open('Skymodel/skymodel.fits', mode='update') as skymodel_fits:
-        skymodel_fits[0].data = flux_sky
-        skymodel_fits.flush()
-
-
-def create_sources(parameters_sources):
+    flux_sky = haslam.get_haslam_flux(parameters_settings, parameters_skymodel)
+    rasterizer.write_skymodel(parameters_skymodel, 'Skymodel/skymodel.fits', flux_sky)
+
+
+def create_sources(parameters_sources, catalog_sources=None):
     """
-    Creates a new component list and adds sources from given parameters using the componentlist CASA tool.
+    Creates a new component list and adds sources from given parameters and catalog using the componentlist CASA tool.
+    The directions of all sources are formatted at once before the component list is opened.
 
     :param parameters_sources: Parameter set extracted from the model containing source parameters.
                                See get_params_sources for detailed content.
+    :param catalog_sources: Sources read from a catalog, see catalog.load_catalog_sources, or None.
     """
-    cl = cltool()
-
-    os.system('rm -rf Skymodel/point.cl')
-    cl.done()
-    for source in parameters_sources:
-        ra = util.convert_deg_to_hour(source["sp_direction_ra"])
-        dec = util.convert_deg_to_dms(source["sp_direction_dec"])
-        direction = util.concat_ra_dec(ra, dec)
-        cl.addcomponent(flux=source["sp_flux"],
-                        fluxunit=source["sp_fluxunit"],
-                        dir=direction,
-                        shape=source["sp_shape"],
-                        majoraxis=source["sp_majoraxis"],
-                        minoraxis=source["sp_minoraxis"],
-                        positionangle=source["sp_positionangle"],
-                        freq=source["sp_frequency"],
-                        label=source["Name"])
-    cl.rename("Skymodel/point.cl")
-    cl.done()
+    sources = catalog.get_sources_frame(parameters_sources)
+    if catalog_sources is not None:
+        sources = pd.concat([sources, catalog_sources], ignore_index=True)
+    directions = catalog.get_directions(sources["ra"].values, sources["dec"].values)
+    casabackend.create_component_list(sources, directions, "Skymodel/point.cl")
 
 
 def run_simobserve(simobserve, parameters_settings, parameters_simobserve, folder):
@@ -558,31 +632,35 @@ def run_simanalyze(simanalyze, parameters_simanalyze, parameters_skymodel, measu
                overwrite=True)
 
 
-def create_fits_files(exportfits, imhead, folder):
+def create_fits_files(exportfits, folder):
     """
-    Runs the CASA task exportfits to save CASA images as fits-files. Uses CASA task imhead to modify the object.
+    Runs the CASA task exportfits to save the CASA image, residual and fidelity as fits-files. The three images are
+    exported concurrently, see fitsexport.export_images. Their headers are set afterwards by finalize_fits_files.
     See CASA documentation for further information:
     https://casa.nrao.edu/casadocs
 
     :param exportfits: The CASA task exportfits.
-    :param imhead: The CASA taks imhead
     :param folder: the output folder name
     """
-    os.system('mkdir ' + folder + '/FITS_Files')
-
-    name_image = folder + '/' + folder + '.image'
-    name_residual = folder + '/' + folder + '.residual'
-    name_fidelity = folder + '/' + folder + '.fidelity'
+    if not os.path.isdir(folder + '/FITS_Files'):
+        os.mkdir(folder + '/FITS_Files')
+    fitsexport.export_images(exportfits, [(folder + '/' + folder + '.' + name,
+                                           folder + '/FITS_Files/' + folder + '.' + name + '.fits')
+                                          for name, object_name in fitsexport.IMAGE_OBJECTS])
 
-    imhead(name_image, mode="put", hdkey="object", hdvalue="radio_image")
-    imhead(name_residual, mode="put", hdkey="object", hdvalue="residual_image")
-    imhead(name_fidelity, mode="put", hdkey="object", hdvalue="fidelity_image")
 
-    exportfits(imagename=name_image,
-               fitsimage=folder + '/FITS_Files/' + folder + '.image.fits', overwrite=True, dropdeg=True)
-
-    exportfits(imagename=name_residual,
-               fitsimage=folder + '/FITS_Files/' + folder + '.residual.fits', overwrite=True, dropdeg=True)
+def finalize_fits_files(folder, provenance, parameters_settings):
+    """
+    Sets the object and the provenance of the iteration in the headers of the fits-files and compresses them, in one
+    pass over each file. The CASA images are left unchanged. Runs after all stages, so
+    fits-files restored from the artifacts of another iteration get the provenance of this iteration.
 
-    exportfits(imagename=name_fidelity,
-               fitsimage=folder + '/FITS_Files/' + folder + '.fidelity.fits', overwrite=True, dropdeg=True)
+    :param folder: The output folder name.
+    :param provenance: The provenance header keywords, see fitsexport.get_provenance_cards.
+    :param parameters_settings: Parameter set extracted from the model containing settings parameters.
+                                See get_params_settings for detailed content.
+    """
+    for name, object_name in fitsexport.IMAGE_OBJECTS:
+        fitsexport.finalize_fits_file(folder + '/FITS_Files/' + folder + '.' + name + '.fits', object_name,
+                                      provenance, parameters_settings["fits_compression"],
+                                      parameters_settings["fits_quantize_level"], parameters_settings["fits_tile"])
@@ -0,0 +1,168 @@
+import os
+import Pipeline.cache as cache
+import Pipeline.estimator as estimator
+import Pipeline.parameters as parameters
+import Pipeline.util as util
+
+
+class SweepPlan:
+    """
+    The iterations a run of the AppPipeline executes, in order of execution, with their effective parameter sets,
+    output folder names, fingerprints, duplicates, folder name collisions and estimated cost. Created without any CASA
+    task by create_plan and executed by pipeline.run, so planning and execution can not drift apart.
+    """
+
+    def __init__(self, settings, iterations):
+        """
+        This method will be called when an object of this class is instantiated.
+
+        :param settings: Parameter set containing settings parameters. See parameters.get_params_settings.
+        :param iterations: The planned iterations, see create_plan.
+        """
+        self.settings = settings
+        self.iterations = iterations
+
+    def get_totals(self):
+        """
+        Returns the totals of the plan. Iterations that will be served from the output cache count neither time nor
+        disk space, their outputs are hard-linked.
+
+        :return: totals: A dictionary with the keys "iterations", "computed", "duplicates", "cached", "collisions",
+                         "estimated_time", "estimated_time_band", "estimated_disk" and "estimated_disk_band". Bands
+                         are None if a fixed formula was used for any iteration.
+        """
+        computed = [iteration for iteration in self.iterations if iteration["computed"]]
+        time_bands = [iteration["estimated_time_band"] for iteration in computed]
+        disk_bands = [iteration["estimated_disk_band"] for iteration in computed]
+        parallel = float(max(1, min(self.settings["processes"], len(computed))))
+        return {"iterations": len(self.iterations),
+                "computed": len(computed),
+                "duplicates": len([i for i in self.iterations if i["duplicate_of"] is not None]),
+                "cached": len([i for i in self.iterations if i["cached_folder"] is not None]),
+                "collisions": len([i for i in self.iterations if i["collides_with"]]),
+                "estimated_time": sum(i["estimated_time"] for i in computed) / parallel,
+                "estimated_time_band": sum(time_bands) / parallel if None not in time_bands else None,
+                "estimated_disk": sum(i["estimated_disk"] for i in computed),
+                "estimated_disk_band": sum(disk_bands) if None not in disk_bands else None}
+
+    def to_dict(self):
+        """
+        Returns the plan as JSON compatible dictionary with the keys "settings", "iterations" and "totals".
+        """
+        return {"settings": self.settings,
+                "iterations": self.iterations,
+                "totals": self.get_totals()}
+
+
+def index_cached_outputs(output_path):
+    """
+    Returns the completed output folders in the output path by fingerprint.
+
+    :param output_path: The output path.
+    :return: index: A dictionary with the fingerprints as keys and lists of folder names as values.
+    """
+    index = {}
+    if not output_path or not os.path.isdir(output_path):
+        return index
+    for folder in sorted(os.listdir(output_path)):
+        manifest = cache.read_manifest(os.path.join(output_path, folder))
+        if manifest is not None and manifest.get("folder") == folder:
+            index.setdefault(manifest.get("fingerprint"), []).append(folder)
+    return index
+
+
+def create_plan(model, history_file=estimator.HISTORY_FILE, estimate_only=False):
+    """
+    Expands the model into the iterations a run executes, exactly like the AppPipeline does, without calling any
+    CASA task. An iteration is a duplicate if an earlier iteration of the plan has the same fingerprint, and collides
+    with other iterations if they have the same output folder name but different fingerprints, so the later ones
+    overwrite the output of the earlier ones. Duplicates and iterations with a completed output folder in the output
+    path are served from the output cache if it is enabled.
+
+    A plan that is only used for its estimated cost, e.g. by the GUI whenever the inputs change, can skip the file
+    accesses that do not change the estimate much: with estimate_only, the output path is not searched for cached
+    outputs and the fingerprints do not include the antenna configuration file and the source catalog, which is
+    enough to find the duplicates, see cache.create_fingerprint. Such a plan must not be executed.
+
+    :param model: The input model from the GUI or the batch runner.
+    :param history_file: The timing history of the runtime estimator.
+    :param estimate_only: Plan only for the estimated cost, without cached outputs and file fingerprints.
+    :return: plan: The SweepPlan. Each iteration is a dictionary with the keys "number", "parameter", "index",
+                   "value" (the value of the varying parameter), "skymodel", "sources", "simobserve", "simanalyze",
+                   "folder", "fingerprint", "duplicate_of" (number of the first equal iteration or None),
+                   "collides_with" (numbers of the colliding iterations), "cached_folder" (completed output folder
+                   with equal fingerprint or None), "cache_candidates" (the output folders that may hold the output
+                   of the iteration when it runs: the completed folders with equal fingerprint and the folder of the
+                   first equal iteration), "computed" (false if it is served from the cache),
+                   "estimated_time", "estimated_time_band" (seconds), "estimated_disk" and "estimated_disk_band"
+                   (bytes).
+    """
+    parameters_settings = parameters.get_params_settings(model)
+    parameters_skymodel = parameters.get_params_skymodel(model)
+    parameters_sources = parameters.get_params_sources(model)
+    parameters_simobserve = parameters.get_params_simobserve(model)
+    parameters_simanalyze = parameters.get_params_simanalyze(model)
+    if model.mode == "Multiple Runs":
+        iterations = util.expand_iterations(model.var_param_values_lists, model.var_param_set, parameters_skymodel,
+                                            parameters_sources, parameters_simobserve, parameters_simanalyze)
+    else:
+        iterations = [{"parameter": "",
+                       "index": "",
+                       "skymodel": parameters_skymodel,
+                       "sources": parameters_sources,
+                       "simobserve": parameters_simobserve,
+                       "simanalyze": parameters_simanalyze}]
+
+    use_cache = parameters_settings["cache"]
+    cached_outputs = {}
+    if use_cache and not estimate_only:
+        cached_outputs = index_cached_outputs(parameters_settings["output_path"])
+    runtime_estimator = estimator.load_estimator(history_file)
+    antennas = estimator.count_antennas(parameters_settings["antennalist"]) or 1
+    first_by_fingerprint = {}
+    numbers_by_folder = {}
+    for number, iteration in enumerate(iterations):
+        folder = util.create_output_name(parameters_settings["antennalist"], parameters_settings["mode"],
+                                         parameters_settings["var_param_set"], iteration["simobserve"]["incenter"],
+                                         iteration["simobserve"]["inwidth"], iteration["simobserve"]["integration"],
+                                         parameters_settings["sm"], iteration["parameter"], iteration["index"])
+        fingerprint = cache.create_fingerprint(parameters_settings, iteration["skymodel"], iteration["sources"],
+                                               iteration["simobserve"], iteration["simanalyze"], not estimate_only)
+        cached_folders = cached_outputs.get(fingerprint, [])
+        cached_folder = None
+        if cached_folders:
+            cached_folder = folder if folder in cached_folders else cached_folders[0]
+        duplicate_of = first_by_fingerprint.setdefault(fingerprint, number)
+        cache_candidates = []
+        if use_cache:
+            cache_candidates = sorted(cached_folders, key=lambda name: name != folder)
+            if duplicate_of != number and iterations[duplicate_of]["folder"] not in cache_candidates:
+                cache_candidates.append(iterations[duplicate_of]["folder"])
+        features = estimator.extract_features(parameters_settings, iteration["skymodel"], iteration["sources"],
+                                              iteration["simobserve"], iteration["simanalyze"], antennas)
+        estimated_time, estimated_time_band = runtime_estimator.predict_iteration(features)
+        estimated_disk, estimated_disk_band = runtime_estimator.predict_disk(features)
+        value = ""
+        if iteration["parameter"]:
+            value = model.var_param_values_lists[iteration["parameter"]][iteration["index"]]
+        iteration.update({"number": number,
+                          "value": value,
+                          "folder": folder,
+                          "fingerprint": fingerprint,
+                          "duplicate_of": duplicate_of if duplicate_of != number else None,
+                          "collides_with": [],
+                          "cached_folder": cached_folder,
+                          "cache_candidates": cache_candidates,
+                          "computed": not use_cache or (cached_folder is None and duplicate_of == number),
+                          "estimated_time": estimated_time,
+                          "estimated_time_band": estimated_time_band,
+                          "estimated_disk": estimated_disk,
+                          "estimated_disk_band": estimated_disk_band})
+        numbers_by_folder.setdefault(folder, []).append(number)
+
+    for numbers in numbers_by_folder.values():
+        for number in numbers:
+            iterations[number]["collides_with"] = [other for other in numbers if other != number and
+                                                   iterations[other]["fingerprint"] !=
+                                                   iterations[number]["fingerprint"]]
+    return SweepPlan(parameters_settings, iterations)
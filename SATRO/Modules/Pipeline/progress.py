@@ -0,0 +1,166 @@
+import multiprocessing
+import threading
+import timeit
+
+
+class RunCancelled(Exception):
+    """Raised at the next stage boundary after a run has been cancelled."""
+    pass
+
+
+class ProgressChannel:
+    """
+    Thread-safe progress feed of a pipeline run. The pipeline reports iterations and stages, the GUI polls snapshots
+    and may request cancellation. The cancellation flag is shared with forked worker processes of parallel runs.
+    """
+
+    def __init__(self, cancel_event=None):
+        """
+        This method will be called when an object of this class is instantiated. It initializes variables.
+
+        :param cancel_event: The cancellation flag to share, a new one if not given.
+        """
+        self._lock = threading.Lock()
+        self._cancel = cancel_event if cancel_event is not None else multiprocessing.Event()
+        self._start_time = None
+        self._stage_start_time = None
+        self._total = 0
+        self._processes = 1
+        self._completed = 0
+        self._iteration_durations = []
+        self._folder = ""
+        self._stage = ""
+        self._finished = False
+        self._error = None
+        self._stages = []
+        self._iterations = []
+
+    def create_worker_channel(self):
+        """
+        Returns a new channel sharing the cancellation flag of this channel. Worker processes of parallel runs must
+        use such a channel, created before forking, since the lock of this channel may be held by the polling thread
+        at the time of the fork.
+        """
+        return ProgressChannel(self._cancel)
+
+    def start(self, total, processes=1):
+        """
+        Reports the start of a run.
+
+        :param total: The number of iterations of the run.
+        :param processes: The number of iterations executed in parallel.
+        """
+        with self._lock:
+            self._start_time = timeit.default_timer()
+            self._total = total
+            self._processes = max(1, min(processes, total))
+
+    def check_cancelled(self):
+        """Raises RunCancelled if the run has been cancelled."""
+        if self.cancelled():
+            raise RunCancelled("The run has been cancelled.")
+
+    def start_iteration(self, folder):
+        """
+        Reports the start of an iteration. Raises RunCancelled instead if the run has been cancelled.
+
+        :param folder: The output folder name of the iteration.
+        """
+        self.check_cancelled()
+        with self._lock:
+            self._folder = folder
+            self._stage = ""
+            self._stages = []
+
+    def start_stage(self, stage):
+        """
+        Reports the start of a stage of the current iteration. Raises RunCancelled instead if the run has been
+        cancelled, so the run stops cleanly after the previous stage.
+
+        :param stage: The name of the stage.
+        """
+        self.check_cancelled()
+        self.report_stage(stage)
+
+    def report_stage(self, stage):
+        """
+        Reports the start of a stage of the current iteration that must not be interrupted, like publishing the
+        output.
+
+        :param stage: The name of the stage.
+        """
+        with self._lock:
+            now = timeit.default_timer()
+            if self._stage:
+                self._stages.append((self._stage, now - self._stage_start_time))
+            self._stage = stage
+            self._stage_start_time = now
+
+    def finish_iteration(self, result):
+        """
+        Reports the end of an iteration.
+
+        :param result: The result of the iteration as returned by pipeline.run_iteration.
+        """
+        with self._lock:
+            if self._stage:
+                self._stages.append((self._stage, timeit.default_timer() - self._stage_start_time))
+            self._completed += 1
+            if "error" not in result and not result.get("cached"):
+                self._iteration_durations.append(result["elapsed"])
+            self._iterations.append({"folder": result.get("folder", str(result["parameter"]) + str(result["index"])),
+                                     "elapsed": result.get("elapsed"),
+                                     "cached": result.get("cached", False),
+                                     "failed": "error" in result})
+            self._stage = ""
+
+    def finish(self, error=None):
+        """
+        Reports the end of the run.
+
+        :param error: A description of the error the run ended with, if any.
+        """
+        with self._lock:
+            self._finished = True
+            self._error = error
+
+    def cancel(self):
+        """Requests cancellation of the run after the current stage."""
+        self._cancel.set()
+
+    def cancelled(self):
+        """Returns true if cancellation has been requested."""
+        return self._cancel.is_set()
+
+    def snapshot(self):
+        """
+        Returns the current progress. The estimated time remaining is the mean duration of the computed iterations
+        times the number of remaining iterations divided by the number of parallel iterations, or None if no
+        iteration has been computed yet.
+
+        :return: snapshot: A dictionary with the keys "completed", "total", "folder", "stage", "stages" (stages of
+                           the current iteration with their durations), "iterations" (finished iterations with the
+                           keys "folder", "elapsed", "cached" and "failed"), "elapsed", "eta", "cancelled",
+                           "finished" and "error".
+        """
+        with self._lock:
+            now = timeit.default_timer()
+            elapsed = now - self._start_time if self._start_time is not None else 0.0
+            eta = None
+            if self._iteration_durations:
+                mean = sum(self._iteration_durations) / len(self._iteration_durations)
+                eta = mean * max(self._total - self._completed, 0) / self._processes
+            stages = list(self._stages)
+            if self._stage:
+                stages.append((self._stage, now - self._stage_start_time))
+            return {"completed": self._completed,
+                    "total": self._total,
+                    "folder": self._folder,
+                    "stage": self._stage,
+                    "stages": stages,
+                    "iterations": list(self._iterations),
+                    "elapsed": elapsed,
+                    "eta": eta,
+                    "cancelled": self.cancelled(),
+                    "finished": self._finished,
+                    "error": self._error}
@@ -0,0 +1,105 @@
+import contextlib
+import errno
+import os
+import shutil
+
+import Pipeline.workspace as workspace
+
+# Prefix of the staging directories in the output path. Readers of the output path skip entries starting with it.
+STAGING_PREFIX = ".publish_"
+
+
+def move_path(source, destination):
+    """
+    Moves a file or directory. It is renamed if source and destination are on the same file system, otherwise it is
+    copied in a single pass and the source is removed afterwards. Like "cp -L", the copy follows symbolic links.
+
+    :param source: The file or directory to move.
+    :param destination: The new path. It must not exist yet.
+    """
+    try:
+        os.rename(source, destination)
+        return
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, symlinks=False)
+        shutil.rmtree(source)
+    else:
+        shutil.copy2(source, destination)
+        os.remove(source)
+
+
+def move_into(sources, directory):
+    """
+    Moves files and directories into a directory, which is created if it does not exist. Existing entries with the
+    same name are replaced.
+
+    :param sources: The paths of the files and directories to move.
+    :param directory: The target directory.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for source in sources:
+        destination = os.path.join(directory, os.path.basename(os.path.normpath(source)))
+        if os.path.isdir(destination) and not os.path.islink(destination):
+            shutil.rmtree(destination)
+        elif os.path.lexists(destination):
+            os.remove(destination)
+        move_path(source, destination)
+
+
+def is_staging_directory(name):
+    """Returns true if the given entry name of an output path is a staging directory of an unfinished publication."""
+    return name.startswith(STAGING_PREFIX)
+
+
+@contextlib.contextmanager
+def staged_output(output_path, folder):
+    """
+    Context manager publishing an output folder atomically. It yields the path of a staging folder in a hidden
+    directory of the output path, which the caller fills. When the enclosed code returns, the staging folder is
+    renamed to the output folder, replacing an existing output folder of the same name. Readers of the output path
+    therefore see either the previous or the complete new output folder, never a partially written one. If the
+    enclosed code raises, the staging directory is removed and the existing output folder is kept. The staging
+    directory has an owner file, so only staging directories of crashed processes are removed, see
+    remove_stale_staging.
+
+    :param output_path: The output path.
+    :param folder: The output folder name.
+    """
+    staging_dir = workspace.create_directory(output_path, STAGING_PREFIX + folder + "_")
+    staged = os.path.join(staging_dir, folder)
+    destination = os.path.join(output_path, folder)
+    try:
+        yield staged
+        if not os.path.isdir(staged):
+            raise IOError(errno.ENOENT, "Nothing has been staged for publishing", staged)
+        if os.path.lexists(destination):
+            # Renaming over a non-empty directory is not possible: the previous output folder is moved into the
+            # staging directory first and removed with it.
+            os.rename(destination, os.path.join(staging_dir, folder + ".replaced"))
+        os.rename(staged, destination)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def remove_stale_staging(output_path):
+    """
+    Removes staging directories left in the output path by publications that were interrupted by a crash. Staging
+    directories of running processes, e.g. of another sweep writing to the same output path, are kept, see
+    workspace.is_stale.
+
+    :param output_path: The output path.
+    :return: removed: The names of the removed staging directories.
+    """
+    removed = []
+    if not os.path.isdir(output_path):
+        return removed
+    for name in os.listdir(output_path):
+        path = os.path.join(output_path, name)
+        if is_staging_directory(name) and os.path.isdir(path) and workspace.is_stale(path):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+    return removed
@@ -0,0 +1,223 @@
+import math
+import numpy as np
+from astropy.io import fits
+import Pipeline.util as util
+
+# Sky-model backends: the CASA tools componentlist and image analysis, or this module.
+BACKENDS = [("casa", "CASA component list"), ("numpy", "NumPy rasterizer")]
+DEFAULT_BACKEND = "casa"
+SHAPES = ["Gaussian", "point", "disk", "limbdarkeneddisk"]
+# Exponent n of the limb-darkened disk I(r) = I0 * (1 - r^2 / R^2) ^ (n / 2). The sky-model parameters have no
+# exponent, so like the optional parameter of componentlist.addcomponent it is 0, a uniform disk.
+LIMB_DARKENING_EXPONENT = 0.0
+# Number of samples per pixel along each axis the profile is averaged over, for components narrower than
+# SUBSAMPLE_LIMIT pixels. Wider components are sampled at the pixel centres.
+SUBSAMPLES = 5
+SUBSAMPLE_LIMIT = 4
+# Gaussian components are painted out to this many standard deviations of the major axis.
+GAUSSIAN_EXTENT = 8
+ANGLE_UNITS = {"rad": 180 / math.pi, "deg": 1.0, "arcmin": 1 / 60.0, "arcsec": 1 / 3600.0,
+               "mas": 1 / 3600000.0}
+FLUX_UNITS = {"Jy": 1.0, "mJy": 1e-3, "uJy": 1e-6}
+FREQUENCY_UNITS = {"Hz": 1.0, "kHz": 1e3, "MHz": 1e6, "GHz": 1e9}
+
+
+def convert_quantity(string, units):
+    """
+    Converts a quantity string such as "0.5arcmin" or "128MHz" with the given unit table.
+
+    :param string: The quantity string.
+    :param units: A dictionary with the unit names as keys and the factors to the target unit as values.
+    :return: value: The value in the target unit.
+    """
+    value, unit = util.get_decimal_from_string(string)
+    if unit.strip() not in units:
+        raise ValueError(str(string) + " has invalid units. Use one of " + ", ".join(sorted(units)) + ".")
+    return float(value) * units[unit.strip()]
+
+
+def get_spectral_scale(parameters_skymodel):
+    """
+    Returns the factor that scales the component flux from the component frequency to the frequency of the sky-model
+    image: (frequency / component frequency) ^ index for a spectral index spectrum, else 1.
+
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    """
+    if "index" not in parameters_skymodel["sm_spectrumtype"].lower():
+        return 1.0
+    frequency = convert_quantity(parameters_skymodel["sm_frequency"], FREQUENCY_UNITS)
+    reference = convert_quantity(parameters_skymodel["component_frequency"], FREQUENCY_UNITS)
+    return (frequency / reference) ** parameters_skymodel["sm_index"]
+
+
+def create_header(parameters_skymodel):
+    """
+    Returns the FITS header of the sky-model image as exportfits writes it for the CASA image created by
+    pipeline.create_skymodel: a SIN projection centred on the sky-model direction with the reference pixel at the
+    image centre, one frequency and one Stokes plane, with the Stokes axis last like exportfits writes it by
+    default, and brightness in Jy/pixel. Directions are rounded like the strings passed to CASA.
+
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :return: header: The astropy.io.fits.Header.
+    """
+    size = parameters_skymodel["sm_size"]
+    cell = convert_quantity(parameters_skymodel["sm_cellsize"], ANGLE_UNITS)
+    ra = util.convert_deg_to_hour(parameters_skymodel["sm_direction_ra"])
+    dec = util.convert_deg_to_dms(parameters_skymodel["sm_direction_dec"])
+    header = fits.Header()
+    header["BSCALE"] = 1.0
+    header["BZERO"] = 0.0
+    header["BTYPE"] = "Intensity"
+    header["BUNIT"] = "Jy/pixel"
+    for axis, (ctype, crval, cdelt, cunit) in enumerate(
+            [("RA---SIN", _parse_sexagesimal(ra, 15.0), -cell, "deg"),
+             ("DEC--SIN", _parse_sexagesimal(dec, 1.0), cell, "deg"),
+             ("FREQ", convert_quantity(parameters_skymodel["sm_frequency"], FREQUENCY_UNITS),
+              convert_quantity(parameters_skymodel["frequency_increment"], FREQUENCY_UNITS), "Hz"),
+             ("STOKES", 1.0, 1.0, "")]):
+        header["CTYPE" + str(axis + 1)] = ctype
+        header["CRVAL" + str(axis + 1)] = crval
+        header["CDELT" + str(axis + 1)] = cdelt
+        header["CRPIX" + str(axis + 1)] = float(size // 2 + 1) if axis < 2 else 1.0
+        header["CUNIT" + str(axis + 1)] = cunit
+    header["PV2_1"] = 0.0
+    header["PV2_2"] = 0.0
+    header["RADESYS"] = "FK5"
+    header["EQUINOX"] = 2000.0
+    header["SPECSYS"] = "LSRK"
+    return header
+
+
+def _parse_sexagesimal(string, factor):
+    """Returns the degrees of a string formatted by util.convert_deg_to_hour (factor 15) or convert_deg_to_dms."""
+    separators = "hms" if factor == 15.0 else "dms"
+    parts = []
+    rest = string
+    for separator in separators:
+        part, rest = rest.split(separator, 1)
+        parts.append(part)
+    sign = -1.0 if parts[0].strip().startswith("-") else 1.0
+    value = abs(float(parts[0])) + float(parts[1]) / 60.0 + float(parts[2]) / 3600.0
+    return sign * value * factor
+
+
+def rasterize_component(parameters_skymodel):
+    """
+    Paints the sky-model component onto the pixel grid of the sky-model image, so the image sums to the component
+    flux. The component direction is the image centre. The flux of a point component, and of a component whose major
+    axis is smaller than a cell, goes into the pixel at the component direction. The profile of the other shapes is
+    averaged over SUBSAMPLES x SUBSAMPLES points of each pixel within the extent of the component and scaled to the
+    flux. The flux of a component extending beyond the image is scaled analytically, so the part outside is lost.
+    Gaussian axes are full widths at half maximum, the position angle is measured from north through east.
+
+    Unlike this backend, the CASA image analysis tool samples the profile at the pixel centres only, so its images of
+    components near or below the cell size do not sum to the flux, and it paints limb-darkened disks as points.
+
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :return: data: The image in Jy/pixel as float32 array of shape (sm_size, sm_size), indexed [dec, ra].
+    """
+    shape = parameters_skymodel["sm_shape"]
+    if shape not in SHAPES:
+        raise ValueError(str(shape) + " is not supported by the rasterizer. Use one of " + ", ".join(SHAPES) + ".")
+    size = parameters_skymodel["sm_size"]
+    center = size // 2
+    if parameters_skymodel["sm_fluxunit"] not in FLUX_UNITS:
+        raise ValueError(str(parameters_skymodel["sm_fluxunit"]) + " is invalid as flux unit. Use one of " +
+                         ", ".join(sorted(FLUX_UNITS)) + ".")
+    flux = parameters_skymodel["sm_flux"] * FLUX_UNITS[parameters_skymodel["sm_fluxunit"]] * \
+        get_spectral_scale(parameters_skymodel)
+    data = np.zeros((size, size), dtype=np.float64)
+    cell = convert_quantity(parameters_skymodel["sm_cellsize"], ANGLE_UNITS)
+    if shape != "point":
+        major = convert_quantity(parameters_skymodel["sm_majoraxis"], ANGLE_UNITS)
+        minor = convert_quantity(parameters_skymodel["sm_minoraxis"], ANGLE_UNITS)
+    if shape == "point" or major < cell:
+        data[center, center] = flux
+        return data.astype(np.float32)
+
+    angle = math.radians(convert_quantity(parameters_skymodel["sm_positionangle"], ANGLE_UNITS))
+    if shape == "Gaussian":
+        sigma_major = major / (2 * math.sqrt(2 * math.log(2)))
+        sigma_minor = minor / (2 * math.sqrt(2 * math.log(2)))
+        extent = GAUSSIAN_EXTENT * sigma_major
+        scale = flux * cell * cell / (2 * math.pi * sigma_major * sigma_minor)
+    else:
+        extent = major / 2
+        n = LIMB_DARKENING_EXPONENT if shape == "limbdarkeneddisk" else 0.0
+        # the integral of (1 - r^2) ^ (n / 2) over the unit disk is pi / (n / 2 + 1)
+        scale = flux * cell * cell * (n / 2.0 + 1) / (math.pi * major * minor / 4)
+    radius = int(math.ceil(extent / cell)) + 1
+    lower, upper = max(0, center - radius), min(size, center + radius + 1)
+    truncated = lower > center - radius or upper < center + radius + 1
+    pixels = np.arange(lower, upper, dtype=np.float64) - center
+    samples = SUBSAMPLES if minor < SUBSAMPLE_LIMIT * cell else 1
+    profile = np.zeros((upper - lower, upper - lower), dtype=np.float64)
+    for row_offset in (np.arange(samples) + 0.5) / samples - 0.5:
+        for column_offset in (np.arange(samples) + 0.5) / samples - 0.5:
+            # RA increases to the left, so east offsets are negative pixel offsets
+            east = -(pixels + column_offset)[np.newaxis, :] * cell
+            north = (pixels + row_offset)[:, np.newaxis] * cell
+            along_major = north * math.cos(angle) + east * math.sin(angle)
+            along_minor = -north * math.sin(angle) + east * math.cos(angle)
+            if shape == "Gaussian":
+                profile += np.exp(-0.5 * ((along_major / sigma_major) ** 2 + (along_minor / sigma_minor) ** 2))
+            else:
+                radius_squared = (along_major / (major / 2)) ** 2 + (along_minor / (minor / 2)) ** 2
+                profile += np.power(np.clip(1 - radius_squared, 0, 1), n / 2.0) * (radius_squared < 1)
+    total = profile.sum()
+    if not total:
+        # a component thinner than the samples, e.g. a disk with a tiny minor axis
+        data[center, center] = flux
+    elif truncated:
+        data[lower:upper, lower:upper] = profile * scale / (samples * samples)
+    else:
+        data[lower:upper, lower:upper] = profile * flux / total
+    return data.astype(np.float32)
+
+
+def write_skymodel(parameters_skymodel, fits_file, data=None):
+    """
+    Creates the sky-model FITS file with the rasterized component, without any CASA tool.
+
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :param fits_file: The FITS file to write.
+    :param data: The image to write instead of the component, e.g. the haslam interpolation, in Jy/pixel.
+    """
+    if data is None:
+        data = rasterize_component(parameters_skymodel)
+    data = np.asarray(data).reshape(1, 1, parameters_skymodel["sm_size"], parameters_skymodel["sm_size"])
+    fits.PrimaryHDU(data, create_header(parameters_skymodel)).writeto(fits_file, overwrite=True)
+
+
+def compare_with_fits(parameters_skymodel, reference_file):
+    """
+    Compares the rasterized component with a sky-model FITS file created by the CASA backend, e.g. to check the
+    parity of the backends inside CASA.
+
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :param reference_file: The sky-model FITS file of the CASA backend.
+    :return: comparison: A dictionary with the keys "max_abs_error", "max_rel_error" (relative to the peak of the
+                         reference), "flux_ratio" (total flux of the rasterized over the reference image) and
+                         "header_mismatches" (WCS keywords whose values differ).
+    """
+    data = rasterize_component(parameters_skymodel).astype(np.float64)
+    header = create_header(parameters_skymodel)
+    with fits.open(reference_file) as reference:
+        reference_data = np.array(reference[0].data, dtype=np.float64).squeeze()
+        reference_header = reference[0].header
+        mismatches = []
+        for key, value in header.items():
+            if not key.startswith(("CTYPE", "CRVAL", "CDELT", "CRPIX")):
+                continue
+            if key not in reference_header:
+                mismatches.append(key)
+            elif key.startswith("CTYPE"):
+                if value != reference_header[key]:
+                    mismatches.append(key)
+            elif not np.isclose(value, reference_header[key]):
+                mismatches.append(key)
+    peak = np.abs(reference_data).max()
+    return {"max_abs_error": float(np.abs(data - reference_data).max()),
+            "max_rel_error": float(np.abs(data - reference_data).max() / peak) if peak else None,
+            "flux_ratio": float(data.sum() / reference_data.sum()) if reference_data.sum() else None,
+            "header_mismatches": mismatches}
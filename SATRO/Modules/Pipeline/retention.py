@@ -0,0 +1,67 @@
+import fnmatch
+import os
+import shutil
+import Pipeline.util as util
+
+DEFAULT_POLICY = "all"
+# Paths relative to the output folder kept by the retention policies, as shell patterns. None keeps everything.
+# "fits" keeps what the analysis tools open: the FITS files and the sources, plus the CASA task files, logs and
+# plots. "fits_ms" additionally keeps the measurement set, so the observation can be imaged again.
+POLICY_PATTERNS = {"all": None,
+                   "fits": ["FITS_Files", "Skymodel/sources.pkl", "Taskfiles", "*.log", "*.png"],
+                   "fits_ms": ["FITS_Files", "Skymodel/sources.pkl", "Taskfiles", "*.log", "*.png", "*.ms"]}
+# Descriptions of the policies in the order they are offered.
+POLICIES = [("all", "Keep everything"),
+            ("fits", "Keep FITS files, sources and logs"),
+            ("fits_ms", "Keep FITS files, sources, logs and measurement set")]
+
+
+def _is_kept(relative, patterns):
+    """Returns true if a path relative to the output folder matches one of the patterns."""
+    return any(fnmatch.fnmatch(relative, pattern) for pattern in patterns)
+
+
+def _contains_kept(relative, patterns):
+    """Returns true if a directory relative to the output folder contains paths matched by one of the patterns."""
+    return any(pattern.startswith(relative + "/") for pattern in patterns)
+
+
+def _get_size(path):
+    """Returns the size of a file or a directory tree in bytes."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        return util.get_directory_size(path)
+    return os.lstat(path).st_size
+
+
+def prune_output(folder, policy):
+    """
+    Removes the files and directories of an output folder that the retention policy does not keep. Directories
+    matching a pattern are kept as a whole, e.g. CASA images and the measurement set.
+
+    :param folder: The output folder.
+    :param policy: The name of the retention policy, see POLICY_PATTERNS.
+    :return: pruned_bytes: The size of the removed files and directories in bytes.
+    """
+    if policy not in POLICY_PATTERNS:
+        raise ValueError("Unknown retention policy: " + str(policy))
+    patterns = POLICY_PATTERNS[policy]
+    if patterns is None:
+        return 0
+    pruned_bytes = 0
+    pending = [""]
+    while pending:
+        relative_dir = pending.pop()
+        for name in os.listdir(os.path.join(folder, relative_dir)):
+            relative = os.path.join(relative_dir, name).replace(os.sep, "/")
+            path = os.path.join(folder, relative)
+            if _is_kept(relative, patterns):
+                continue
+            if os.path.isdir(path) and not os.path.islink(path) and _contains_kept(relative, patterns):
+                pending.append(relative)
+                continue
+            pruned_bytes += _get_size(path)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    return pruned_bytes
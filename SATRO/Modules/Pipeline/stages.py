@@ -0,0 +1,201 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+import Pipeline.cache as cache
+import Pipeline.workspace as workspace
+
+STAGE_FILE = "stage.json"
+# Suffix of the directory a process creates next to an artifact while it executes the stage, see
+# ArtifactStore.claim.
+CLAIM_SUFFIX = ".claim"
+# Seconds between two checks of a process waiting for an artifact claimed by another process.
+CLAIM_INTERVAL = 1.0
+
+
+class Stage:
+    """
+    A stage of an iteration with declared inputs. The output artifact of a stage are all files it creates or changes
+    in the Skymodel directory, the output folder and the *.last files of the working directory.
+    """
+
+    def __init__(self, name, inputs, action, depends=()):
+        """
+        This method will be called when an object of this class is instantiated.
+
+        :param name: The name of the stage.
+        :param inputs: The parameters the output of the stage depends on, as JSON compatible dictionary.
+        :param action: A function without arguments that executes the stage.
+        :param depends: The names of the stages whose artifacts this stage consumes.
+        """
+        self.name = name
+        self.inputs = inputs
+        self.action = action
+        self.depends = depends
+
+
+class ArtifactStore:
+    """
+    A directory holding the output artifacts of stages, keyed by the stage name and a hash of the stage inputs and
+    the keys of the stages it depends on. Artifacts are stored with the output folder name of the iteration that
+    produced them and renamed when restored for another iteration. Parallel iterations claim an artifact before they
+    execute its stage, so each artifact is produced once and the other iterations wait for it.
+    """
+
+    def __init__(self, directory):
+        """
+        This method will be called when an object of this class is instantiated.
+
+        :param directory: The directory of the store. It is created if it does not exist.
+        """
+        self.directory = os.path.abspath(directory)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def path(self, name, key):
+        """Returns the directory of the artifact of a stage."""
+        return os.path.join(self.directory, name + "-" + key)
+
+    def has(self, name, key):
+        """Returns true if the artifact of a stage is complete."""
+        return os.path.isfile(os.path.join(self.path(name, key), STAGE_FILE))
+
+    def save(self, name, key, files, folder):
+        """
+        Copies the given files into the store as artifact of a stage. The artifact is assembled in a temporary
+        directory and renamed into place, so concurrent iterations never see a partial artifact.
+
+        :param name: The name of the stage.
+        :param key: The key of the stage.
+        :param files: The files of the artifact, relative to the working directory.
+        :param folder: The output folder name of the iteration.
+        """
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.directory)
+        for relative in files:
+            target = os.path.join(staging, "files", relative)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            shutil.copy2(relative, target)
+        with open(os.path.join(staging, STAGE_FILE), 'w') as output:
+            json.dump({"stage": name, "key": key, "folder": folder}, output)
+        try:
+            os.rename(staging, self.path(name, key))
+        except OSError:
+            # another iteration stored the same artifact in the meantime
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def claim(self, name, key, channel=None):
+        """
+        Claims the artifact of a stage for the current process, unless it is stored. If another process holds the
+        claim, waits until that process has stored the artifact or released the claim. Claims of crashed processes
+        are removed, see workspace.is_stale.
+
+        :param name: The name of the stage.
+        :param key: The key of the stage.
+        :param channel: A progress.ProgressChannel checked for cancellation while waiting.
+        :return: claimed: True if the caller has to execute the stage and release the claim, False if the artifact
+                          is stored.
+        """
+        claim = self.path(name, key) + CLAIM_SUFFIX
+        while not self.has(name, key):
+            try:
+                os.mkdir(claim)
+            except OSError:
+                if workspace.is_stale(claim):
+                    shutil.rmtree(claim, ignore_errors=True)
+                else:
+                    if channel is not None:
+                        channel.check_cancelled()
+                    time.sleep(CLAIM_INTERVAL)
+                continue
+            workspace.write_owner_file(claim)
+            if not self.has(name, key):
+                return True
+            # stored between the check and the claim
+            self.release(name, key)
+        return False
+
+    def release(self, name, key):
+        """Releases the claim of the artifact of a stage, see claim."""
+        shutil.rmtree(self.path(name, key) + CLAIM_SUFFIX, ignore_errors=True)
+
+    def restore(self, name, key, folder):
+        """
+        Copies the artifact of a stage into the working directory, renaming it for the given output folder. The files
+        are copied, not hard-linked, because CASA changes restored tables in place, e.g. when simanalyze images a
+        measurement set, which must not change the stored artifact or the outputs of other iterations.
+
+        :param name: The name of the stage.
+        :param key: The key of the stage.
+        :param folder: The output folder name of the iteration.
+        """
+        with open(os.path.join(self.path(name, key), STAGE_FILE), 'r') as input_file:
+            stored_folder = json.load(input_file)["folder"]
+        files = os.path.join(self.path(name, key), "files")
+        if os.path.isdir(files):
+            cache.copy_output_tree(files, os.getcwd(), stored_folder, folder, link=False)
+
+    def remove(self):
+        """Removes the store with all its artifacts."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def snapshot_files(folder):
+    """
+    Returns the size and modification time of all files that can be part of a stage artifact.
+
+    :param folder: The output folder name of the iteration.
+    :return: snapshot: A dictionary with the relative file paths as keys.
+    """
+    snapshot = {}
+    paths = glob.glob("*.last")
+    for root in ["Skymodel", folder]:
+        for directory, subdirectories, files in os.walk(root):
+            paths.extend(os.path.join(directory, name) for name in files)
+    for path in paths:
+        stat = os.stat(path)
+        snapshot[path] = (stat.st_size, stat.st_mtime, stat.st_ino)
+    return snapshot
+
+
+def run_stages(stages, store, folder, logger, channel=None, recorder=None):
+    """
+    Executes the given stages in order. If a store is given, a stage whose inputs and dependencies are unchanged
+    since an earlier iteration restores that artifact instead of being executed, else its artifact is added to the
+    store. If a parallel iteration is executing the same stage, the artifact is awaited, see ArtifactStore.claim.
+
+    :param stages: The stages in topological order.
+    :param store: The artifact store of the sweep or None.
+    :param folder: The output folder name of the iteration.
+    :param logger: The logger of the iteration.
+    :param channel: A progress.ProgressChannel the start of each stage is reported to. It raises
+                    progress.RunCancelled at the next stage boundary if the run has been cancelled.
+    :param recorder: An instrumentation.StageRecorder the restoring of artifacts is recorded by.
+    """
+    keys = {}
+    for stage in stages:
+        if channel is not None:
+            channel.start_stage(stage.name)
+        keys[stage.name] = cache.hash_parameters({"stage": stage.name,
+                                                  "inputs": stage.inputs,
+                                                  "depends": [keys[name] for name in stage.depends]})
+        if store is None:
+            stage.action()
+        elif not store.claim(stage.name, keys[stage.name], channel):
+            logger.info("Reusing artifact of stage " + stage.name + " (" + keys[stage.name] + ")")
+            if recorder is None:
+                store.restore(stage.name, keys[stage.name], folder)
+            else:
+                with recorder.measure("restore_artifact", artifact=stage.name):
+                    store.restore(stage.name, keys[stage.name], folder)
+        else:
+            try:
+                before = snapshot_files(folder)
+                stage.action()
+                after = snapshot_files(folder)
+                changed = [path for path in after if before.get(path) != after[path]]
+                store.save(stage.name, keys[stage.name], changed, folder)
+            finally:
+                store.release(stage.name, keys[stage.name])
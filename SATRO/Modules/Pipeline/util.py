@@ -1,9 +1,21 @@
+import copy
 import datetime
 import logging
+import multiprocessing
 import os
 import pickle
 import numpy as np
-from astropy import constants as const
+
+# The speed of light in m/s, as astropy.constants.c, which is not imported to keep this module fast to import.
+SPEED_OF_LIGHT = 299792458.0
+
+SHAPES = ["Gaussian", "point", "disk", "limbdarkeneddisk"]
+WEIGHTINGS = ["natural", "uniform", "briggs"]
+TELESCOPE_DIAMETERS = {'VLA': 25.0,
+                       'ALMA': 12.0,
+                       'MWA': 4.0,
+                       'Meerkat': 12.0
+                       }
 
 
 def configure_logger(name):
@@ -79,6 +91,124 @@ def create_output_name(antennalist, mode, var_param_set, incenter, inwidth, inte
     return folder
 
 
+def transform_to_number(string):
+    """
+    Transforms and returns a given string to either int or float.
+
+    :param string: The input string.
+    :return: number: The transformed number.
+    """
+    number = -1
+    if string:
+        if string.isdigit():
+            number = int(string)
+        else:
+            number = float(string)
+        return number
+
+
+def create_param_values_list(min_value, max_value, steps, units):
+    """
+    Creates and returns a list of parameter values calculated from min to max
+    with given amount of steps.
+
+    :param min_value: The minimum value of the parameter.
+    :param max_value: The maximum value of the parameter.
+    :param steps: The amount of steps in between.
+    :param units: The units added to the value.
+    :return: values: A list of values for a parameter.
+    """
+    values = np.linspace(min_value, max_value, steps)
+
+    if isinstance(min_value, int) and isinstance(max_value, int):
+        values_int = []
+        for value in values:
+            values_int.append(int(value))
+        values = values_int
+
+    if units:
+        values_str = []
+        for value in values:
+            values_str.append(str(value) + units)
+        values = values_str
+    return values
+
+
+def create_var_param_values_lists(var_params_values_num, sm_selected_shapes, sp_selected_shapes,
+                                  selected_weightings):
+    """
+    Returns a dictionary with the varying parameter names as keys and a list of their values.
+
+    :param var_params_values_num: The numeric varying parameters with min, max, steps and units as pandas dataFrame.
+    :param sm_selected_shapes: The selected sky-model shapes.
+    :param sp_selected_shapes: The selected source shapes.
+    :param selected_weightings: The selected weightings.
+    :return: var_param_values_lists: The varying parameters and their lists of values as dictionary.
+    """
+    df = var_params_values_num
+    var_param_values_lists = {}
+    for param in df["Name"]:
+        min_value = transform_to_number(df[df["Name"] == param]["Min"].squeeze())
+        max_value = transform_to_number(df[df["Name"] == param]["Max"].squeeze())
+        steps = int(df[df["Name"] == param]["Steps"].squeeze())
+        units = df[df["Name"] == param]["Units"].squeeze()
+        values = create_param_values_list(min_value, max_value, steps, units)
+        var_param_values_lists.update({param: values})
+
+    if len(sm_selected_shapes) > 0:
+        var_param_values_lists.update({"sm_shape": sm_selected_shapes})
+    if len(sp_selected_shapes) > 0:
+        var_param_values_lists.update({"sp_shape": sp_selected_shapes})
+    if len(selected_weightings) > 0:
+        var_param_values_lists.update({"analyze_weighting": selected_weightings})
+    return var_param_values_lists
+
+
+def expand_iterations(var_param_values, var_param_set, parameters_skymodel, parameters_sources,
+                      parameters_simobserve, parameters_simanalyze):
+    """
+    Expands the varying parameter values into the list of iterations of multiple runs. Each value of each varying
+    parameter results in one iteration in which only that parameter differs from the fixed parameter sets. If source
+    parameters occur in the varying parameters, the sources are adjusted separately before the other parameter sets.
+
+    :param var_param_values: The varying parameters and their lists of values as dictionary.
+    :param var_param_set: The selected set of varying parameters.
+    :param parameters_skymodel: Parameter set containing sky-model parameters.
+    :param parameters_sources: Parameter set containing source parameters.
+    :param parameters_simobserve: Parameter set containing simobserve parameters.
+    :param parameters_simanalyze: Parameter set containing simanalyze parameters.
+    :return: iterations: A list of dictionaries with the keys "parameter", "index", "skymodel", "sources",
+                         "simobserve" and "simanalyze", in order of execution.
+    """
+    iterations = []
+    parameter_sets_original = [parameters_skymodel, parameters_simobserve, parameters_simanalyze]
+    for parameter in var_param_values.keys():
+        if "Sources" in var_param_set:
+            sources = copy.deepcopy(parameters_sources)
+            for index, value in enumerate(var_param_values[parameter]):
+                for source in sources:
+                    source.update({parameter: value})
+                iterations.append({"parameter": parameter,
+                                   "index": index,
+                                   "skymodel": copy.deepcopy(parameters_skymodel),
+                                   "sources": copy.deepcopy(sources),
+                                   "simobserve": copy.deepcopy(parameters_simobserve),
+                                   "simanalyze": copy.deepcopy(parameters_simanalyze)})
+
+        parameter_sets = copy.deepcopy(parameter_sets_original)
+        for parameter_set in parameter_sets:
+            if parameter in parameter_set.keys():
+                for index, value in enumerate(var_param_values[parameter]):
+                    parameter_set.update({parameter: value})
+                    iterations.append({"parameter": parameter,
+                                       "index": index,
+                                       "skymodel": copy.deepcopy(parameter_sets[0]),
+                                       "sources": copy.deepcopy(parameters_sources),
+                                       "simobserve": copy.deepcopy(parameter_sets[1]),
+                                       "simanalyze": copy.deepcopy(parameter_sets[2])})
+    return iterations
+
+
 def rename_casa_images(folder, file_ext):
     """
     Renames CASA images in the given output folder.
@@ -112,6 +242,78 @@ def find_index_of_nearest_xy(y_array, x_array, y_point, x_point):
     return idy[0], idx[0], distance
 
 
+def _get_kdtree():
+    """Returns scipy.spatial.cKDTree, imported on first use, or None if scipy is not installed."""
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+    return cKDTree
+
+
+def _find_nearest_brute_force(map_y, map_x, points_y, points_x, chunk_size):
+    """Returns the flat index of the first nearest map pixel of each point, computing chunk_size distances at once."""
+    nearest = np.empty(points_y.size, dtype=np.intp)
+    step = max(1, chunk_size // map_y.size)
+    for start in range(0, points_y.size, step):
+        stop = start + step
+        distance = (map_y[None, :] - points_y[start:stop, None]) ** 2 + \
+                   (map_x[None, :] - points_x[start:stop, None]) ** 2
+        nearest[start:stop] = distance.argmin(axis=1)
+    return nearest
+
+
+def find_indices_of_nearest_grid(y_array, x_array, y_points, x_points, chunk_size=4000000, use_kdtree=True):
+    """
+    Finds and returns the xy indices of the haslam map that correspond to every (y_points[i], x_points[j]) pair of a
+    regular grid in one batched pass. The result is the same as calling find_index_of_nearest_xy for each pair: among
+    equally distant pixels the first one in row-major order is chosen. Each distinct coordinate pair is only looked up
+    once. If scipy is available a k-d tree over the map pixels is used, else a chunked brute force search.
+
+    :param y_array: y-axis of the map
+    :param x_array: x-axis of the map
+    :param y_points: y coordinates of the grid in radians.
+    :param x_points: x coordinates of the grid in radians.
+    :param chunk_size: Maximum number of distances held in memory at once by the brute force search.
+    :param use_kdtree: Use the k-d tree if scipy is available, else always the brute force search.
+    :returns:
+        - idy: y indices as array of shape (len(y_points), len(x_points))
+        - idx: x indices as array of shape (len(y_points), len(x_points))
+    """
+    y_array = np.asarray(y_array)
+    x_array = np.asarray(x_array)
+    map_y = y_array.ravel()
+    map_x = x_array.ravel()
+    unique_y, inverse_y = np.unique(np.asarray(y_points), return_inverse=True)
+    unique_x, inverse_x = np.unique(np.asarray(x_points), return_inverse=True)
+    grid_y, grid_x = np.meshgrid(unique_y, unique_x, indexing='ij')
+    grid_y = grid_y.ravel()
+    grid_x = grid_x.ravel()
+
+    cKDTree = _get_kdtree() if use_kdtree else None
+    if cKDTree is not None:
+        # a few neighbours are queried to resolve ties exactly like the row-major search does
+        k = min(4, map_y.size)
+        tree = cKDTree(np.column_stack((map_y, map_x)))
+        _, candidates = tree.query(np.column_stack((grid_y, grid_x)), k=k)
+        candidates = candidates.reshape(grid_y.size, k)
+        distance = (map_y[candidates] - grid_y[:, None]) ** 2 + (map_x[candidates] - grid_x[:, None]) ** 2
+        is_nearest = distance == distance.min(axis=1)[:, None]
+        nearest = np.where(is_nearest, candidates, map_y.size).min(axis=1)
+        # if all queried neighbours are equally near, e.g. where pixels coincide at the poles, more pixels can be
+        unresolved = np.flatnonzero(is_nearest.all(axis=1)) if k > 1 else np.array([], dtype=np.intp)
+        if unresolved.size:
+            nearest[unresolved] = _find_nearest_brute_force(map_y, map_x, grid_y[unresolved], grid_x[unresolved],
+                                                            chunk_size)
+    else:
+        nearest = _find_nearest_brute_force(map_y, map_x, grid_y, grid_x, chunk_size)
+
+    idy, idx = np.unravel_index(nearest, y_array.shape)
+    idy = idy.reshape(unique_y.size, unique_x.size)[inverse_y[:, None], inverse_x[None, :]]
+    idx = idx.reshape(unique_y.size, unique_x.size)[inverse_y[:, None], inverse_x[None, :]]
+    return idy, idx
+
+
 def get_decimal_from_string(string):
     """
     Extracts and returns the decimal value of a string and the units.
@@ -156,37 +358,84 @@ def transform_frequency(frequency, units):
 
 def convert_deg_to_dms(deg):
     """
-    Converts input degrees to declination and returns the value in the format 30d0m0.0s.
+    Converts input degrees to declination and returns the value in the format 30d0m0.0s. The sign is formatted
+    separately from the absolute value, so declinations between -1 and 0 degrees keep it, e.g. -0d30m0.00s.
 
     :param deg: The input degree value.
     :return: dms: The converted degree value as dms string.
     """
+    sign = "-" if deg < 0 else ""
+    deg = abs(deg)
     d = int(deg)
-    rest = abs((deg - d) * 60)
+    rest = (deg - d) * 60
     m = int(rest)
     rest = rest - m
     s = rest * 60
-    dms = str(d) + "d" + str(m) + "m" + format(s, ".2f") + "s"
+    dms = sign + str(d) + "d" + str(m) + "m" + format(s, ".2f") + "s"
     return dms
 
 
 def convert_deg_to_hour(deg):
     """
-    Converts input degrees to right ascension and returns the value in the format 12h0m0.0s.
+    Converts input degrees to right ascension and returns the value in the format 12h0m0.0s. The sign is formatted
+    like in convert_deg_to_dms.
 
     :param deg: The input degree value.
     :return: ha: The converted degree value as hour angle string.
     """
-    dec = deg / 15
+    sign = "-" if deg < 0 else ""
+    dec = abs(deg) / 15
     h = int(dec)
-    rest = abs((dec - h) * 60)
+    rest = (dec - h) * 60
     m = int(rest)
     rest = rest - m
     s = rest * 60
-    ha = str(h) + "h" + str(m) + "m" + format(s, ".2f") + "s"
+    ha = sign + str(h) + "h" + str(m) + "m" + format(s, ".2f") + "s"
     return ha
 
 
+def convert_deg_to_dms_array(deg):
+    """
+    Converts an array of degrees to declinations in the format of convert_deg_to_dms.
+
+    :param deg: The input degree values as array.
+    :return: dms: The converted degree values as array of dms strings.
+    """
+    deg = np.asarray(deg, dtype=float)
+    absolute = np.abs(deg)
+    d = np.trunc(absolute)
+    rest = (absolute - d) * 60
+    m = np.trunc(rest)
+    s = (rest - m) * 60
+    return _format_sexagesimal("%s%dd%dm%.2fs", deg < 0, d, m, s)
+
+
+def convert_deg_to_hour_array(deg):
+    """
+    Converts an array of degrees to right ascensions in the format of convert_deg_to_hour.
+
+    :param deg: The input degree values as array.
+    :return: ha: The converted degree values as array of hour angle strings.
+    """
+    deg = np.asarray(deg, dtype=float)
+    dec = np.abs(deg) / 15
+    h = np.trunc(dec)
+    rest = (dec - h) * 60
+    m = np.trunc(rest)
+    s = (rest - m) * 60
+    return _format_sexagesimal("%s%dh%dm%.2fs", deg < 0, h, m, s)
+
+
+def _format_sexagesimal(template, negative, first, minutes, seconds):
+    """
+    Formats arrays of signs, whole degrees or hours, whole minutes and seconds of absolute values with a template as
+    array of strings.
+    """
+    signs = np.where(negative, "-", "").tolist()
+    return np.array([template % values for values in zip(signs, first.astype(np.int64).tolist(),
+                                                         minutes.astype(np.int64).tolist(), seconds.tolist())])
+
+
 def concat_ra_dec(ra, dec):
     """
     Concatenates right ascension and declination including the epoch and returns a direction string in the format
@@ -224,8 +473,7 @@ def calculate_beam_size(freq, dish_diam):
     :param dish_diam: The dish diameter.
     :return: beam_size: The beam size.
     """
-    # const.c is the speed of light
-    beam_size = const.c.value / (freq * 10 ** 9 * dish_diam)
+    beam_size = SPEED_OF_LIGHT / (freq * 10 ** 9 * dish_diam)
     return beam_size
 
 
@@ -241,13 +489,39 @@ def get_vis_string(folder, antennalist):
     return vis
 
 
+def get_directory_size(directory):
+    """
+    Returns the total size of the files in a directory tree. Symbolic links are not followed.
+
+    :param directory: The directory.
+    :return: size: The size in bytes.
+    """
+    size = 0
+    for path, subdirectories, files in os.walk(directory):
+        for name in files:
+            size += os.lstat(os.path.join(path, name)).st_size
+    return size
+
+
+def get_fork_context():
+    """
+    Returns the multiprocessing context that starts child processes by forking. Child processes of the pipeline
+    inherit the model with its CASA tasks, which can not be pickled, so they must be forked also where spawn is the
+    default start method, e.g. on macOS since Python 3.8. Python 2.7 has no contexts and always forks.
+
+    :return: context: The fork context or the multiprocessing module.
+    """
+    if hasattr(multiprocessing, "get_context"):
+        return multiprocessing.get_context("fork")
+    return multiprocessing
+
+
 def export_sources(sources, folder):
     """
-    Exports the source parameters as pickle file to the specified folder.
+    Exports the source parameters as pickle file to the Skymodel directory of the specified folder.
 
     :param sources: The source parameters.
     :param folder: The target folder.
     """
-    with open("sources.pkl", 'wb') as output:
+    with open(os.path.join(folder, "Skymodel", "sources.pkl"), 'wb') as output:
         pickle.dump(sources, output, pickle.HIGHEST_PROTOCOL)
-    os.system("mv sources.pkl " + folder + '/' + 'Skymodel')
@@ -0,0 +1,178 @@
+import errno
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+# Files and directories of the application directory that iterations read through relative paths.
+SHARED_RESOURCES = ["Skymaps", "Antennalists"]
+# Environment variable with the scratch directory, used if none is configured.
+SCRATCH_ENV = "SATRO_SCRATCH"
+# File in workspaces, artifact stores and publication staging directories naming the process and host that created
+# them.
+OWNER_FILE = ".owner"
+# Prefixes of the scratch directories of a run. junk_ directories are output folders that could not be removed.
+SCRATCH_PREFIXES = ["workspace_", "artifacts_"]
+JUNK_PREFIX = "junk_"
+# Scratch directories without owner file are considered stale after this many seconds.
+STALE_AGE = 24 * 3600
+
+
+class InsufficientSpaceError(Exception):
+    """Raised before a run if the scratch directory or the output path has not enough free space."""
+
+
+def get_scratch_dir(scratch=""):
+    """
+    Returns the scratch directory for the intermediate products of the iterations: the given directory or the one of
+    the environment variable SATRO_SCRATCH.
+
+    :param scratch: The configured scratch directory, empty if none is configured.
+    :return: scratch_dir: The absolute path of the scratch directory or "" if none is configured.
+    """
+    scratch = scratch or os.environ.get(SCRATCH_ENV, "")
+    if not scratch:
+        return ""
+    return os.path.abspath(os.path.expanduser(scratch))
+
+
+def create_directory(parent, prefix):
+    """
+    Creates and returns a new directory with a unique name and an owner file naming the current process and host, so
+    it can be identified as stale if the process dies without removing it.
+
+    :param parent: The directory to create the directory in.
+    :param prefix: The prefix of the directory name.
+    :return: directory: The absolute path of the created directory.
+    """
+    directory = tempfile.mkdtemp(prefix=prefix, dir=os.path.abspath(parent))
+    write_owner_file(directory)
+    return directory
+
+
+def write_owner_file(directory):
+    """Writes the owner file naming the current process and host into a directory, see is_stale."""
+    with open(os.path.join(directory, OWNER_FILE), 'w') as output:
+        output.write(str(os.getpid()) + " " + socket.gethostname() + "\n")
+
+
+def create_workspace(base_dir, antennalist, prefix="workspace_", scratch_dir=""):
+    """
+    Creates and returns a private scratch directory for one iteration. Shared resources of the application directory
+    and the antenna list, if it is located there, are linked into the workspace so relative paths keep working after
+    changing into it.
+
+    :param base_dir: The application directory the iteration would otherwise run in.
+    :param antennalist: The name of the selected antenna configuration.
+    :param prefix: The prefix of the workspace directory name.
+    :param scratch_dir: The directory to create the workspace in, the application directory if empty.
+    :return: workspace: The absolute path of the created workspace.
+    """
+    base_dir = os.path.abspath(base_dir)
+    workspace = create_directory(scratch_dir or base_dir, prefix)
+    for resource in SHARED_RESOURCES + [antennalist]:
+        source = os.path.join(base_dir, resource)
+        if os.path.exists(source) and not os.path.lexists(os.path.join(workspace, resource)):
+            os.symlink(source, os.path.join(workspace, resource))
+    return workspace
+
+
+def remove_workspace(workspace):
+    """
+    Removes a workspace created by create_workspace. Linked resources are unlinked, never followed.
+
+    :param workspace: The path of the workspace.
+    """
+    if os.path.isdir(workspace):
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def _process_exists(pid):
+    """Returns true if a process with the given id exists on this host."""
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+
+def is_stale(directory):
+    """
+    Returns true if a scratch or staging directory has been left by a crashed run: its owner process no longer
+    exists on this host, or it has no owner file and has not been modified for STALE_AGE seconds. Directories owned
+    by other hosts, for example on a shared file system, are never stale.
+
+    :param directory: The scratch or staging directory.
+    :return: stale: True if the directory can be removed.
+    """
+    try:
+        with open(os.path.join(directory, OWNER_FILE), 'r') as input_file:
+            pid, host = input_file.read().split()
+    except (IOError, OSError, ValueError):
+        try:
+            return time.time() - os.path.getmtime(directory) > STALE_AGE
+        except OSError:
+            return False
+    return host == socket.gethostname() and not _process_exists(int(pid))
+
+
+def remove_stale_directories(directory):
+    """
+    Removes the stale workspaces and artifact stores and all junk directories left in a directory by crashed runs.
+
+    :param directory: The application or scratch directory.
+    :return: removed: The names of the removed directories.
+    """
+    removed = []
+    if not directory or not os.path.isdir(directory):
+        return removed
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(path) or os.path.islink(path):
+            continue
+        if name.startswith(JUNK_PREFIX) or \
+                (any(name.startswith(prefix) for prefix in SCRATCH_PREFIXES) and is_stale(path)):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+    return removed
+
+
+def get_free_space(path):
+    """
+    Returns the free space in bytes available to the user on the file system of the given path or None if it can
+    not be determined.
+
+    :param path: A path on the file system.
+    """
+    try:
+        stat = os.statvfs(path)
+    except (AttributeError, OSError):
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def check_free_space(scratch_dir, output_path, scratch_bytes, output_bytes):
+    """
+    Checks the free space of the scratch directory and the output path against the estimated footprint of a run.
+    If both are on the same file system, outputs are renamed from the scratch directory into the output path and
+    only the output footprint is needed.
+
+    :param scratch_dir: The scratch directory or "" if the iterations run in the application directory.
+    :param output_path: The output path.
+    :param scratch_bytes: The bytes needed by the iterations running at the same time.
+    :param output_bytes: The bytes needed by the outputs of all iterations.
+    :raises InsufficientSpaceError: If a file system has less free space than needed.
+    """
+    scratch_dir = scratch_dir or os.getcwd()
+    required = {output_path: output_bytes}
+    if os.stat(scratch_dir).st_dev == os.stat(output_path).st_dev:
+        required[output_path] = max(output_bytes, scratch_bytes)
+    else:
+        required[scratch_dir] = scratch_bytes
+    for path, needed in required.items():
+        free = get_free_space(path)
+        if free is not None and free < needed:
+            raise InsufficientSpaceError("Not enough free space in " + path + ": " + str(int(needed / 1e6)) +
+                                         " MB estimated, " + str(int(free / 1e6)) + " MB available.")
+
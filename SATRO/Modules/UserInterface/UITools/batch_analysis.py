@@ -0,0 +1,216 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import traceback
+import numpy as np
+import pandas as pd
+
+import Pipeline.cache as cache
+from UserInterface.UITools.imagestats import REGIONS
+from UserInterface.UITools.metricscache import get_analysis_statistics
+from UserInterface.UITools.util import load_fits_files, close_fits_files, check_folder
+
+# The analysed FITS files of an output folder in the order of load_fits_files.
+FILES = ["image", "residual", "fidelity"]
+# The statistics of a region written to the table, see imagestats.calculate_image_statistics.
+METRICS = ["size", "count", "max", "min", "mean", "median", "sigma", "sum", "rms", "dr"]
+# The columns identifying a row of the table.
+KEY_COLUMNS = ["folder", "parameter", "index", "value", "fingerprint", "fits_file", "region"]
+DEFAULT_TABLE = "analysis"
+
+
+def find_output_folders(output_path):
+    """
+    Returns the output folders in the output path that the analysis tool can read, see util.check_folder, and the
+    other directories with the reasons they are skipped.
+
+    :param output_path: The output path of the simulations.
+    :returns:
+        - folders: The names of the valid output folders, sorted.
+        - skipped: A list of dictionaries with the keys "folder" and "errors".
+    """
+    folders = []
+    skipped = []
+    for name in sorted(os.listdir(output_path)):
+        directory = os.path.join(output_path, name)
+        if not os.path.isdir(directory):
+            continue
+        valid, error_messages = check_folder(directory, name)
+        if valid:
+            folders.append(name)
+        else:
+            skipped.append({"folder": name, "errors": error_messages})
+    return folders, skipped
+
+
+def get_parameter_value(parameters):
+    """
+    Returns the value of the varying parameter of an iteration from the parameter sets of its manifest.
+
+    :param parameters: The parameters of the manifest, see cache.write_manifest.
+    :return: value: The value or "" if no parameter was varied.
+    """
+    parameter = parameters.get("parameter")
+    if not parameter:
+        return ""
+    for name in ["skymodel", "simobserve", "simanalyze"]:
+        if parameter in parameters.get(name, {}):
+            return parameters[name][parameter]
+    for source in parameters.get("sources", []):
+        if parameter in source:
+            return source[parameter]
+    return ""
+
+
+def analyze_folder(output_path, folder):
+    """
+    Calculates the statistics of the analysis tool for the image, residual and fidelity of an output folder. The
+    varying parameter, its index and value and the fingerprint are read from the manifest, folders without manifest,
+    e.g. single runs of older versions, are analysed with empty keys. Statistics stored in the metrics sidecar of the
+    folder by the analysis page or an earlier batch analysis are reused, see metricscache.get_analysis_statistics.
+
+    :param output_path: The output path of the simulations.
+    :param folder: The name of the output folder.
+    :return: rows: A list of dictionaries with the keys of KEY_COLUMNS and METRICS, one for each file and region.
+    """
+    directory = os.path.join(output_path, folder)
+    manifest = cache.read_manifest(directory) or {}
+    parameters = manifest.get("parameters", {})
+    keys = {"folder": folder,
+            "parameter": parameters.get("parameter", ""),
+            "index": parameters.get("index", ""),
+            "value": get_parameter_value(parameters),
+            "fingerprint": manifest.get("fingerprint", "")}
+    with open(os.path.join(directory, "Skymodel", "sources.pkl"), "rb") as inputfile:
+        sources = pickle.load(inputfile)
+    fits_files = load_fits_files(os.path.join(directory, "FITS_Files", folder))
+    rows = []
+    try:
+        for name, fits_file in zip(FILES, fits_files):
+            statistics = get_analysis_statistics(directory, name, fits_file, sources)
+            for region in REGIONS:
+                row = dict(keys, fits_file=name, region=region)
+                row.update((metric, statistics[region][metric]) for metric in METRICS)
+                rows.append(row)
+    finally:
+        close_fits_files(fits_files)
+    return rows
+
+
+def analyze_folder_isolated(arguments):
+    """
+    Analyses an output folder in a worker process of analyze_output. Errors are returned instead of raised, so a
+    broken folder does not stop the others.
+
+    :param arguments: A tuple of the number of the folder, the output path and the folder name.
+    :return: number, rows, error: The number of the folder, its rows and the formatted traceback or None.
+    """
+    number, output_path, folder = arguments
+    try:
+        return number, analyze_folder(output_path, folder), None
+    except Exception:
+        return number, [], traceback.format_exc()
+
+
+def analyze_output(output_path, processes=1):
+    """
+    Analyses all output folders of an output path, in parallel in a pool of worker processes if more than one
+    process is given. Each worker analyses a whole folder, so the folders are independent tasks and the runtime
+    scales with the number of processes until the storage is saturated.
+
+    :param output_path: The output path of the simulations.
+    :param processes: The number of worker processes.
+    :returns:
+        - table: A pandas.DataFrame with the columns of KEY_COLUMNS and METRICS, sorted by parameter, index, FITS
+                 file and region.
+        - skipped: A list of dictionaries with the keys "folder" and "errors" of the directories that are no valid
+                   output folders.
+        - failed: A list of dictionaries with the keys "folder" and "error" of the folders whose analysis failed.
+    """
+    folders, skipped = find_output_folders(output_path)
+    tasks = [(number, output_path, folder) for number, folder in enumerate(folders)]
+    results = [None] * len(folders)
+    if processes > 1 and len(folders) > 1:
+        pool = multiprocessing.Pool(min(processes, len(folders)))
+        try:
+            for number, rows, error in pool.imap_unordered(analyze_folder_isolated, tasks, chunksize=1):
+                results[number] = (rows, error)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            number, rows, error = analyze_folder_isolated(task)
+            results[number] = (rows, error)
+
+    table_rows = []
+    failed = []
+    for folder, (rows, error) in zip(folders, results):
+        if error:
+            sys.stderr.write("Analysis of " + folder + " failed:\n" + error)
+            failed.append({"folder": folder, "error": error.strip().splitlines()[-1]})
+        table_rows.extend(rows)
+    table = pd.DataFrame(table_rows, columns=KEY_COLUMNS + METRICS)
+    # single runs have the index "", which can not be compared with the indices of multiple runs
+    order = pd.DataFrame({"parameter": table["parameter"],
+                          "index": [-1 if index == "" else index for index in table["index"]],
+                          "folder": table["folder"],
+                          "fits_file": [FILES.index(name) for name in table["fits_file"]],
+                          "region": [REGIONS.index(region) for region in table["region"]]})
+    order = order.sort_values(["parameter", "index", "folder", "fits_file", "region"], kind="mergesort")
+    return table.loc[order.index].reset_index(drop=True), skipped, failed
+
+
+def write_table(table, path):
+    """
+    Writes the table as CSV file and as compressed NumPy archive with one array per column. Text columns and the
+    values of the varying parameter, which can be numbers or quantity strings, are stored as strings in the archive.
+
+    :param table: The table of analyze_output.
+    :param path: The path of the files without extension.
+    :returns:
+        - csv_file: The written CSV file.
+        - npz_file: The written NumPy archive.
+    """
+    csv_file = path + ".csv"
+    npz_file = path + ".npz"
+    table.to_csv(csv_file, index=False)
+    arrays = {}
+    for column in table.columns:
+        values = np.asarray(table[column])
+        arrays[column] = values.astype(str) if values.dtype.kind == "O" else values
+    np.savez_compressed(npz_file, **arrays)
+    return csv_file, npz_file
+
+
+def main(args):
+    """
+    Command line entry point of the batch analysis. Writes a JSON summary to stdout.
+
+    :param args: The command line arguments of the script.
+    :return: status: The exit status, 1 if a folder could not be analysed else 0.
+    """
+    parser = argparse.ArgumentParser(prog="analysis_starter.py",
+                                     description="Calculates the statistics of the analysis tool for all output "
+                                                 "folders of a simulation run.")
+    parser.add_argument("output_path", help="directory the output folders were written to")
+    parser.add_argument("--processes", type=int, default=1, help="number of folders analysed in parallel")
+    parser.add_argument("--table", help="path of the CSV and NPZ files without extension, defaults to " +
+                                        DEFAULT_TABLE + " in the output path")
+    options = parser.parse_args(args)
+
+    table, skipped, failed = analyze_output(options.output_path, options.processes)
+    csv_file, npz_file = write_table(table, options.table or os.path.join(options.output_path, DEFAULT_TABLE))
+    summary = {"output_path": os.path.abspath(options.output_path),
+               "folders": int(table["folder"].nunique()),
+               "rows": len(table),
+               "csv": csv_file,
+               "npz": npz_file,
+               "skipped": skipped,
+               "failed": failed}
+    json.dump(summary, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
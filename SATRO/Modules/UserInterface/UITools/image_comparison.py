@@ -1,12 +1,12 @@
 import Tkinter as tk
 import tkFileDialog
 import tkMessageBox
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 from astropy.io import fits
 
-from UserInterface.UITools.util import create_comparison_plot
+from UserInterface.UITools.util import create_comparison_plot, get_image_hdu, get_image_data, get_image_shape, \
+    LazyFitsFile, close_fits_files
 from UserInterface.util.popupwindow import PopupWindows
 
 
@@ -26,11 +26,12 @@ class ComparisonPage(tk.Frame):
         tk.Frame.__init__(self, *args, **kwargs)
         self.loaded_fits1 = False
         self.loaded_fits2 = False
+        self.fits_file1 = None
+        self.fits_file2 = None
         self.popup = PopupWindows()
         self.initialize_widgets()
         self.layout_widgets()
-        plt.ioff()
-        plt.style.use('dark_background')
+        self.bind("<Destroy>", self.close_files)
 
     def initialize_widgets(self):
         """Initializes all needed widgets for the page."""
@@ -88,7 +89,8 @@ class ComparisonPage(tk.Frame):
         self.entry_browse1.delete(0, tk.END)
         self.entry_browse1.insert(0, self.filename1)
         if self.filename1:
-            self.fits_file1 = fits.open(self.filename1)
+            close_fits_files([self.fits_file1])
+            self.fits_file1 = LazyFitsFile(self.filename1)
             self.button_show1.configure(state="normal")
             self.loaded_fits1 = True
             self.activate_compare_button()
@@ -103,7 +105,8 @@ class ComparisonPage(tk.Frame):
         self.entry_browse2.delete(0, tk.END)
         self.entry_browse2.insert(0, self.filename2)
         if self.filename2:
-            self.fits_file2 = fits.open(self.filename2)
+            close_fits_files([self.fits_file2])
+            self.fits_file2 = LazyFitsFile(self.filename2)
             self.button_show2.configure(state="normal")
             self.loaded_fits2 = True
             self.activate_compare_button()
@@ -136,12 +139,18 @@ class ComparisonPage(tk.Frame):
             tkMessageBox.showerror("Invalid Folder", error_string, parent=self)
             return
 
-        residual = np.array(self.fits_file1[0].data).squeeze() - np.array(self.fits_file2[0].data).squeeze()
+        # the only array of the image size, the inputs are views of the memory-mapped files
+        residual = np.subtract(get_image_data(get_image_hdu(self.fits_file1)),
+                               get_image_data(get_image_hdu(self.fits_file2)))
         hdu = fits.PrimaryHDU(residual)
         fig_residual = create_comparison_plot([hdu], "Residual of " + os.path.split(self.filename1)[1] + " - \n" +
                                               os.path.split(self.filename2)[1])
         fig_residual.show()
 
+    def close_files(self, event=None):
+        """Closes the loaded FITS files. Called when the page is destroyed."""
+        close_fits_files([self.fits_file1, self.fits_file2])
+
 
 def check_fits_files(fits1, fits2):
     """
@@ -154,21 +163,21 @@ def check_fits_files(fits1, fits2):
     valid = True
     error_messages = []
 
-    header1 = fits1[0].header
-    data1 = np.array(fits1[0].data).squeeze()
+    header1 = get_image_hdu(fits1).header
+    shape1 = get_image_shape(get_image_hdu(fits1))
     b_unit1 = header1["BUNIT"]
     if not b_unit1:
         b_unit1 = "None"
 
-    header2 = fits2[0].header
-    data2 = np.array(fits2[0].data).squeeze()
+    header2 = get_image_hdu(fits2).header
+    shape2 = get_image_shape(get_image_hdu(fits2))
     b_unit2 = header2["BUNIT"]
     if not b_unit2:
         b_unit2 = "None"
 
-    if not data1.shape == data2.shape:
-        error_messages.append("- Shapes of the images are not equal. \nShape image1: " + str(data1.shape) +
-                              "\nShape image2: " + str(data2.shape))
+    if not shape1 == shape2:
+        error_messages.append("- Shapes of the images are not equal. \nShape image1: " + str(shape1) +
+                              "\nShape image2: " + str(shape2))
         valid = False
     if not b_unit1 == b_unit2:
         error_messages.append("- Brightness (pixel) unit  of the images are not equal. \nUnit image1: " + b_unit1 +
@@ -0,0 +1,226 @@
+import math
+import numpy as np
+
+# Version of the statistics, increased whenever their computation changes, so cached statistics are recomputed.
+METRICS_VERSION = 1
+# Regions of an image the statistics are computed for: all pixels, the pixels in the source boxes and the others.
+REGIONS = ["image", "onsource", "offsource"]
+# Bin estimators of the histograms of the regions, as used by numpy.histogram and matplotlib.
+DEFAULT_BINS = {"image": "scott", "onsource": "sturges", "offsource": "scott"}
+# Maximum number of pixels converted and held in memory at once.
+CHUNK_PIXELS = 1 << 22
+# Maximum number of values sorted to select the median exactly, the number of bins the values are divided into if
+# there are more, and the maximum number of times this is repeated.
+SELECTION_LIMIT = 1 << 20
+SELECTION_BINS = 4096
+MAX_REFINEMENTS = 8
+
+
+def _iter_chunks(data, boxes, chunk_pixels):
+    """
+    Yields the finite values of blocks of rows of the image as float64 arrays in a dictionary with the regions as
+    keys, and the number of on-source pixels of the block. Non-finite pixels, e.g. blanked NaN pixels, are left out.
+    If a block has no on-source pixels, the off-source values are the same array as the image values.
+    """
+    rows = max(1, chunk_pixels // max(1, data.shape[1]))
+    for start in range(0, data.shape[0], rows):
+        block = np.asarray(data[start:start + rows], dtype=np.float64)
+        finite = np.isfinite(block)
+        image = block[finite]
+        onsource = None
+        for row_lower, row_upper, column_lower, column_upper in boxes:
+            lower, upper = max(row_lower, start), min(row_upper, start + block.shape[0])
+            if lower < upper and column_lower < column_upper:
+                if onsource is None:
+                    onsource = np.zeros(block.shape, dtype=bool)
+                onsource[lower - start:upper - start, column_lower:column_upper] = True
+        if onsource is None:
+            yield {"image": image, "onsource": image[:0], "offsource": image}, 0
+        else:
+            yield {"image": image,
+                   "onsource": block[finite & onsource],
+                   "offsource": block[finite & ~onsource]}, int(onsource.sum())
+
+
+def _in_range(values, lower, upper, closed):
+    """Returns the values in [lower, upper), or in [lower, upper] if closed, like the bins of numpy.histogram."""
+    return values[(values >= lower) & ((values <= upper) if closed else (values < upper))]
+
+
+def _histogram(values, edges):
+    """Returns the counts of values in equal bins with the given edges, using the fast path of numpy.histogram."""
+    return np.histogram(values, len(edges) - 1, (edges[0], edges[-1]))[0]
+
+
+def get_bin_edges(estimator, count, minimum, maximum, sigma):
+    """
+    Returns the histogram bin edges numpy.histogram_bin_edges computes from the values, from their count, range and
+    standard deviation instead.
+
+    :param estimator: "scott", "sturges" or the number of bins.
+    :param count: The number of values.
+    :param minimum: The minimum of the values.
+    :param maximum: The maximum of the values.
+    :param sigma: The standard deviation of the values.
+    :return: edges: The bin edges as array.
+    """
+    if count == 0:
+        return np.array([0.0, 1.0])
+    if minimum == maximum:
+        minimum, maximum = minimum - 0.5, maximum + 0.5
+    if estimator == "scott":
+        width = (24.0 * math.pi ** 0.5 / count) ** (1.0 / 3.0) * sigma
+        bins = int(math.ceil((maximum - minimum) / width)) if width else 1
+    elif estimator == "sturges":
+        bins = int(math.ceil(math.log(count, 2) + 1.0))
+    else:
+        bins = int(estimator)
+    return np.linspace(minimum, maximum, bins + 1)
+
+
+def _select_ranks(data, boxes, searches, chunk_pixels):
+    """
+    Returns the values of given ranks of the sorted finite values of regions. The histogram of a region locates the
+    bins holding the ranks. If these bins hold at most SELECTION_LIMIT values, the values are collected and sorted.
+    Else the values in these bins are divided into SELECTION_BINS bins over the range they span and the search
+    repeats. The regions are searched together, so every step is one pass over the image.
+
+    :param searches: A dictionary with regions as keys and (ranks, counts, edges) tuples as values.
+    :return: selected: A dictionary with the regions as keys and the values of the ranks as lists.
+    """
+    selected = {}
+    for refinement in range(MAX_REFINEMENTS + 1):
+        collect, refine = {}, {}
+        for region, (ranks, counts, edges) in searches.items():
+            cumulative = np.cumsum(counts)
+            first = int(np.searchsorted(cumulative, ranks[0], side="right"))
+            last = int(np.searchsorted(cumulative, ranks[-1], side="right"))
+            below = int(cumulative[first - 1]) if first else 0
+            bounds = (edges[first], edges[last + 1], last == len(counts) - 1)
+            ranks = [rank - below for rank in ranks]
+            if int(cumulative[last]) - below <= SELECTION_LIMIT or refinement == MAX_REFINEMENTS:
+                collect[region] = (ranks, bounds, [])
+            else:
+                refine[region] = (ranks, bounds, [np.inf, -np.inf])
+        for values, onsource in _iter_chunks(data, boxes, chunk_pixels):
+            for region, (ranks, bounds, parts) in collect.items():
+                parts.append(_in_range(values[region], *bounds))
+            for region, (ranks, bounds, extremes) in refine.items():
+                inside = _in_range(values[region], *bounds)
+                if inside.size:
+                    extremes[:] = [min(extremes[0], inside.min()), max(extremes[1], inside.max())]
+        for region, (ranks, bounds, parts) in collect.items():
+            values = np.sort(np.concatenate(parts))
+            selected[region] = [float(values[rank]) for rank in ranks]
+        searches = {}
+        for region, (ranks, bounds, extremes) in refine.items():
+            if extremes[0] == extremes[1]:
+                selected[region] = [float(extremes[0])] * len(ranks)
+            else:
+                searches[region] = (ranks, np.zeros(SELECTION_BINS, dtype=np.int64),
+                                    np.linspace(extremes[0], extremes[1], SELECTION_BINS + 1))
+        if not searches:
+            return selected
+        for values, onsource in _iter_chunks(data, boxes, chunk_pixels):
+            for region, (ranks, counts, edges) in searches.items():
+                counts += _histogram(_in_range(values[region], edges[0], edges[-1], True), edges)
+    return selected
+
+
+def _summarize(values):
+    """Returns count, mean, squared deviations, sum, sum of squares, minimum and maximum of values."""
+    mean = values.mean()
+    deviations = values - mean
+    return values.size, mean, np.dot(deviations, deviations), values.sum(), np.dot(values, values), values.min(), \
+        values.max()
+
+
+def calculate_image_statistics(data, boxes=(), bins=None, chunk_pixels=CHUNK_PIXELS):
+    """
+    Calculates the statistics of an image and of its on-source and off-source pixels, ignoring non-finite pixels.
+    The image is read in blocks of at most chunk_pixels pixels, so memory-mapped images are never loaded as a whole
+    and no temporaries of the image size are created. The first pass accumulates count, sum, sum of squares, mean,
+    squared deviations, minimum and maximum of all regions, the second pass computes the histograms. The exact
+    median is then selected from the values in the histogram bin holding it, which are read in one more pass.
+
+    :param data: The two-dimensional image, e.g. the data of a FITS HDU.
+    :param boxes: The source boxes as (row_lower, row_upper, column_lower, column_upper) tuples, see
+                  util.get_source_boxes. Pixels in a box are on-source.
+    :param bins: A dictionary with the bin estimator ("scott", "sturges") or number of bins of the histogram of
+                 regions, see DEFAULT_BINS.
+    :param chunk_pixels: The maximum number of pixels held in memory at once.
+    :return: statistics: A dictionary with the regions of REGIONS as keys and dictionaries as values with the keys
+                         "size" (all pixels), "count" (finite pixels), "max", "min", "mean", "median", "sigma"
+                         (standard deviation about the mean), "sum", "rms", "dr" (maximum of the image divided by the
+                         rms of the region) and "histogram" (counts and bin edges as returned by numpy.histogram).
+                         The values of regions without finite pixels are NaN.
+    """
+    if data.ndim != 2:
+        raise ValueError("Statistics need a two-dimensional image, not the shape " + str(data.shape) + ".")
+    bins = dict(DEFAULT_BINS, **(bins or {}))
+    moments = dict((region, [0, 0.0, 0.0, 0.0, 0.0, np.inf, -np.inf]) for region in REGIONS)
+    onsource_size = 0
+    for values, onsource in _iter_chunks(data, boxes, chunk_pixels):
+        onsource_size += onsource
+        summaries = {}
+        for region in REGIONS:
+            if not values[region].size:
+                continue
+            if id(values[region]) not in summaries:
+                summaries[id(values[region])] = _summarize(values[region])
+            count, mean, deviations, total, squares, minimum, maximum = summaries[id(values[region])]
+            moment = moments[region]
+            # merges the mean and the squared deviations of the block with those of the previous blocks
+            delta = mean - moment[1]
+            moment[2] += deviations + delta * delta * moment[0] * count / (moment[0] + count)
+            moment[1] += delta * count / (moment[0] + count)
+            moment[0] += count
+            moment[3] += total
+            moment[4] += squares
+            moment[5] = min(moment[5], minimum)
+            moment[6] = max(moment[6], maximum)
+
+    size = int(data.shape[0] * data.shape[1])
+    sizes = {"image": size, "onsource": onsource_size, "offsource": size - onsource_size}
+    statistics = {}
+    nan = float("nan")
+    for region in REGIONS:
+        count, mean, deviations, total, squares, minimum, maximum = moments[region]
+        sigma = math.sqrt(deviations / count) if count else nan
+        edges = get_bin_edges(bins[region], count, minimum, maximum, sigma)
+        statistics[region] = {"size": sizes[region],
+                              "count": count,
+                              "max": float(maximum) if count else nan,
+                              "min": float(minimum) if count else nan,
+                              "mean": float(mean) if count else nan,
+                              "median": float(minimum) if count and minimum == maximum else nan,
+                              "sigma": sigma,
+                              "sum": float(total) if count else nan,
+                              "rms": math.sqrt(squares / count) if count else nan,
+                              "histogram": (np.zeros(len(edges) - 1, dtype=np.int64), edges)}
+
+    for values, onsource in _iter_chunks(data, boxes, chunk_pixels):
+        histograms = {}
+        for region in REGIONS:
+            if not values[region].size:
+                continue
+            counts, edges = statistics[region]["histogram"]
+            key = (id(values[region]), len(edges), edges[0], edges[-1])
+            if key not in histograms:
+                histograms[key] = _histogram(values[region], edges)
+            counts += histograms[key]
+
+    searches = {}
+    for region in REGIONS:
+        region_statistics = statistics[region]
+        if region_statistics["rms"]:
+            region_statistics["dr"] = statistics["image"]["max"] / region_statistics["rms"]
+        else:
+            region_statistics["dr"] = nan
+        count = region_statistics["count"]
+        if count and region_statistics["min"] < region_statistics["max"]:
+            # the median is the middle value, or the mean of the two middle values of an even count
+            searches[region] = (sorted(set([(count - 1) // 2, count // 2])),) + region_statistics["histogram"]
+    for region, values in _select_ranks(data, boxes, searches, chunk_pixels).items():
+        statistics[region]["median"] = (values[0] + values[-1]) / 2.0
+    return statistics
@@ -0,0 +1,122 @@
+import json
+import os
+import numpy as np
+
+import Pipeline.cache as cache
+from UserInterface.UITools.imagestats import METRICS_VERSION
+from UserInterface.UITools.util import get_image_hdu, calculate_analysis_statistics
+
+
+def get_sidecar_file(directory):
+    """Returns the metrics sidecar of an output folder, next to its FITS_Files directory."""
+    return os.path.join(directory, cache.METRICS_FILE)
+
+
+def read_sidecar(directory):
+    """
+    Returns the cached metrics of an output folder. A missing or unreadable sidecar or one written by another version
+    of the statistics is empty.
+
+    :param directory: The output folder.
+    :return: entries: A dictionary with the FITS file kinds as keys, see write_sidecar.
+    """
+    try:
+        with open(get_sidecar_file(directory), 'r') as input_file:
+            sidecar = json.load(input_file)
+    except (IOError, OSError, ValueError):
+        return {}
+    if sidecar.get("version") != METRICS_VERSION:
+        return {}
+    return sidecar.get("files", {})
+
+
+def write_sidecar(directory, entries):
+    """
+    Writes the metrics sidecar of an output folder. The file is replaced atomically, so the analysis page and the
+    batch analysis never read a partial file, and a sidecar hard-linked by the output cache is not changed.
+
+    :param directory: The output folder.
+    :param entries: A dictionary with the FITS file kinds ("image", "residual", "fidelity") as keys and dictionaries
+                    with the keys "size", "mtime", "sha1", "sources_sha1" and "statistics" as values.
+    """
+    temporary = get_sidecar_file(directory) + ".writing"
+    with open(temporary, 'w') as output:
+        json.dump({"version": METRICS_VERSION, "files": entries}, output, sort_keys=True)
+    os.rename(temporary, get_sidecar_file(directory))
+
+
+def _to_json(statistics):
+    """Returns statistics with the histograms as lists."""
+    return dict((region, dict(values, histogram=[values["histogram"][0].tolist(), values["histogram"][1].tolist()]))
+                for region, values in statistics.items())
+
+
+def _from_json(statistics):
+    """Returns statistics read from a sidecar with the histograms as arrays."""
+    return dict((region, dict(values, histogram=(np.array(values["histogram"][0], dtype=np.int64),
+                                                 np.array(values["histogram"][1], dtype=np.float64))))
+                for region, values in statistics.items())
+
+
+def is_valid(entry, path, sources_sha1):
+    """
+    Returns true if a cached entry belongs to the current FITS file and sources. Size and modification time are
+    compared first. If the file was modified or copied but has the recorded size, its checksum decides.
+
+    :param entry: The cached entry, see write_sidecar.
+    :param path: The FITS file.
+    :param sources_sha1: The checksum of the sources file.
+    :return: valid: True if the cached statistics can be used.
+    """
+    status = os.stat(path)
+    if entry.get("sources_sha1") != sources_sha1 or entry.get("size") != status.st_size:
+        return False
+    if entry.get("mtime") == status.st_mtime:
+        return True
+    if entry.get("sha1") == cache.hash_file(path):
+        entry["mtime"] = status.st_mtime
+        return True
+    return False
+
+
+def get_analysis_statistics(directory, kind, fits_file, sources):
+    """
+    Returns the statistics of the analysis tool for a FITS file of an output folder, see
+    util.calculate_analysis_statistics. They are read from the metrics sidecar of the folder if they were computed
+    for the same file, sources and version of the statistics, else computed and stored in the sidecar. If the
+    folder is read-only, the statistics are computed every time.
+
+    :param directory: The output folder.
+    :param kind: The kind of the FITS file: "image", "residual" or "fidelity".
+    :param fits_file: The FITS file as returned by util.load_fits_files.
+    :param sources: The source parameters of the output folder, as stored in sources.pkl.
+    :return: statistics: The statistics by region, see imagestats.calculate_image_statistics.
+    """
+    entries = read_sidecar(directory)
+    sources_sha1 = cache.hash_file(os.path.join(directory, "Skymodel", "sources.pkl"))
+    entry = entries.get(kind)
+    if entry is not None:
+        mtime = entry.get("mtime")
+        if is_valid(entry, fits_file.path, sources_sha1):
+            if entry["mtime"] != mtime:
+                _store(directory, entries)
+            return _from_json(entry["statistics"])
+    statistics = calculate_analysis_statistics(get_image_hdu(fits_file), sources)
+    status = os.stat(fits_file.path)
+    # read again, the batch analysis or another page may have stored other files in the meantime
+    entries = read_sidecar(directory)
+    entries[kind] = {"size": status.st_size,
+                     "mtime": status.st_mtime,
+                     "sha1": cache.hash_file(fits_file.path),
+                     "sources_sha1": sources_sha1,
+                     "statistics": _to_json(statistics)}
+    _store(directory, entries)
+    return statistics
+
+
+def _store(directory, entries):
+    """Writes the metrics sidecar, ignoring read-only output folders."""
+    try:
+        write_sidecar(directory, entries)
+    except (IOError, OSError):
+        pass
@@ -2,15 +2,10 @@ import pickle
 import Tkinter as tk
 import tkFileDialog
 import os.path
-import matplotlib.pyplot as plt
 
-from UserInterface.UITools.util import load_fits_files, create_analysis_plot, check_folder
+from UserInterface.UITools.util import load_fits_files, close_fits_files, create_analysis_plot, check_folder
+from UserInterface.UITools.metricscache import get_analysis_statistics
 from UserInterface.util.popupwindow import PopupWindows
-
-try:
-    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk as navTool
-except ImportError:
-    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg as navTool
 import tkMessageBox
 
 
@@ -28,11 +23,11 @@ class AnalysisPage(tk.Frame):
         :param kwargs: keyword arguments
         """
         tk.Frame.__init__(self, *args, **kwargs)
+        self.fits_files = []
         self.popup = PopupWindows()
         self.initialize_widgets()
         self.layout_widgets()
-        plt.ioff()
-        plt.style.use('dark_background')
+        self.bind("<Destroy>", self.close_files)
 
     def initialize_widgets(self):
         """Initializes all needed widgets for the page."""
@@ -93,6 +88,8 @@ class AnalysisPage(tk.Frame):
                 tkMessageBox.showerror("Invalid Folder", error_string, parent=self)
                 return
 
+            close_fits_files(self.fits_files)
+            self.path_folder = path_folder
             self.fits_files = load_fits_files(path_folder + "/FITS_Files/" + self.name_folder)
             with open(path_folder + "/Skymodel/sources.pkl", "rb") as inputfile:
                 self.sources = pickle.load(inputfile)
@@ -103,15 +100,26 @@ class AnalysisPage(tk.Frame):
 
     def display_image(self):
         """Displays the image plots."""
-        self.fig_image = create_analysis_plot(self.fits_files[0], self.name_folder + " Image", self.sources)
+        self.fig_image = create_analysis_plot(self.fits_files[0], self.name_folder + " Image", self.sources,
+                                              self.get_statistics("image", 0))
         self.fig_image.show()
 
     def display_residual(self):
         """Displays the residual plots."""
-        self.fig_residual = create_analysis_plot(self.fits_files[1], self.name_folder + " CLEAN-Residual", self.sources)
+        self.fig_residual = create_analysis_plot(self.fits_files[1], self.name_folder + " CLEAN-Residual", self.sources,
+                                                 self.get_statistics("residual", 1))
         self.fig_residual.show()
 
     def display_fidelity(self):
         """Displays the fidelity plots."""
-        self.fig_fidelity = create_analysis_plot(self.fits_files[2], self.name_folder + " Fidelity", self.sources)
+        self.fig_fidelity = create_analysis_plot(self.fits_files[2], self.name_folder + " Fidelity", self.sources,
+                                                 self.get_statistics("fidelity", 2))
         self.fig_fidelity.show()
+
+    def get_statistics(self, kind, number):
+        """Returns the statistics of a FITS file of the loaded folder, from its metrics sidecar if possible."""
+        return get_analysis_statistics(self.path_folder, kind, self.fits_files[number], self.sources)
+
+    def close_files(self, event=None):
+        """Closes the FITS files of the loaded folder. Called when the page is destroyed."""
+        close_fits_files(self.fits_files)
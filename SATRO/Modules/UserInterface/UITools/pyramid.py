@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+import numpy as np
+
+import Pipeline.cache as cache
+
+# Version of the pyramid files, increased whenever the reduction changes, so cached pyramids are rebuilt.
+PYRAMID_VERSION = 1
+PYRAMID_INFO = "pyramid.json"
+# Reductions of 2x2 pixel blocks: the mean of the finite pixels, or their maximum, which keeps point sources visible
+# at every level.
+REDUCTIONS = ["mean", "max"]
+DEFAULT_REDUCTION = "mean"
+# Levels are halved until both sides are at most this many pixels.
+MIN_LEVEL_SIZE = 512
+# Images with a side longer than this are displayed from a pyramid.
+PYRAMID_THRESHOLD = 2048
+# Maximum number of pixels of the finer level reduced at once.
+CHUNK_PIXELS = 1 << 22
+
+
+def get_pyramid_directory(fits_path):
+    """Returns the directory of the cached pyramid of a FITS file, next to the file."""
+    return fits_path + cache.PYRAMID_SUFFIX
+
+
+def reduce_block(data, reduction):
+    """
+    Reduces an image by 2 along both axes, ignoring non-finite pixels. Odd sides are padded with NaN, so the last
+    row and column are reduced from fewer pixels. Blocks without finite pixels are NaN.
+
+    :param data: The image as two-dimensional array.
+    :param reduction: "mean" or "max", see REDUCTIONS.
+    :return: reduced: The reduced image as float32 array of shape ((rows + 1) // 2, (columns + 1) // 2).
+    """
+    rows, columns = data.shape
+    padded = np.full((rows + rows % 2, columns + columns % 2), np.nan, dtype=np.float32)
+    padded[:rows, :columns] = data
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    finite = np.isfinite(blocks)
+    count = finite.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if reduction == "max":
+            reduced = np.where(finite, blocks, -np.inf).max(axis=(1, 3))
+        else:
+            reduced = np.where(finite, blocks, 0).sum(axis=(1, 3), dtype=np.float64) / count
+    return np.where(count > 0, reduced, np.nan).astype(np.float32)
+
+
+def _build_level(data, target, reduction, chunk_pixels):
+    """Fills the next coarser level from an image in blocks of an even number of rows."""
+    rows = max(2, (chunk_pixels // max(1, data.shape[1])) // 2 * 2)
+    for start in range(0, data.shape[0], rows):
+        target[start // 2:(start + rows + 1) // 2] = reduce_block(np.asarray(data[start:start + rows]), reduction)
+
+
+def _get_shapes(shape):
+    """Returns the shapes of the levels of an image after the full resolution."""
+    shapes = []
+    while max(shape) > MIN_LEVEL_SIZE:
+        shape = ((shape[0] + 1) // 2, (shape[1] + 1) // 2)
+        shapes.append(shape)
+    return shapes
+
+
+def build_pyramid(data, reduction=DEFAULT_REDUCTION, directory=None, chunk_pixels=CHUNK_PIXELS):
+    """
+    Builds the levels of a multi-resolution pyramid of an image, each half the size of the previous one, until both
+    sides are at most MIN_LEVEL_SIZE pixels. Each level is reduced from the previous one in blocks of rows, so a
+    memory-mapped image is never loaded as a whole.
+
+    :param data: The image as two-dimensional array.
+    :param reduction: The reduction of 2x2 blocks, see REDUCTIONS.
+    :param directory: The directory the levels are written to as .npy files, None to keep them in memory.
+    :param chunk_pixels: The maximum number of pixels of the finer level reduced at once.
+    :return: levels: The levels as float32 arrays, without the full resolution. Memory-mapped if a directory is given.
+    """
+    if reduction not in REDUCTIONS:
+        raise ValueError("Unknown pyramid reduction: " + str(reduction))
+    levels = []
+    previous = data
+    for number, shape in enumerate(_get_shapes(data.shape)):
+        if directory is None:
+            level = np.empty(shape, dtype=np.float32)
+        else:
+            level = np.lib.format.open_memmap(os.path.join(directory, "level_" + str(number + 1) + ".npy"), mode="w+",
+                                              dtype=np.float32, shape=shape)
+        _build_level(previous, level, reduction, chunk_pixels)
+        if directory is not None:
+            level.flush()
+        levels.append(level)
+        previous = level
+    return levels
+
+
+def _get_info(fits_path, shape, reduction):
+    """Returns the key of the cached pyramid of a FITS file."""
+    status = os.stat(fits_path)
+    return {"version": PYRAMID_VERSION,
+            "size": status.st_size,
+            "mtime": status.st_mtime,
+            "shape": list(shape),
+            "reduction": reduction}
+
+
+def _load_cached_pyramid(directory, info):
+    """Returns the memory-mapped levels of a cached pyramid or None if it is missing or outdated."""
+    try:
+        with open(os.path.join(directory, PYRAMID_INFO), 'r') as input_file:
+            if json.load(input_file) != info:
+                return None
+        return [np.load(os.path.join(directory, "level_" + str(number + 1) + ".npy"), mmap_mode="r")
+                for number in range(len(_get_shapes(info["shape"])))]
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def get_pyramid(data, fits_path=None, reduction=DEFAULT_REDUCTION):
+    """
+    Returns the pyramid of an image, see build_pyramid. The pyramid of a FITS file is cached next to the file, see
+    get_pyramid_directory, and rebuilt if the file changes. Images without file, e.g. the residual of two images, and
+    FITS files in read-only directories get a pyramid in memory.
+
+    :param data: The image as two-dimensional array.
+    :param fits_path: The FITS file of the image or None.
+    :param reduction: The reduction of 2x2 blocks, see REDUCTIONS.
+    :return: levels: The levels as float32 arrays, without the full resolution.
+    """
+    if fits_path is None:
+        return build_pyramid(data, reduction)
+    directory = get_pyramid_directory(fits_path)
+    info = _get_info(fits_path, data.shape, reduction)
+    levels = _load_cached_pyramid(directory, info)
+    if levels is not None:
+        return levels
+    temporary = directory + ".building"
+    try:
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        levels = build_pyramid(data, reduction, temporary)
+        with open(os.path.join(temporary, PYRAMID_INFO), 'w') as output:
+            json.dump(info, output, sort_keys=True)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(temporary, directory)
+    except (IOError, OSError):
+        shutil.rmtree(temporary, ignore_errors=True)
+        return build_pyramid(data, reduction)
+    return _load_cached_pyramid(directory, info) or levels
+
+
+class PyramidView(object):
+    """
+    Displays an image in matplotlib axes from the level of its pyramid that matches the resolution of the axes on
+    screen. Only the visible part of the level is drawn. When the axes are zoomed or panned, the finer level and
+    part matching the new view are drawn, down to the full resolution.
+    """
+
+    def __init__(self, plot, data, levels, **kwargs):
+        """
+        Draws the image with imshow in pixel coordinates of the full resolution, so WCS axes keep their coordinates.
+
+        :param plot: The matplotlib axes.
+        :param data: The image at full resolution.
+        :param levels: The pyramid of the image, see get_pyramid.
+        :param kwargs: Keyword arguments of imshow, e.g. cmap, vmin and vmax.
+        """
+        self.plot = plot
+        self.levels = [data] + list(levels)
+        self.shape = data.shape
+        self.updating = False
+        level, rows, columns = self.select(-0.5, self.shape[1] - 0.5, -0.5, self.shape[0] - 0.5)
+        self.image = plot.imshow(self.get_data(level, rows, columns), origin='lower',
+                                 extent=self.get_extent(level, rows, columns), **kwargs)
+        plot.set_xlim(-0.5, self.shape[1] - 0.5)
+        plot.set_ylim(-0.5, self.shape[0] - 0.5)
+        plot.set_autoscale_on(False)
+        plot.callbacks.connect("xlim_changed", lambda axes: self.refine())
+        plot.callbacks.connect("ylim_changed", lambda axes: self.refine())
+
+    def select(self, x_lower, x_upper, y_lower, y_upper):
+        """
+        Returns the coarsest level that still has at least one pixel per screen pixel in the visible area, and the
+        rows and columns of that level covering it, with a margin of one pixel.
+        """
+        extent = self.plot.get_window_extent()
+        width, height = max(1.0, extent.width), max(1.0, extent.height)
+        level = 0
+        while level + 1 < len(self.levels) and (x_upper - x_lower) / 2 ** (level + 1) >= width and \
+                (y_upper - y_lower) / 2 ** (level + 1) >= height:
+            level += 1
+        factor = 2 ** level
+        shape = self.levels[level].shape
+        rows = (max(0, int(np.floor((y_lower + 0.5) / factor)) - 1),
+                min(shape[0], int(np.ceil((y_upper + 0.5) / factor)) + 1))
+        columns = (max(0, int(np.floor((x_lower + 0.5) / factor)) - 1),
+                   min(shape[1], int(np.ceil((x_upper + 0.5) / factor)) + 1))
+        return level, rows, columns
+
+    def get_data(self, level, rows, columns):
+        """Returns the pixels of a level in the given rows and columns."""
+        return np.asarray(self.levels[level][rows[0]:rows[1], columns[0]:columns[1]])
+
+    def get_extent(self, level, rows, columns):
+        """Returns the extent of part of a level in pixel coordinates of the full resolution."""
+        factor = 2 ** level
+        return (columns[0] * factor - 0.5, columns[1] * factor - 0.5, rows[0] * factor - 0.5, rows[1] * factor - 0.5)
+
+    def refine(self):
+        """Draws the level and part of it matching the current view of the axes."""
+        if self.updating:
+            return
+        self.updating = True
+        try:
+            x_lower, x_upper = sorted(self.plot.get_xlim())
+            y_lower, y_upper = sorted(self.plot.get_ylim())
+            level, rows, columns = self.select(max(-0.5, x_lower), min(self.shape[1] - 0.5, x_upper),
+                                               max(-0.5, y_lower), min(self.shape[0] - 0.5, y_upper))
+            if rows[0] < rows[1] and columns[0] < columns[1]:
+                self.image.set_data(self.get_data(level, rows, columns))
+                self.image.set_extent(self.get_extent(level, rows, columns))
+        finally:
+            self.updating = False
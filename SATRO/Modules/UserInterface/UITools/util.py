@@ -3,24 +3,133 @@ import numpy as np
 import math
 from astropy.io import fits
 from astropy.wcs import WCS
-from astropy.stats import scott_bin_width
-from matplotlib import pyplot as plt, gridspec as gridspec
 from Pipeline.util import get_decimal_from_string
+from UserInterface.UITools.imagestats import calculate_image_statistics
+from UserInterface.UITools.pyramid import PYRAMID_THRESHOLD, PyramidView, get_pyramid
+
+# matplotlib.pyplot and gridspec, see get_pyplot.
+_pyplot = None
+
+
+def get_pyplot():
+    """
+    Returns matplotlib.pyplot and gridspec. They are imported when the first plot is created, so the FITS helpers of
+    this module can be used without loading matplotlib. Interactive mode is turned off and the dark style of the
+    analysis pages is applied on the first call.
+
+    :returns:
+        - plt: The matplotlib.pyplot module.
+        - gridspec: The matplotlib.gridspec module.
+    """
+    global _pyplot
+    if _pyplot is None:
+        from matplotlib import pyplot as plt, gridspec as gridspec
+        plt.ioff()
+        plt.style.use('dark_background')
+        _pyplot = (plt, gridspec)
+    return _pyplot
+
+
+def get_image_hdu(fits_file):
+    """
+    Returns the HDU holding the image of a FITS file: the primary HDU of plain FITS files or the first compressed
+    image HDU of tile-compressed FITS files.
+
+    :param fits_file: The opened FITS file.
+    :return: hdu: The image HDU.
+    """
+    for hdu in fits_file:
+        if hdu.is_image and hdu.data is not None:
+            return hdu
+    return fits_file[0]
+
+
+class LazyFitsFile(object):
+    """
+    A FITS file that is opened memory-mapped on first access, so browsing folders does not read images that are
+    never plotted and plotted images are paged in from disk instead of being copied into memory. Supports iteration
+    and indexing like the astropy.io.fits.HDUList it opens.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the FITS file.
+        """
+        self.path = path
+        self._hdul = None
+
+    @property
+    def hdul(self):
+        """The opened astropy.io.fits.HDUList."""
+        if self._hdul is None:
+            self._hdul = fits.open(self.path, memmap=True)
+        return self._hdul
+
+    def __iter__(self):
+        return iter(self.hdul)
+
+    def __getitem__(self, key):
+        return self.hdul[key]
+
+    def __len__(self):
+        return len(self.hdul)
+
+    def close(self):
+        """Closes the file if it has been opened. It is opened again on the next access."""
+        if self._hdul is not None:
+            self._hdul.close()
+            self._hdul = None
 
 
 def load_fits_files(folder):
     """
     Returns *.image.fits, *.residual.fits and *.fidelity.fits where * gets replaced by the given folder name.
+    The files are opened memory-mapped on first access, see LazyFitsFile, and have to be closed with close_fits_files.
+    Tile-compressed files are supported, use get_image_hdu to access the image.
     :param folder: The folder name.
     :return: fits_files: A list containing the fits files.
     """
-    fits_files = [fits.open(folder + ".image.fits"),
-                  fits.open(folder + ".residual.fits"),
-                  fits.open(folder + ".fidelity.fits")]
+    fits_files = [LazyFitsFile(folder + ".image.fits"),
+                  LazyFitsFile(folder + ".residual.fits"),
+                  LazyFitsFile(folder + ".fidelity.fits")]
     return fits_files
 
 
-def create_analysis_plot(fits, name, sources):
+def close_fits_files(fits_files):
+    """
+    Closes FITS files, e.g. when a page loads other files or is destroyed. Memory-mapped data still referenced, e.g.
+    by an open plot, stays valid until it is released.
+
+    :param fits_files: A list of opened FITS files or LazyFitsFile objects. None entries are skipped.
+    """
+    for fits_file in fits_files:
+        if fits_file is not None:
+            fits_file.close()
+
+
+def get_image_data(hdu):
+    """
+    Returns the image of an HDU without degenerate axes. The data of memory-mapped files is returned as view of the
+    mapped file, not copied. Scaled images (BSCALE, BZERO) and tile-compressed images are held in memory by astropy.
+
+    :param hdu: The image HDU, see get_image_hdu.
+    :return: data: The image as two-dimensional array.
+    """
+    return hdu.data.squeeze()
+
+
+def get_image_shape(hdu):
+    """
+    Returns the shape of the image of an HDU without degenerate axes, read from the header, so the data is not
+    accessed.
+
+    :param hdu: The image HDU, see get_image_hdu.
+    :return: shape: The shape as tuple.
+    """
+    return tuple([length for length in hdu.shape if length != 1])
+
+
+def create_analysis_plot(fits, name, sources, statistics=None):
     """
     Creates a matplotlib plot from given FITS file. The plot includes the image, image distribution, on- and off-source
     distribution and statistical information.
@@ -28,16 +137,20 @@ def create_analysis_plot(fits, name, sources):
     :param fits: The FITS file to be plotted.
     :param name: The name of the FITS file, used in plots
     :param sources: The directions of the sources in the image.
+    :param statistics: The statistics of the image, e.g. from the metrics sidecar, see
+                       metricscache.get_analysis_statistics. Calculated if not given.
     :return: fig: The created matplotlib figure.
     """
+    plt, gridspec = get_pyplot()
     fig = plt.figure(figsize=(13, 9))
     fig.canvas.set_window_title("Analysis of " + name)
     #fig.set_facecolor('black')
 
     grid = gridspec.GridSpec(9, 2, wspace=0.4, hspace=0.05, width_ratios=[4, 3])
 
-    wcs = WCS(fits[0].header, fix=False)
-    data_image = np.array(fits[0].data).squeeze()
+    hdu = get_image_hdu(fits)
+    wcs = WCS(hdu.header, fix=False)
+    data_image = get_image_data(hdu)
 
     sources_directions = []
     source_sizes = []
@@ -46,59 +159,58 @@ def create_analysis_plot(fits, name, sources):
         sources_directions.append(direction)
 
 
-    data_onsource = remove_nan_values(create_masked_data(wcs, data_image, sources, invert=True))
-    data_offsource = remove_nan_values(create_masked_data(wcs, data_image, sources, invert=False))
-    rms = calculate_rms(data_image)
-    rms_onsource = calculate_rms(data_onsource)
-    rms_offsource = calculate_rms(data_offsource)
-    dr = calculate_dr(data_image, rms)
-    dr_onsource = calculate_dr(data_image, rms_onsource)
-    dr_offsource = calculate_dr(data_image, rms_offsource)
-    stats = stats_dict(data_image)
+    if statistics is None:
+        statistics = calculate_analysis_statistics(hdu, sources)
+    stats = statistics["image"]
 
     try:
         image_plot = fig.add_subplot(grid[:-2, 0], projection=wcs)
     except:
         image_plot = fig.add_subplot(grid[:-2, 0])
-    im = image_plot.imshow(data_image, cmap='jet', origin='lower')
+    im = show_image(image_plot, data_image, getattr(fits, "path", None), stats)
     image_plot.set_title(name)
     image_plot.set_xlabel('RA (J2000)')
     image_plot.set_ylabel('DEC (J2000)')
     cmap = fig.colorbar(im, ax=image_plot, fraction=0.046, pad=0.04)
-    cmap.set_label(fits[0].header["BUNIT"])
-    image_plot.text(0.05, -0.45,
-                    "maximum pixel value: " + str(stats["max"]) + "\n" +
-                    "minimum pixel value: " + str(stats["min"]) + "\n" +
-                    "mean pixel value: " + str(stats["mean"]) + "\n" +
-                    "median pixel value: " + str(stats["median"]) + "\n" +
-                    "standard deviation about mean: " + str(stats["sigma"]) + "\n" +
-                    "sum of pixel values: " + str(stats["sum"]) + "\n" +
-                    "size of all pixel values: " + str(stats["size"]) + "\n",
-                    transform=image_plot.transAxes)
+    cmap.set_label(hdu.header["BUNIT"])
+    image_plot.text(0.05, -0.45, format_stats(stats), transform=image_plot.transAxes)
 
     hist_plot = fig.add_subplot(grid[0:2, 1])
-    hist_plot.hist(remove_nan_values(data_image.flatten()), bins="scott")
+    plot_histogram(hist_plot, stats["histogram"])
     hist_plot.set_title("Image Distribution")
-    hist_plot.text(0.8, 0.8, "RMS: " + str(rms) + "\n" + "DR: " + str(dr), horizontalalignment='center',
+    hist_plot.text(0.8, 0.8, format_rms_dr(stats), horizontalalignment='center',
                    verticalalignment='center', transform=hist_plot.transAxes)
 
     hist_on_plot = fig.add_subplot(grid[3:5, 1])
-    hist_on_plot.hist(data_onsource.flatten(), bins="sturges")
+    plot_histogram(hist_on_plot, statistics["onsource"]["histogram"])
     hist_on_plot.set_title("On-Source Distribution")
-    hist_on_plot.text(0.8, 0.8, "RMS: " + str(rms_onsource) + "\n" + "DR: " + str(dr_onsource),
+    hist_on_plot.text(0.8, 0.8, format_rms_dr(statistics["onsource"]),
                       horizontalalignment='center', verticalalignment='center',
                       transform=hist_on_plot.transAxes)
 
     hist_off_plot = fig.add_subplot(grid[6:8, 1])
-    hist_off_plot.hist(data_offsource.flatten(), bins="scott")
+    plot_histogram(hist_off_plot, statistics["offsource"]["histogram"])
     hist_off_plot.set_title("Off-Source Distribution")
-    hist_off_plot.text(0.8, 0.8, "RMS: " + str(rms_offsource) + "\n" + "DR: " + str(dr_offsource),
+    hist_off_plot.text(0.8, 0.8, format_rms_dr(statistics["offsource"]),
                        horizontalalignment='center', verticalalignment='center',
                        transform=hist_off_plot.transAxes)
 
     return fig
 
 
+def calculate_analysis_statistics(hdu, sources):
+    """
+    Calculates the statistics shown by create_analysis_plot: of the image and of the pixels in and outside the boxes
+    around the sources.
+
+    :param hdu: The image HDU, see get_image_hdu.
+    :param sources: The source parameters of the image, as stored in sources.pkl.
+    :return: statistics: The statistics by region, see imagestats.calculate_image_statistics.
+    """
+    data = get_image_data(hdu)
+    return calculate_image_statistics(data, get_source_boxes(WCS(hdu.header, fix=False), data.shape, sources))
+
+
 def create_comparison_plot(fits, name):
     """
     Creates a matplotlib plot from given FITS file. The plot includes the image, image distribution and
@@ -109,48 +221,96 @@ def create_comparison_plot(fits, name):
     :return: fig: The created matplotlib figure.
     """
     title = name.replace(".fits", "")
+    plt, gridspec = get_pyplot()
     fig = plt.figure(figsize=(13, 9))
     fig.set_facecolor('black')
     fig.canvas.set_window_title(title)
 
     grid = gridspec.GridSpec(3, 3, wspace=0.4, hspace=0.4)
 
-    wcs = WCS(fits[0].header, fix=False)
-    data_image = np.array(fits[0].data).squeeze()
+    hdu = get_image_hdu(fits)
+    wcs = WCS(hdu.header, fix=False)
+    data_image = get_image_data(hdu)
 
-    rms = calculate_rms(data_image)
-    dr = calculate_dr(data_image, rms)
-    stats = stats_dict(data_image)
+    stats = calculate_image_statistics(data_image)["image"]
 
     try:
         image_plot = fig.add_subplot(grid[0:2, 0:2], projection=wcs)
     except:
         image_plot = fig.add_subplot(grid[0:2, 0:2])
-    im = image_plot.imshow(data_image, cmap='jet', origin='lower')
+    im = show_image(image_plot, data_image, getattr(fits, "path", None), stats)
     image_plot.set_title(title)
     image_plot.set_xlabel('RA (J2000)')
     image_plot.set_ylabel('DEC (J2000)')
     cmap = fig.colorbar(im, ax=image_plot, fraction=0.046, pad=0.04)
     cmap.set_label('Jy/beam')
-    image_plot.text(1.5, 0.4,
-                    "maximum pixel value: " + str(stats["max"]) + "\n" +
-                    "minimum pixel value: " + str(stats["min"]) + "\n" +
-                    "mean pixel value: " + str(stats["mean"]) + "\n" +
-                    "median pixel value: " + str(stats["median"]) + "\n" +
-                    "standard deviation about mean: " + str(stats["sigma"]) + "\n" +
-                    "sum of pixel values: " + str(stats["sum"]) + "\n" +
-                    "size of all pixel values: " + str(stats["size"]) + "\n",
-                    transform=image_plot.transAxes)
+    image_plot.text(1.5, 0.4, format_stats(stats), transform=image_plot.transAxes)
 
     hist_plot = fig.add_subplot(grid[2, :])
-    hist_plot.hist(remove_nan_values(data_image.flatten()), bins="scott")
+    plot_histogram(hist_plot, stats["histogram"])
     hist_plot.set_title("Image Distribution")
-    hist_plot.text(0.95, 0.85, "RMS: " + str(rms) + "\n" + "DR: " + str(dr), horizontalalignment='center',
+    hist_plot.text(0.95, 0.85, format_rms_dr(stats), horizontalalignment='center',
                    verticalalignment='center', transform=hist_plot.transAxes)
 
     return fig
 
 
+def show_image(plot, data, fits_path, stats):
+    """
+    Displays an image in a plot. Images with a side longer than pyramid.PYRAMID_THRESHOLD pixels are drawn from the
+    level of their pyramid matching the resolution of the plot and refined when zooming, see pyramid.PyramidView. The
+    colour scale spans the range of the full-resolution image, so it does not change between the levels.
+
+    :param plot: The matplotlib axes.
+    :param data: The image.
+    :param fits_path: The FITS file of the image, the pyramid is cached next to it. None for images without file.
+    :param stats: The statistics of the image, see imagestats.calculate_image_statistics.
+    :return: image: The matplotlib image.
+    """
+    if max(data.shape) <= PYRAMID_THRESHOLD:
+        return plot.imshow(data, cmap='jet', origin='lower')
+    limits = (stats["min"], stats["max"]) if stats["count"] else (None, None)
+    view = PyramidView(plot, data, get_pyramid(data, fits_path), cmap='jet', vmin=limits[0], vmax=limits[1])
+    return view.image
+
+
+def format_stats(stats):
+    """
+    Returns the statistical information of an image as text for the plots.
+
+    :param stats: The statistics of the image, see imagestats.calculate_image_statistics.
+    :return: text: The text.
+    """
+    return "maximum pixel value: " + str(round(stats["max"], 3)) + "\n" + \
+           "minimum pixel value: " + str(round(stats["min"], 3)) + "\n" + \
+           "mean pixel value: " + str(round(stats["mean"], 3)) + "\n" + \
+           "median pixel value: " + str(round(stats["median"], 3)) + "\n" + \
+           "standard deviation about mean: " + str(round(stats["sigma"], 3)) + "\n" + \
+           "sum of pixel values: " + str(round(stats["sum"], 3)) + "\n" + \
+           "size of all pixel values: " + str(stats["size"]) + "\n"
+
+
+def format_rms_dr(stats):
+    """
+    Returns the root mean square and the dynamic range of an image region as text for the histograms.
+
+    :param stats: The statistics of the region, see imagestats.calculate_image_statistics.
+    :return: text: The text.
+    """
+    return "RMS: " + str(round(stats["rms"], 4)) + "\n" + "DR: " + str(round(stats["dr"], 4))
+
+
+def plot_histogram(plot, histogram):
+    """
+    Plots a histogram computed by imagestats.calculate_image_statistics like matplotlib plots the values.
+
+    :param plot: The matplotlib axes.
+    :param histogram: The counts and the bin edges.
+    """
+    counts, edges = histogram
+    plot.hist(edges[:-1], bins=edges, weights=counts)
+
+
 def check_folder(directory, name_folder):
     """
     Validates given directory if it meets the requirements to be read from the analysis tool. The folder must
@@ -182,22 +342,16 @@ def check_folder(directory, name_folder):
     return valid, error_messages
 
 
-def create_masked_data(wcs, data, sources, invert=False):
+def get_source_boxes(wcs, shape, sources):
     """
-    Calculates a masked array with the size of the source around given coordinated either masked (invert=False), or
-    everything else is masked but the slice (Invert=True).
+    Calculates the boxes with the size of the sources around their coordinates that are inside the image.
 
-    :param wcs: The world coordinate system of the data
-    :param data: The data Array.
-    :param sources: The sources of the image
-    :param invert: Invert the masked array or not.
-    :return: masked_array: The masked array.
+    :param wcs: The world coordinate system of the image.
+    :param shape: The shape of the image.
+    :param sources: The sources of the image.
+    :return: boxes: A list of (x_lower, x_upper, y_lower, y_upper) tuples with the pixel ranges of the boxes.
     """
-    if invert:
-        mask = np.ones(data.shape, dtype=bool)
-    else:
-        mask = np.zeros(data.shape, dtype=bool)
-
+    boxes = []
     coordinates = []
     sizes = []
     for source in sources:
@@ -205,7 +359,7 @@ def create_masked_data(wcs, data, sources, invert=False):
         coord = calculate_pixcoord(wcs, direction)
         coordinates.append(coord)
         if source['sp_shape'] == "point":
-            size_pixels = (int(data.shape[0] / 40), int(data.shape[1] / 40))
+            size_pixels = (int(shape[0] / 40), int(shape[1] / 40))
         else:
             size_value, units = get_decimal_from_string(source['sp_majoraxis'])
             if units.strip() == "arcsec":
@@ -227,21 +381,19 @@ def create_masked_data(wcs, data, sources, invert=False):
         y_upper = int(coordinates[i][1]) + sizes[i][1]
 
         # check if source is outside the image
-        if (x_lower < 0 and x_upper < 0) or (x_lower >= data.shape[0] and x_upper >= data.shape[0]) or \
-           (y_lower < 0 and y_upper < 0) or (y_lower >= data.shape[1] and y_upper >= data.shape[1]):
+        if (x_lower < 0 and x_upper < 0) or (x_lower >= shape[0] and x_upper >= shape[0]) or \
+           (y_lower < 0 and y_upper < 0) or (y_lower >= shape[1] and y_upper >= shape[1]):
             pass
 
         else:
             # cut off the source of necessary
             x_lower = raise_to_zero(x_lower)
-            x_upper = lower_to_size(x_upper, data.shape[0])
+            x_upper = lower_to_size(x_upper, shape[0])
             y_lower = raise_to_zero(y_lower)
-            y_upper = lower_to_size(y_upper, data.shape[0])
-
-            mask[x_lower: x_upper, y_lower: y_upper] = not invert
+            y_upper = lower_to_size(y_upper, shape[0])
 
-    masked_array = np.ma.masked_array(data, mask, fill_value=float('NaN'))
-    return masked_array
+            boxes.append((x_lower, x_upper, y_lower, y_upper))
+    return boxes
 
 
 def raise_to_zero(number):
@@ -269,46 +421,6 @@ def lower_to_size(number, size):
     return number
 
 
-def calculate_rms(data):
-    """
-    Calculates and returns root mean square of given data array rounded to 4 places after decimal point.
-    :param data: The dara array.
-    :return: rms: The root mean square score.
-    """
-    rms = np.sqrt(np.nanmean(np.square(data)))
-    return rms.round(4)
-
-
-def calculate_dr(data, rms):
-    """
-    Calculates and returns the dynamic range of given data array.
-
-    :param data: The data array.
-    :param rms: The root mean square score.
-    :return: dr: The dynamic range.
-    """
-    dr = np.nanmax(data) / rms
-    return dr.round(4)
-
-
-def stats_dict(data):
-    """
-    Calculates several statistical information and returns them in a dictionary. Measures to be calculated are:
-    number of data points, maximum and minimum value, mean, median, standard deviation about mean and the sum.
-
-    :param data: The data array.
-    :return: stats: The statistical information as dictionary.
-    """
-    stats = {'size': np.size(data),
-             'max': np.nanmax(data).round(3),
-             'min': np.nanmin(data).round(3),
-             'mean': np.mean(data).round(3),
-             'median': np.median(data).round(3),
-             'sigma': np.std(data).round(3),
-             'sum': np.sum(data).round(3)}
-    return stats
-
-
 def calculate_pixcoord(wcs, direction):
     """
     Calculates and returns pixel coordinates from given world coordinates and direction (ra, dec in degrees).
@@ -322,18 +434,3 @@ def calculate_pixcoord(wcs, direction):
 
     coordinates = np.array(wcs.wcs_world2pix(ra_deg, dec_deg, 0, ra_dec_order=True))
     return np.array([coordinates[1], coordinates[0]])
-
-
-def remove_nan_values(array):
-    """
-    Returns an array free of nan values from given array.
-
-    :param array: The data array.
-    :return: filteres_array: The data array without nan values.
-    """
-    nan_array = np.isnan(array)
-    not_nan_array = ~ nan_array
-    filtered_array = array[not_nan_array]
-    return filtered_array
-
-
@@ -949,7 +949,10 @@ class ConfigurationPage(tk.Frame):
             for variable in self.weighting_variables:
                 self.model.weighting_variables.append(variable.get())
 
-        self.model.estimation = helpers.convert_time_to_string(self.model.calculate_estimated_time_total())
+        estimation, band = self.model.calculate_estimated_time_total()
+        self.model.estimation = helpers.convert_time_to_string(estimation)
+        if band is not None:
+            self.model.estimation += " (+/- " + helpers.convert_time_to_string(band) + ")"
 
     def load_values_from_config(self, config):
         """
@@ -1,9 +1,13 @@
 import os
 import pickle
+import sys
+import threading
+import traceback
 import Tkinter as tk
 import tkFileDialog
 import tkMessageBox
 from Pipeline import pipeline
+from Pipeline import progress
 from UserInterface.UITools.image_comparison import ComparisonPage
 from UserInterface.UITools.output_analysis import AnalysisPage
 from UserInterface.configurationpage import ConfigurationPage
@@ -12,6 +16,9 @@ from UserInterface.summarypage import SummaryPage
 from UserInterface.util import helpers as helpers
 from UserInterface.util.scrollbarframe import ScrollbarFrame
 
+# Interval in milliseconds in which the progress of a running pipeline is polled.
+POLL_INTERVAL = 500
+
 
 class MainView(tk.Frame):
     """
@@ -31,6 +38,8 @@ class MainView(tk.Frame):
         self.model = model
         self.analysis_window = None
         self.comparison_window = None
+        self.channel = None
+        self.worker = None
         self.initialize_widgets()
         self.layout_widgets()
 
@@ -167,8 +176,8 @@ class MainView(tk.Frame):
 
     def confirm_run(self):
         """
-        Shows dialog to confirm the AppPipeline run and starts the AppPipeline if "yes" is pressed. Shows the progress
-        page while the AppPipeline is running.
+        Shows dialog to confirm the AppPipeline run and starts the AppPipeline in a worker thread if "yes" is pressed.
+        Shows the progress page while the AppPipeline is running.
         """
         path = self.page2.entry_browse.get()
         if len(path) == 0:
@@ -177,6 +186,7 @@ class MainView(tk.Frame):
             return
         if not os.path.isdir(path):
             os.mkdir(path)
+        self.page2.save_output_path_to_model()
         self.model.output_path = path
 
         message_box = tkMessageBox.askquestion("Run Confirmation", "Are you sure you want to start the simulation?",
@@ -188,14 +198,37 @@ class MainView(tk.Frame):
             self.sb1.pack_forget()
             self.page3.pack(side="top", fill="both", expand=True)
 
-            self.master.update()
-            self.master.after(3000, pipeline.run(self.model))
+            self.channel = progress.ProgressChannel()
+            self.page3.start(self.channel)
+            self.worker = threading.Thread(target=run_pipeline, args=(self.model, self.channel))
+            self.worker.daemon = True
+            self.worker.start()
+            self.after(POLL_INTERVAL, self.poll_progress)
 
-            self.page3.pack_forget()
-            self.sb1.pack(side="top", fill="both", expand=True)
-            self.button_prev.grid(row=0, column=0, sticky="W", padx=15, pady=15)
-            self.button_run.grid(row=0, column=2, sticky="E", padx=15, pady=15)
-            self.page2.pack(side="top", fill="both", expand=True)
+    def poll_progress(self):
+        """
+        Displays the progress of the running AppPipeline and polls again until it is finished. Afterwards shows the
+        summary page again and reports errors or the cancellation.
+        """
+        snapshot = self.channel.snapshot()
+        self.page3.update_progress(snapshot)
+        if not snapshot["finished"]:
+            self.after(POLL_INTERVAL, self.poll_progress)
+            return
+        self.worker.join()
+        self.worker = None
+        self.page3.pack_forget()
+        self.sb1.pack(side="top", fill="both", expand=True)
+        self.button_prev.grid(row=0, column=0, sticky="W", padx=15, pady=15)
+        self.button_run.grid(row=0, column=2, sticky="E", padx=15, pady=15)
+        self.page2.pack(side="top", fill="both", expand=True)
+        if snapshot["error"]:
+            tkMessageBox.showerror("Simulation Failed", "The simulation failed:\n" +
+                                   snapshot["error"].strip().splitlines()[-1] +
+                                   "\nCheck console and the CASA logger for more details.")
+        elif snapshot["cancelled"]:
+            tkMessageBox.showinfo("Simulation Cancelled", "The simulation was cancelled after " +
+                                  str(snapshot["completed"]) + " of " + str(snapshot["total"]) + " iterations.")
 
     def open_analysis_tool(self):
         """Opens a new window of the Analysis page and displays widgets."""
@@ -219,4 +252,24 @@ class MainView(tk.Frame):
         self.comparison_window.wm_geometry("500x290")
         self.comparison_window.minsize(460, 240)
         page_comparison = ComparisonPage(self.comparison_window)
-        page_comparison.pack(side="top", fill="both", expand=True)
\ No newline at end of file
+        page_comparison.pack(side="top", fill="both", expand=True)
+
+
+def run_pipeline(model, channel):
+    """
+    Runs the AppPipeline and reports its end to the progress channel. Runs in the worker thread, so it must not
+    access any widgets.
+
+    :param model: the input model
+    :param channel: the progress channel of the run
+    """
+    try:
+        pipeline.run(model, channel)
+    except progress.RunCancelled:
+        channel.finish()
+    except Exception:
+        error = traceback.format_exc()
+        sys.stderr.write(error)
+        channel.finish(error)
+    else:
+        channel.finish()
@@ -1,9 +1,11 @@
 import pandas as pd
-import numpy as np
 import UserInterface.util.helpers as helpers
-from Pipeline.util import get_decimal_from_string
-from Pipeline.util import transform_frequency
-from Pipeline.util import calculate_beam_size
+import Pipeline.planner as planner
+import Pipeline.retention as retention
+import Pipeline.fitsexport as fitsexport
+import Pipeline.rasterizer as rasterizer
+from Pipeline.util import create_var_param_values_lists
+from Pipeline.util import SHAPES, WEIGHTINGS, TELESCOPE_DIAMETERS
 
 
 class InputModel:
@@ -53,15 +55,21 @@ class InputModel:
                                                                     "sp_frequency_unit"])
         self.fixed_params_sp = []
         self.output_path = ""
+        self.processes = 1
+        self.use_cache = True
+        self.resume = False
+        self.scratch = ""
+        self.retention = retention.DEFAULT_POLICY
+        self.fits_compression = fitsexport.DEFAULT_COMPRESSION
+        self.fits_quantize_level = fitsexport.DEFAULT_QUANTIZE_LEVEL
+        self.fits_tile = 0
+        self.sm_backend = rasterizer.DEFAULT_BACKEND
+        self.sources_catalog = ""
 
         self.mode_options = ["Single Run", "Multiple Runs"]
         self.sm_options = ['Custom', 'Haslam-Map']
         self.telescope_options = ['VLA', 'ALMA', 'MWA', 'Meerkat']
-        self.telescope_diameters = {'VLA': 25.0,
-                                    'ALMA': 12.0,
-                                    'MWA': 4.0,
-                                    'Meerkat': 12.0
-                                    }
+        self.telescope_diameters = dict(TELESCOPE_DIAMETERS)
         self.csv_selector = {
             'Instrumental': [self.prefix + 'var_sim_parameters.csv'],
             'Sky-model': [self.prefix + 'var_sm_parameters.csv'],
@@ -82,8 +90,8 @@ class InputModel:
                                "sp_direction_ra", "sp_direction_dec", "sp_majoraxis", "sp_minoraxis",
                                "sp_positionangle", "sp_frequency", "nsp"]
         self.var_params_str = ["analyze_weighting", "sm_shape", "sp_shape"]
-        self.shapes = ["Gaussian", "point", "disk", "limbdarkeneddisk"]
-        self.weightings = ["natural", "uniform", "briggs"]
+        self.shapes = list(SHAPES)
+        self.weightings = list(WEIGHTINGS)
 
     def get_number_of_iterations(self):
         """
@@ -109,66 +117,18 @@ class InputModel:
 
     def calculate_estimated_time_total(self):
         """
-        Returns the calculated total estimation computation time in seconds. Parameters that influence the estimated
-        time are "totaltime", "integration", "imsize" and "sm_size" as well as the selection of the sky brightness
-        distribution. Additionally if the beam size is greater than 1 radian, computation time for interpolating with
-        the haslam map is taken into account.
-
-        :return: total_estimation: The total estimated time in seconds as float
+        Returns the estimated total computation time in seconds and the half width of its uncertainty band. The
+        iterations are planned like in the AppPipeline, but without searching the output path for cached outputs or
+        hashing the input files, see planner.create_plan, and estimated from cost models fitted to the recorded timings
+        of past runs. Without recorded timings the estimation falls back to a fixed formula of "totaltime",
+        "integration", "imsize", "sm_size", the selection of the sky brightness distribution and the beam size.
+
+        :returns:
+            - total_estimation: The total estimated time in seconds as float.
+            - band: The half width of the uncertainty band in seconds or None if the fixed formula was used.
         """
-        totaltime = float(self.fixed_params_sim[self.fixed_params_sim["Name"] == 'totaltime']["Value"].squeeze())
-        integration = float(self.fixed_params_sim[self.fixed_params_sim["Name"] == 'integration']["Value"].squeeze())
-
-        imsize = int(self.fixed_params_sim[self.fixed_params_sim["Name"] == 'analyze_imsize']["Value"].squeeze())
-        sm_size = int(self.fixed_params_sm[self.fixed_params_sm["Name"] == 'sm_size']["Value"].squeeze())
-
-        sm_freq = float(self.fixed_params_sm[self.fixed_params_sm["Name"] == 'sm_frequency']["Value"].squeeze())
-        freq_unit = self.fixed_params_sm[self.fixed_params_sm["Name"] == 'sm_frequency']["Units"].squeeze()
-        sm_freq = transform_frequency(sm_freq, freq_unit)
-        dish_diam = self.telescope_diameters[self.telescope]
-        beam_size = calculate_beam_size(sm_freq, dish_diam)
-
-        if self.sm == "Haslam-Map":
-            haslam = True
-        else:
-            haslam = False
-
-        estimations = []
-        if self.mode == "Multiple Runs":
-            index_totaltime = 0
-            index_integration = 0
-            index_sm_freq = 0
-            for i in range(self.get_number_of_iterations()):
-                totaltime_var = totaltime
-                integration_var = integration
-                sm_freq_var = sm_freq
-                if "totaltime" in self.var_param_values_lists.keys():
-                    if i < len(self.var_param_values_lists["totaltime"]):
-                        totaltime_var, _ = get_decimal_from_string(self.var_param_values_lists["totaltime"]
-                                                                   [index_totaltime])
-                        index_totaltime = index_totaltime + 1
-                if "integration" in self.var_param_values_lists.keys():
-                    if i < len(self.var_param_values_lists["integration"]):
-                        integration_var, _ = get_decimal_from_string(self.var_param_values_lists["integration"]
-                                                                     [index_integration])
-                        index_integration = index_integration + 1
-                if "sm_frequency" in self.var_param_values_lists.keys():
-                    if i < len(self.var_param_values_lists["sm_frequency"]):
-                        sm_freq_var, sm_freq_var_units = get_decimal_from_string(self.var_param_values_lists
-                                                                                 ["sm_frequency"][index_sm_freq])
-                        sm_freq_var = transform_frequency(sm_freq_var, sm_freq_var_units)
-                        index_sm_freq = index_sm_freq + 1
-                integrations_var = totaltime_var / integration_var
-                beam_size = calculate_beam_size(sm_freq_var, dish_diam)
-                estimation = helpers.calulate_estimated_time(integrations_var, imsize, sm_size, haslam, beam_size)
-                estimations.append(estimation)
-        elif self.mode == "Single Run":
-            integrations = totaltime / integration
-            estimation = helpers.calulate_estimated_time(integrations, imsize, sm_size, haslam, beam_size)
-            estimations.append(estimation)
-
-        total_estimation = np.array(estimations).sum()
-        return total_estimation
+        totals = planner.create_plan(self, estimate_only=True).get_totals()
+        return totals["estimated_time"], totals["estimated_time_band"]
 
     def get_var_param_values(self):
         """
@@ -177,21 +137,6 @@ class InputModel:
 
         :return: var_param_values_lists: The varying parameters and their lists of values as dictionary.
         """
-        df = self.var_params_values_num
-        var_param_values_lists = {}
-        for param in df["Name"]:
-            min_value = helpers.transform_to_number(df[df["Name"] == param]["Min"].squeeze())
-            max_value = helpers.transform_to_number(df[df["Name"] == param]["Max"].squeeze())
-            steps = int(df[df["Name"] == param]["Steps"].squeeze())
-            units = df[df["Name"] == param]["Units"].squeeze()
-            values = helpers.create_param_values_list(min_value, max_value, steps, units)
-            var_param_values_lists.update({param: values})
-
-        if len(self.sm_selected_shapes) > 0:
-            var_param_values_lists.update({"sm_shape": self.sm_selected_shapes})
-        if len(self.sp_selected_shapes) > 0:
-            var_param_values_lists.update({"sp_shape": self.sp_selected_shapes})
-        if len(self.selected_weightings) > 0:
-            var_param_values_lists.update({"analyze_weighting": self.selected_weightings})
-
+        var_param_values_lists = create_var_param_values_lists(self.var_params_values_num, self.sm_selected_shapes,
+                                                               self.sp_selected_shapes, self.selected_weightings)
         return var_param_values_lists
@@ -1,10 +1,13 @@
 import Tkinter as tk
+import ttk
+from UserInterface.util import helpers as helpers
 
 
 class ProgressPage(tk.Frame):
     """
-    Subclass of tk.Frame. This class creates and layouts widgets for the third page of the GUI. This class shows a
-    loading label until pipeline is finished.
+    Subclass of tk.Frame. This class creates and layouts widgets for the third page of the GUI. This class shows the
+    progress of the running pipeline: the current iteration and its stages, the finished iterations, the elapsed and
+    the estimated remaining time. The run can be cancelled after the current stage.
     """
 
     def __init__(self, model, *args, **kwargs):
@@ -18,6 +21,8 @@ class ProgressPage(tk.Frame):
         """
         tk.Frame.__init__(self, *args, **kwargs)
         self.model = model
+        self.channel = None
+        self.number_of_iterations_shown = 0
 
         self.initialize_widgets()
         self.layout_widgets()
@@ -29,12 +34,92 @@ class ProgressPage(tk.Frame):
                                     font=("Arial", 20, 'bold'))
         self.label_info = tk.Label(self.grid_progress, text="Check console and the CASA logger for more details ",
                                    font=("Arial", 16))
+        self.progressbar = ttk.Progressbar(self.grid_progress, orient="horizontal", mode="determinate", length=400)
+        self.label_iteration = tk.Label(self.grid_progress, text="Iteration: ")
+        self.label_iteration_value = tk.Label(self.grid_progress)
+        self.label_stage = tk.Label(self.grid_progress, text="Stage: ")
+        self.label_stage_value = tk.Label(self.grid_progress)
+        self.label_elapsed = tk.Label(self.grid_progress, text="Elapsed time: ")
+        self.label_elapsed_value = tk.Label(self.grid_progress)
+        self.label_eta = tk.Label(self.grid_progress, text="Estimated time remaining: ")
+        self.label_eta_value = tk.Label(self.grid_progress)
+        self.treeview_stages = ttk.Treeview(self.grid_progress, height=6, show="headings",
+                                            columns=("Stage", "Time"))
+        self.treeview_iterations = ttk.Treeview(self.grid_progress, height=8, show="headings",
+                                                columns=("Iteration", "Time", "Status"))
+        for treeview in [self.treeview_stages, self.treeview_iterations]:
+            for column in treeview["columns"]:
+                treeview.heading(column, text=column)
+                treeview.column(column, width=100 if column != "Iteration" else 300)
+        self.button_cancel = tk.Button(self.grid_progress, text="Cancel", command=self.cancel, height=2, width=10)
 
     def layout_widgets(self):
         """Displays and layouts the widgets in the correct places."""
         self.grid_progress.grid_columnconfigure(0, weight=1)
         self.grid_progress.grid_columnconfigure(99, weight=1)
-        self.label_title.grid(row=0, column=1, sticky="nesw")
-        self.label_info.grid(row=1, column=1, sticky="nesw")
+        self.label_title.grid(row=0, column=1, columnspan=2, sticky="nesw")
+        self.label_info.grid(row=1, column=1, columnspan=2, sticky="nesw")
+        self.progressbar.grid(row=2, column=1, columnspan=2, sticky="ew", pady=10)
+        self.label_iteration.grid(row=3, column=1, sticky="W")
+        self.label_iteration_value.grid(row=3, column=2, sticky="W")
+        self.label_stage.grid(row=4, column=1, sticky="W")
+        self.label_stage_value.grid(row=4, column=2, sticky="W")
+        self.label_elapsed.grid(row=5, column=1, sticky="W")
+        self.label_elapsed_value.grid(row=5, column=2, sticky="W")
+        self.label_eta.grid(row=6, column=1, sticky="W")
+        self.label_eta_value.grid(row=6, column=2, sticky="W")
+        self.treeview_stages.grid(row=7, column=1, columnspan=2, sticky="ew", pady=5)
+        self.treeview_iterations.grid(row=8, column=1, columnspan=2, sticky="ew", pady=5)
+        self.button_cancel.grid(row=9, column=1, columnspan=2, pady=10)
 
         self.grid_progress.pack(side="top", fill="both", expand=True, anchor="n")
+
+    def start(self, channel):
+        """
+        Resets the widgets for a new run.
+
+        :param channel: The progress channel of the run.
+        """
+        self.channel = channel
+        self.number_of_iterations_shown = 0
+        self.progressbar["value"] = 0
+        self.treeview_stages.delete(*self.treeview_stages.get_children())
+        self.treeview_iterations.delete(*self.treeview_iterations.get_children())
+        self.button_cancel.config(state="normal", text="Cancel")
+        self.update_progress(channel.snapshot())
+
+    def update_progress(self, snapshot):
+        """
+        Displays the given progress. Only finished iterations that are not displayed yet are added to the list.
+
+        :param snapshot: The progress as returned by ProgressChannel.snapshot.
+        """
+        total = max(snapshot["total"], 1)
+        self.progressbar["maximum"] = total
+        self.progressbar["value"] = snapshot["completed"]
+        current = min(snapshot["completed"] + 1, total)
+        self.label_iteration_value.config(text=str(current) + " of " + str(total) + "   " + snapshot["folder"])
+        stage = snapshot["stage"] if snapshot["stage"] else "-"
+        if snapshot["cancelled"] and not snapshot["finished"]:
+            stage += " (cancelling after this stage)"
+        self.label_stage_value.config(text=stage)
+        self.label_elapsed_value.config(text=helpers.convert_duration_to_string(snapshot["elapsed"]))
+        if snapshot["eta"] is None:
+            self.label_eta_value.config(text="estimating after the first iteration")
+        else:
+            self.label_eta_value.config(text=helpers.convert_time_to_string(snapshot["eta"]))
+
+        self.treeview_stages.delete(*self.treeview_stages.get_children())
+        for name, duration in snapshot["stages"]:
+            self.treeview_stages.insert("", "end", values=(name, helpers.convert_duration_to_string(duration)))
+        for iteration in snapshot["iterations"][self.number_of_iterations_shown:]:
+            status = "failed" if iteration["failed"] else "cached" if iteration["cached"] else "done"
+            duration = helpers.convert_duration_to_string(iteration["elapsed"]) if iteration["elapsed"] else "-"
+            self.treeview_iterations.insert("", "end", values=(iteration["folder"], duration, status))
+        self.number_of_iterations_shown = len(snapshot["iterations"])
+
+    def cancel(self):
+        """Requests cancellation of the run after the current stage."""
+        if self.channel is not None:
+            self.channel.cancel()
+            self.button_cancel.config(state="disabled", text="Cancelling...")
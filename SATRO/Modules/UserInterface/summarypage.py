@@ -3,6 +3,11 @@ import tkFileDialog
 import tkMessageBox
 import ttk
 import os
+import multiprocessing
+import Pipeline.fitsexport as fitsexport
+import Pipeline.rasterizer as rasterizer
+import Pipeline.retention as retention
+import Pipeline.workspace as workspace
 
 import util.helpers as helpers
 
@@ -87,6 +92,34 @@ class SummaryPage(tk.Frame):
         self.entry_browse = tk.Entry(self.grid_bottom_path)
         self.entry_browse.insert(0, self.path)
         self.button_browse = tk.Button(self.grid_bottom_path, text="Browse...", command=self.browse_output_path)
+        self.label_processes = tk.Label(self.grid_bottom_path, text="Parallel iterations: ")
+        self.spinbox_processes = tk.Spinbox(self.grid_bottom_path, from_=1, to=multiprocessing.cpu_count(), width=5)
+        self.resume = tk.IntVar()
+        self.checkbox_resume = tk.Checkbutton(self.grid_bottom_path, text="Resume interrupted run in output folder",
+                                              variable=self.resume)
+        self.label_scratch = tk.Label(self.grid_bottom_path, text="Scratch folder (optional): ")
+        self.entry_scratch = tk.Entry(self.grid_bottom_path)
+        self.entry_scratch.insert(0, os.environ.get(workspace.SCRATCH_ENV, ""))
+        self.button_scratch = tk.Button(self.grid_bottom_path, text="Browse...", command=self.browse_scratch_path)
+        self.label_retention = tk.Label(self.grid_bottom_path, text="Keep in output folders: ")
+        self.retention = tk.StringVar()
+        self.retention.set(dict(retention.POLICIES)[retention.DEFAULT_POLICY])
+        self.dropdown_retention = tk.OptionMenu(self.grid_bottom_path, self.retention,
+                                                *[description for name, description in retention.POLICIES])
+        self.label_fits_compression = tk.Label(self.grid_bottom_path, text="FITS files: ")
+        self.fits_compression = tk.StringVar()
+        self.fits_compression.set(dict(fitsexport.COMPRESSION_MODES)[fitsexport.DEFAULT_COMPRESSION])
+        self.dropdown_fits_compression = tk.OptionMenu(self.grid_bottom_path, self.fits_compression,
+                                                       *[description for name, description in
+                                                         fitsexport.COMPRESSION_MODES])
+        self.label_sm_backend = tk.Label(self.grid_bottom_path, text="Sky-model image: ")
+        self.sm_backend = tk.StringVar()
+        self.sm_backend.set(dict(rasterizer.BACKENDS)[rasterizer.DEFAULT_BACKEND])
+        self.dropdown_sm_backend = tk.OptionMenu(self.grid_bottom_path, self.sm_backend,
+                                                 *[description for name, description in rasterizer.BACKENDS])
+        self.label_catalog = tk.Label(self.grid_bottom_path, text="Source catalog (optional): ")
+        self.entry_catalog = tk.Entry(self.grid_bottom_path)
+        self.button_catalog = tk.Button(self.grid_bottom_path, text="Browse...", command=self.browse_catalog)
 
     def layout_widgets(self):
         """Displays and layouts the widgets in the correct places."""
@@ -141,6 +174,21 @@ class SummaryPage(tk.Frame):
         self.label_browse.grid(row=1, column=1, sticky="W")
         self.entry_browse.grid(row=1, column=2, sticky="W")
         self.button_browse.grid(row=1, column=3, sticky="W")
+        self.label_processes.grid(row=2, column=1, sticky="W")
+        self.spinbox_processes.grid(row=2, column=2, sticky="W")
+        self.checkbox_resume.grid(row=3, column=1, columnspan=2, sticky="W")
+        self.label_scratch.grid(row=4, column=1, sticky="W")
+        self.entry_scratch.grid(row=4, column=2, sticky="W")
+        self.button_scratch.grid(row=4, column=3, sticky="W")
+        self.label_retention.grid(row=5, column=1, sticky="W")
+        self.dropdown_retention.grid(row=5, column=2, columnspan=2, sticky="W")
+        self.label_fits_compression.grid(row=6, column=1, sticky="W")
+        self.dropdown_fits_compression.grid(row=6, column=2, columnspan=2, sticky="W")
+        self.label_sm_backend.grid(row=7, column=1, sticky="W")
+        self.dropdown_sm_backend.grid(row=7, column=2, columnspan=2, sticky="W")
+        self.label_catalog.grid(row=8, column=1, sticky="W")
+        self.entry_catalog.grid(row=8, column=2, sticky="W")
+        self.button_catalog.grid(row=8, column=3, sticky="W")
         self.grid_bottom_path.pack(fill="x", expand=True, anchor="n")
 
     def fill_widgets(self):
@@ -174,6 +222,34 @@ class SummaryPage(tk.Frame):
             self.entry_browse.delete(0, tk.END)
             self.entry_browse.insert(0, filename)
 
+    def browse_scratch_path(self):
+        """Select a directory on fast local storage for the intermediate products of the iterations."""
+        filename = tkFileDialog.askdirectory(initialdir=self.entry_scratch.get() or self.path)
+        if filename:
+            self.entry_scratch.delete(0, tk.END)
+            self.entry_scratch.insert(0, filename)
+
+    def browse_catalog(self):
+        """Select a CSV or FITS table of sources added to the sources of the table."""
+        filename = tkFileDialog.askopenfilename(filetypes=[("Source catalogs", "*.csv *.fits *.fit"),
+                                                           ("All files", "*")])
+        if filename:
+            self.entry_catalog.delete(0, tk.END)
+            self.entry_catalog.insert(0, filename)
+
     def save_output_path_to_model(self):
-        """Saves the output-path to the input model."""
+        """
+        Saves the output-path, the number of parallel iterations, the resume mode, the scratch folder, the retention
+        policy, the FITS compression, the sky-model backend and the source catalog to the input model.
+        """
         self.model.output_path = self.path
+        self.model.processes = int(self.spinbox_processes.get())
+        self.model.resume = self.resume.get() == 1
+        self.model.scratch = self.entry_scratch.get().strip()
+        self.model.retention = dict((description, name) for name, description in retention.POLICIES)[
+            self.retention.get()]
+        self.model.fits_compression = dict((description, name) for name, description in
+                                           fitsexport.COMPRESSION_MODES)[self.fits_compression.get()]
+        self.model.sm_backend = dict((description, name) for name, description in rasterizer.BACKENDS)[
+            self.sm_backend.get()]
+        self.model.sources_catalog = self.entry_catalog.get().strip()
@@ -1,7 +1,6 @@
 import csv
 import webbrowser
 import Tkinter as tk
-import numpy as np
 import pandas as pd
 
 
@@ -81,49 +80,6 @@ def read_fixed_params_from_file(csv_file, columns):
     return df
 
 
-def transform_to_number(string):
-    """
-    Transforms and returns a given string to either int or float.
-
-    :param string: The input string.
-    :return: number: The transformed number.
-    """
-    number = -1
-    if string:
-        if string.isdigit():
-            number = int(string)
-        else:
-            number = float(string)
-        return number
-
-
-def create_param_values_list(min_value, max_value, steps, units):
-    """
-    Creates and returns a list of parameter values calculated from min to max
-    with given amount of steps.
-
-    :param min_value: The minimum value of the parameter.
-    :param max_value: The maximum value of the parameter.
-    :param steps: The amount of steps in between.
-    :param units: The units added to the value.
-    :return: values: A list of values for a parameter.
-    """
-    values = np.linspace(min_value, max_value, steps)
-
-    if isinstance(min_value, int) and isinstance(max_value, int):
-        values_int = []
-        for value in values:
-            values_int.append(int(value))
-        values = values_int
-
-    if units:
-        values_str = []
-        for value in values:
-            values_str.append(str(value) + units)
-        values = values_str
-    return values
-
-
 def create_entry_table(df, grid):
     """
     Creates labels and entries for alphabetic varying parameter from a DataFrame and displays them
@@ -153,32 +109,6 @@ def create_entry_table(df, grid):
         entry_units.grid(row=index + 1, column=3)
 
 
-def calulate_estimated_time(integrations, imsize, sm_size, haslam, beam_size):
-    """
-    Calculates and returns estimated computation time for one iteration.
-
-    :param integrations: The number of integrations.
-    :param imsize: The size of the image.
-    :param sm_size: The size of the sky-model image.
-    :param haslam: Boolean if Haslam-Map is selected.
-    :param beam_size: The beam size.
-    :return: estimation: The estimated time in seconds.
-    """
-    haslam_time = 0
-    interpolation_time = 0
-
-    if haslam:
-        haslam_time = 20
-        if beam_size > 1:
-            interpolation_time = 0.0004 * sm_size**2 - 0.02 * sm_size + 4
-
-    integration_time = integrations / 30
-    imsize_time = imsize * 0.04
-    sm_size_time = sm_size * 0.03
-    estimation = 20 + integration_time + imsize_time + sm_size_time + haslam_time + interpolation_time
-    return estimation
-
-
 def convert_time_to_string(time):
     """
     Converts time in seconds as float to a string in the format 2h 30min or "less than 1min" if time is smaller than
@@ -202,6 +132,18 @@ def convert_time_to_string(time):
     return time_string
 
 
+def convert_duration_to_string(time):
+    """
+    Converts a duration in seconds as float to a string in the format 1:02:03 and returns it.
+
+    :param time: Time in seconds as float.
+    :return: time_string: The time as string.
+    """
+    minutes, seconds = divmod(int(round(time)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
 def open_manual():
     """Opens the user manual for the GUI."""
     webbrowser.open_new(r"user_manual.pdf")
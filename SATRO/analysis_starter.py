@@ -0,0 +1,8 @@
+import sys
+sys.path.append("Modules/")
+from UserInterface.UITools.batch_analysis import main
+
+
+if __name__ == '__main__':
+    # Runs with plain Python, CASA is not needed to analyse the FITS files.
+    sys.exit(main(sys.argv[1:]))
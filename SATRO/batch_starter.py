@@ -0,0 +1,9 @@
+import sys
+sys.path.append("Modules/")
+from Pipeline.batch import main, get_script_args
+
+
+if __name__ == '__main__':
+    # The CASA tasks are only defined when started with casa -c. Planning with --plan works without them.
+    tasks = dict((name, globals().get(name)) for name in ["simobserve", "simanalyze", "imhead", "exportfits"])
+    sys.exit(main(get_script_args(sys.argv, "batch_starter.py"), tasks))
@@ -0,0 +1,10 @@
+import sys
+sys.path.append("Modules/")
+from Pipeline.batch import get_script_args
+from Pipeline.benchmark import main
+
+
+if __name__ == '__main__':
+    # The CASA tasks are only defined when started with casa -c. Only the checks against CASA need them.
+    tasks = dict((name, globals().get(name)) for name in ["exportfits"])
+    sys.exit(main(get_script_args(sys.argv, "benchmark_starter.py"), tasks))